@@ -39,6 +39,12 @@ def show_traditional_status():
             if count > 0:
                 recent = data[-5:] if count > 5 else data
                 print(f"📝 最近处理的提交: {', '.join(map(str, recent))}")
+        elif isinstance(data, dict) and 'last_revision' in data:
+            pending = data.get('pending_revisions', [])
+            print(f"✅ 已处理至版本: r{data['last_revision']}")
+            print(f"⏳ 待处理/失败提交: {len(pending)}")
+            if pending:
+                print(f"📝 待处理的提交: {', '.join(map(str, pending[-5:]))}")
         elif isinstance(data, dict):
             count = len(data)
             print(f"✅ 已处理提交数量: {count}")
@@ -21,7 +21,12 @@ sys.path.insert(0, src_path)
 try:
     from config_manager import ConfigManager
     from ai_reviewer import AIReviewer
-    from svn_monitor import SVNCommit
+    from svn_monitor import COPY_TYPE_NAMES, SVNCommit, classify_copy_commit
+    from commit_planner import CommitPlan
+    from diff_cache import DiffCache, diff_cache_options, get_repository_root, get_repository_uuid
+    from diff_index import DiffIndex
+    from diff_reader import StreamingDiffReader, build_diff_commands, build_file_diff_commands, scope_diff_targets
+    from file_filter import FileFilter
     import xml.etree.ElementTree as ET
 except ImportError as e:
     print("=" * 60)
@@ -140,6 +145,9 @@ class SimpleBatchReviewer:
         self.config_manager = ConfigManager(config_path)
         self.config = self.config_manager.config
         self.ai_reviewer = AIReviewer()
+        self.diff_cache = DiffCache.from_config(self.config_manager)
+        self.diff_reader = StreamingDiffReader.from_config(self.config_manager)
+        self.file_filter = FileFilter.from_config(self.config_manager)
         
         # 创建报告目录 - 也需要相对于项目根目录
         parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -341,58 +349,95 @@ class SimpleBatchReviewer:
         if filters.get('exclude_message_patterns'):
             print(f"  排除消息: {filters['exclude_message_patterns']}")
     
-    def get_commit_diff(self, revision, monitor=None):
-        """获取提交的代码差异"""
+    def get_commit_diff(self, revision, monitor=None, changed_files=None, copy_commit=False):
+        """获取提交的代码差异
+
+        提供changed_files时只diff其中通过扩展名过滤的文件，被排除的文件不会被下载；
+        copy_commit 表示带修改的复制提交，按路径diff失败时逐个文件diff，不回退为完整diff
+        """
         if monitor:
             monitor.start_stage("获取代码差异")
         
         repository_url = self.config['svn']['repository_url']
         username = self.config['svn']['username']
         password = self.config['svn']['password']
-        
-        try:
-            if monitor:
-                monitor.log_details(f"执行SVN diff命令 (版本: {revision})")
-                
-            cmd = [
-                'svn', 'diff',
-                f'{repository_url}',
-                f'-c{revision}',
-                '--username', username,
-                '--password', password,
-                '--non-interactive',
-                '--trust-server-cert'
-            ]
-            
+        auth_args = [
+            '--username', username,
+            '--password', password,
+            '--non-interactive',
+            '--trust-server-cert'
+        ]
+        
+        targets = None
+        if self.config['svn'].get('scope_diff_to_paths', True) and changed_files is not None:
+            repo_root = get_repository_root(repository_url, username, password)
+            targets = scope_diff_targets(changed_files, repository_url, repo_root, self.file_filter)
+            if targets is not None and not targets:
+                if monitor:
+                    monitor.log_details("没有需要diff的文件，跳过下载")
+                    monitor.end_stage("获取代码差异", True)
+                return ""
+            if targets is not None and monitor:
+                monitor.log_details(f"只下载 {len(targets)}/{len(changed_files)} 个文件的差异")
+        
+        options = diff_cache_options(repository_url, self.diff_reader.cache_options(), targets)
+        repo_uuid = get_repository_uuid(repository_url, username, password)
+        cached = self.diff_cache.get(repo_uuid, revision, options)
+        if cached is not None:
             if monitor:
-                monitor.log_details("等待SVN服务器响应...")
-            
-            result = subprocess.run(cmd, capture_output=True, text=True,
-                                  encoding='utf-8', timeout=120)
+                monitor.log_details(f"命中diff缓存，{len(cached)} 字符")
+                monitor.end_stage("获取代码差异", True)
+            return cached
+        
+        if monitor:
+            monitor.log_details(f"执行SVN diff命令 (版本: {revision})")
             
-            if result.returncode == 0:
-                diff_size = len(result.stdout)
+        commands = [['svn'] + args + auth_args
+                    for args in build_diff_commands(repository_url, revision, targets,
+                                                    diff_options=self.diff_reader.diff_options)]
+        
+        if monitor:
+            monitor.log_details("等待SVN服务器响应...")
+        
+        per_file = copy_commit and targets is not None
+        if per_file:
+            # 复制提交的完整diff会下载整个复制的目录树，按路径diff失败时改为逐个文件diff
+            fallback_commands = [['svn'] + args + auth_args
+                                 for args in build_file_diff_commands(repository_url, revision, targets)]
+        elif targets is not None or self.diff_reader.diff_options:
+            # 按路径或带diff参数获取失败时回退为不带额外参数的完整diff
+            fallback_commands = [['svn'] + build_diff_commands(repository_url, revision)[0] + auth_args]
+        else:
+            fallback_commands = None
+        
+        # 流式读取，超大diff按预算截断
+        result = self.diff_reader.read_with_fallback(commands, fallback_commands)
+        
+        if result.fallback:
+            reader_options = self.diff_reader.cache_options(include_diff_options=False)
+            if per_file:
                 if monitor:
-                    monitor.log_details(f"获取到 {diff_size} 字符的差异内容")
-                    monitor.end_stage("获取代码差异", True)
-                return result.stdout
+                    monitor.log_details("按路径获取失败，已改为逐个文件diff", 2)
+                options = diff_cache_options(repository_url, reader_options + ['per_file'], targets)
             else:
-                error_msg = f"获取差异失败: {result.stderr}"
                 if monitor:
-                    monitor.log_details(f"SVN命令失败: {result.stderr}", 2)
-                    monitor.end_stage("获取代码差异", False)
-                return error_msg
-                
-        except subprocess.TimeoutExpired:
-            error_msg = "获取差异超时 (120秒)"
+                    monitor.log_details("按路径或带diff参数获取失败，已回退为完整diff", 2)
+                options = diff_cache_options(repository_url, reader_options)
+        
+        if result.success:
+            self.diff_cache.put(repo_uuid, revision, options, result.content)
+            diff_size = len(result.content)
             if monitor:
-                monitor.log_details("SVN命令执行超时", 2)
-                monitor.end_stage("获取代码差异", False)
-            return error_msg
-        except Exception as e:
-            error_msg = f"获取差异异常: {e}"
+                monitor.log_details(f"获取到 {diff_size} 字符的差异内容")
+                if result.truncated:
+                    monitor.log_details(f"diff超出预算已截断 (读取 {result.bytes_read:,} 字节，"
+                                        f"截断文件 {len(result.truncated_files)} 个)", 2)
+                monitor.end_stage("获取代码差异", True)
+            return result.content
+        else:
+            error_msg = f"获取差异失败: {result.error}"
             if monitor:
-                monitor.log_details(f"发生异常: {str(e)}", 2)
+                monitor.log_details(f"SVN命令失败: {result.error}", 2)
                 monitor.end_stage("获取代码差异", False)
             return error_msg
     
@@ -436,6 +481,11 @@ class SimpleBatchReviewer:
                                 'action': path.get('action', ''),
                                 'kind': path.get('kind', 'file')
                             }
+                            if path.get('text-mods'):
+                                file_info['text_mods'] = path.get('text-mods')
+                            if path.get('copyfrom-path'):
+                                file_info['copyfrom_path'] = path.get('copyfrom-path')
+                                file_info['copyfrom_rev'] = path.get('copyfrom-rev', '')
                             changed_files.append(file_info)
                 
                 if monitor:
@@ -469,17 +519,33 @@ class SimpleBatchReviewer:
             monitor.start_commit(i, revision)
             
             try:
-                # 阶段1: 获取代码差异
-                diff_content = self.get_commit_diff(revision, monitor)
+                # 阶段1: 获取文件变更信息和代码差异（只下载需要审查的文件）
+                changed_files = self.get_changed_files(revision, monitor)
+                
+                # 分支/标签创建和纯移动不下载diff，带修改的复制只下载真实修改
+                copy_info = classify_copy_commit(changed_files)
+                review_plan = None
+                if copy_info.is_pure_copy:
+                    copy_type = COPY_TYPE_NAMES[copy_info.commit_type]
+                    monitor.log_details(f"{copy_type}提交: {copy_info.description}，跳过diff")
+                    review_plan = CommitPlan(
+                        revision=revision,
+                        strategy='skip',
+                        file_count=len(changed_files),
+                        reason=f"{copy_type}提交（{copy_info.description}），不包含代码修改，已跳过AI审查"
+                    )
+                    diff_content = ""
+                else:
+                    if copy_info.commit_type == 'copy_with_edits':
+                        monitor.log_details(f"带修改的复制: 只审查 {len(copy_info.edit_files)} 个修改路径")
+                    diff_content = self.get_commit_diff(revision, monitor, copy_info.edit_files or None,
+                                                        copy_commit=copy_info.commit_type == 'copy_with_edits')
                 
                 # 阶段2: 准备审查数据
                 monitor.start_stage("准备审查数据")
                 monitor.log_details(f"作者: {commit['author']}")
                 monitor.log_details(f"提交信息: {commit['message'][:100]}{'...' if len(commit['message']) > 100 else ''}")
                 
-                # 获取详细的文件变更信息
-                changed_files = self.get_changed_files(revision, monitor)
-                
                 # 创建SVNCommit对象
                 commit_date = (datetime.fromisoformat(commit['date'].replace('Z', '+00:00')) 
                              if commit['date'] else datetime.now())
@@ -489,12 +555,14 @@ class SimpleBatchReviewer:
                     date=commit_date,
                     message=commit['message'],
                     changed_files=changed_files,  # 使用实际的文件变更信息
-                    diff_content=diff_content
+                    diff_content=diff_content,
+                    review_plan=review_plan
                 )
                 
                 # 统计差异信息
-                diff_lines = len(diff_content.split('\n')) if diff_content else 0
-                monitor.log_details(f"差异行数: {diff_lines}")
+                diff_index = DiffIndex.parse(diff_content)
+                monitor.log_details(f"差异行数: {diff_index.total_lines} "
+                                    f"(+{diff_index.added_lines}/-{diff_index.deleted_lines})")
                 monitor.log_details(f"变更文件: {len(changed_files)} 个")
                 monitor.end_stage("准备审查数据", True)
                 
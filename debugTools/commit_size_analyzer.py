@@ -18,6 +18,10 @@ src_path = os.path.join(parent_dir, 'src')
 sys.path.insert(0, src_path)
 
 from config_manager import ConfigManager
+from diff_cache import DiffCache, diff_cache_options, get_repository_uuid
+from diff_index import DiffIndex
+from diff_reader import StreamingDiffReader, build_diff_commands
+from commit_planner import estimate_tokens
 
 
 class CommitAnalyzer:
@@ -25,6 +29,9 @@ class CommitAnalyzer:
     
     def __init__(self):
         self.config = ConfigManager()
+        self.diff_cache = DiffCache.from_config(self.config)
+        # 与实际审查使用相同的diff参数和读取预算，统计结果才能反映发送给AI的内容
+        self.diff_reader = StreamingDiffReader.from_config(self.config)
         
     def analyze_commit_size(self, revision):
         """分析指定提交的大小和复杂度"""
@@ -77,7 +84,7 @@ class CommitAnalyzer:
             print(f"  ✅ 当前截断长度已足够")
         
         # Token估算
-        estimated_tokens = analysis['total_chars'] // 3  # 粗略估算
+        estimated_tokens = estimate_tokens(analysis['total_chars'])  # 粗略估算
         if estimated_tokens > 2000:
             suggested_max_tokens = min(estimated_tokens + 1000, 8000)
             print(f"  🎯 建议max_tokens: {suggested_max_tokens}")
@@ -87,34 +94,39 @@ class CommitAnalyzer:
         return analysis
     
     def _get_commit_diff(self, revision):
-        """获取提交的完整diff内容"""
-        import subprocess
-        
+        """获取提交的diff内容（超出预算时与实际审查一样截断）"""
         repository_url = self.config.config['svn']['repository_url']
         username = self.config.config['svn']['username'] 
         password = self.config.config['svn']['password']
         
-        try:
-            cmd = [
-                'svn', 'diff',
-                f'{repository_url}',
-                f'-c{revision}',
-                '--username', username,
-                '--password', password,
-                '--non-interactive',
-                '--trust-server-cert'
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True,
-                                  encoding='utf-8', timeout=180)
-            
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                return f"获取差异失败: {result.stderr}"
-                
-        except Exception as e:
-            return f"获取差异异常: {e}"
+        # 与监控和批量审查使用相同的缓存键，已下载过的diff直接复用
+        options = diff_cache_options(repository_url, self.diff_reader.cache_options())
+        repo_uuid = get_repository_uuid(repository_url, username, password)
+        cached = self.diff_cache.get(repo_uuid, revision, options)
+        if cached is not None:
+            return cached
+        
+        auth_args = [
+            '--username', username,
+            '--password', password,
+            '--non-interactive',
+            '--trust-server-cert'
+        ]
+        cmd = ['svn'] + build_diff_commands(
+            repository_url, revision, diff_options=self.diff_reader.diff_options)[0] + auth_args
+        # 带diff参数获取失败时（如svn版本过旧）回退为不带额外参数的完整diff
+        fallback_cmd = (['svn'] + build_diff_commands(repository_url, revision)[0] + auth_args
+                        if self.diff_reader.diff_options else None)
+        
+        result = self.diff_reader.read_with_fallback([cmd], [fallback_cmd] if fallback_cmd else None)
+        if not result.success:
+            return f"获取差异失败: {result.error}"
+        
+        if result.fallback:
+            options = diff_cache_options(repository_url,
+                                         self.diff_reader.cache_options(include_diff_options=False))
+        self.diff_cache.put(repo_uuid, revision, options, result.content)
+        return result.content
     
     def _get_changed_files(self, revision):
         """获取指定版本的变更文件列表"""
@@ -168,18 +180,12 @@ class CommitAnalyzer:
     
     def _analyze_diff_content(self, diff_content):
         """分析diff内容的统计信息"""
-        lines = diff_content.split('\n')
-        total_lines = len(lines)
+        index = DiffIndex.parse(diff_content)
+        total_lines = index.total_lines
         total_chars = len(diff_content)
         
-        added_lines = 0
-        deleted_lines = 0
-        
-        for line in lines:
-            if line.startswith('+') and not line.startswith('+++'):
-                added_lines += 1
-            elif line.startswith('-') and not line.startswith('---'):
-                deleted_lines += 1
+        added_lines = index.added_lines
+        deleted_lines = index.deleted_lines
         
         return {
             'total_chars': total_chars,
@@ -225,7 +231,7 @@ class CommitAnalyzer:
                 100000  # 最大限制
             )
         
-        estimated_max_tokens = total_analysis['max_chars'] // 3
+        estimated_max_tokens = estimate_tokens(total_analysis['max_chars'])
         if estimated_max_tokens > 2000:
             total_analysis['max_tokens_needed'] = min(
                 estimated_max_tokens + 2000,
@@ -178,12 +178,14 @@ class QuickDiagnostic:
         """修复processed_commits.json文件"""
         print("\n🗃️ 检查提交记录文件...")
         
+        # 高水位格式：last_revision 之前（含）的版本都已拉取过，待处理或失败的版本记录在 pending_revisions 中
+        empty_data = {"last_revision": None, "pending_revisions": []}
+        
         if not os.path.exists(self.processed_commits_path):
-            # 创建空的processed_commits.json
+            # 创建空的processed_commits.json，监控首次运行时从最近的提交开始
             try:
-                initial_data = {"processed_commits": []}
                 with open(self.processed_commits_path, 'w', encoding='utf-8') as f:
-                    json.dump(initial_data, f, indent=2)
+                    json.dump(empty_data, f, indent=2)
                 self.log_fix("已创建空的 processed_commits.json")
                 return True
             except Exception as e:
@@ -195,20 +197,24 @@ class QuickDiagnostic:
             with open(self.processed_commits_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             
-            # 统一格式为字典形式
-            if isinstance(data, list):
-                # 如果是列表，转换为字典格式
-                new_data = {"processed_commits": data}
-                with open(self.processed_commits_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_data, f, indent=2)
-                self.log_fix("已修复 processed_commits.json 格式")
-            elif isinstance(data, dict) and 'processed_commits' in data:
-                print("✅ processed_commits.json 格式正确")
+            if isinstance(data, dict) and 'last_revision' in data:
+                pending = data.get('pending_revisions', [])
+                if isinstance(pending, list):
+                    print(f"✅ processed_commits.json 格式正确 "
+                          f"(已处理至 r{data['last_revision']}，待处理 {len(pending)} 个)")
+                else:
+                    # 只修复待处理列表，保留高水位，避免重新从最近的提交开始而跳过积压的提交
+                    data['pending_revisions'] = []
+                    with open(self.processed_commits_path, 'w', encoding='utf-8') as f:
+                        json.dump(data, f, indent=2)
+                    self.log_fix("已修复 processed_commits.json 中的待处理列表")
+            elif isinstance(data, list) or (isinstance(data, dict) and 'processed_commits' in data):
+                # 旧格式由监控启动时迁移为高水位格式，这里不改写
+                print("✅ processed_commits.json 为旧格式，监控启动时会自动迁移")
             else:
                 # 格式不正确，重置
-                new_data = {"processed_commits": []}
                 with open(self.processed_commits_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_data, f, indent=2)
+                    json.dump(empty_data, f, indent=2)
                 self.log_fix("已重置 processed_commits.json")
             
             return True
@@ -216,9 +222,8 @@ class QuickDiagnostic:
         except json.JSONDecodeError:
             # JSON格式错误，重新创建
             try:
-                new_data = {"processed_commits": []}
                 with open(self.processed_commits_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_data, f, indent=2)
+                    json.dump(empty_data, f, indent=2)
                 self.log_fix("已修复损坏的 processed_commits.json")
                 return True
             except Exception as e:
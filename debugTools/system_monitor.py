@@ -133,6 +133,17 @@ class SystemMonitor:
             with open(self.processed_commits_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 
+            if isinstance(data, dict) and 'last_revision' in data:
+                # 高水位格式 {"last_revision": 123, "pending_revisions": [...]}
+                pending = data.get('pending_revisions', [])
+                return {
+                    'exists': True,
+                    'count': None,
+                    'last_commit': data['last_revision'],
+                    'pending': len(pending),
+                    'pending_revisions': pending[-5:]
+                }
+            
             if isinstance(data, list):
                 commits = data
             elif isinstance(data, dict) and 'processed_commits' in data:
@@ -255,9 +266,15 @@ class SystemMonitor:
         commit_stats = self.check_processed_commits()
         print(f"\n🗃️  提交记录:")
         if commit_stats['exists']:
-            print(f"   已处理提交数: {commit_stats['count']}")
-            if commit_stats['last_commit']:
-                print(f"   最后处理版本: {commit_stats['last_commit']}")
+            if 'pending' in commit_stats:
+                print(f"   已处理至版本: r{commit_stats['last_commit']}")
+                print(f"   待处理/失败提交: {commit_stats['pending']}")
+                if commit_stats['pending_revisions']:
+                    print(f"   待处理的提交: {', '.join(map(str, commit_stats['pending_revisions']))}")
+            else:
+                print(f"   已处理提交数: {commit_stats['count']}")
+                if commit_stats['last_commit']:
+                    print(f"   最后处理版本: {commit_stats['last_commit']}")
             if 'error' in commit_stats:
                 print(f"   ⚠️  读取错误: {commit_stats['error']}")
         else:
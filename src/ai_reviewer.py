@@ -4,12 +4,28 @@ AI代码审查模块
 """
 
 import requests
+import asyncio
 import json
 import logging
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from dataclasses import asdict, dataclass
+from datetime import datetime
 
 from config_manager import get_config
+from chunk_planner import ChunkPlanner
+from commit_planner import CHARS_PER_TOKEN, estimate_tokens
+from diff_index import DiffIndex, DiffPathLookup
+from diff_minimizer import NOTE_PREFIX, minimize_diff
+from file_filter import FileFilter
+from http_client import RETRY_STATUS_CODES, HttpRequestError, HttpTimeoutError, get_http_transport
+from rate_limiter import get_rate_limiter
+from review_cache import ReviewCache, diff_fingerprint
+from similarity_index import DiffSketch, SimilarCommit, SimilarityIndex, build_delta_diff
+from review_json import (CONTINUE_PROMPT, dataclass_json_schema, extract_json_object, join_continuation,
+                         needs_continuation, repair_truncated_json, validate_json)
+from stream_parser import StreamCollector
 from svn_monitor import SVNCommit
 
 
@@ -22,6 +38,54 @@ class ReviewResult:
     detailed_comments: List[Dict[str, str]]
     suggestions: List[str]
     risks: List[str]
+    reused_from: Optional[str] = None  # 复用的审查结果来自的版本（未调用AI）
+    reused_similarity: Optional[float] = None  # 复用近似重复提交的结果时的相似度，diff完全相同时为None
+    complete: bool = True  # 响应完整解析且覆盖所有分块；解析失败的回退结果、修复的截断JSON为False，不写入缓存
+
+
+# 不由模型输出、也不写入结果缓存的字段
+RESULT_META_FIELDS = ('commit_revision', 'reused_from', 'reused_similarity', 'complete')
+
+# 结构化输出（response_format）使用的审查结果schema，由 ReviewResult 的字段生成
+REVIEW_RESULT_SCHEMA = dataclass_json_schema(
+    ReviewResult,
+    exclude=RESULT_META_FIELDS,
+    descriptions={
+        'overall_score': '整体评分（1-10分）',
+        'summary': '整体评估摘要',
+        'detailed_comments': '具体问题的评论',
+        'suggestions': '改进建议',
+        'risks': '潜在风险'
+    },
+    object_fields={'detailed_comments': ('file', 'line', 'type', 'comment')},
+    item_descriptions={'detailed_comments': {
+        'file': '文件路径',
+        'line': '行号（不适用时为空字符串）',
+        'type': '评论类型',
+        'comment': '具体评论'
+    }}
+)
+REVIEW_RESULT_SCHEMA['properties']['overall_score'].update(minimum=1, maximum=10)
+REVIEW_RESULT_SCHEMA['properties']['detailed_comments']['items']['properties']['type']['enum'] = ['建议', '警告', '错误']
+
+
+@dataclass
+class ChatCompletion:
+    """一次chat completions请求的输出"""
+    content: str
+    finish_reason: Optional[str] = None  # length 表示输出达到 max_tokens 被截断
+
+
+@dataclass
+class ReviewPreparation:
+    """调用AI前的准备结果"""
+    commit: SVNCommit  # 文件过滤后的提交
+    plan: Optional[Any] = None  # 预检计划（CommitPlan）
+    result: Optional[ReviewResult] = None  # 无需调用AI时直接返回的结果
+    chunked: bool = False
+    fingerprint: Optional[str] = None  # 规范化diff哈希，审查完成后写入结果缓存
+    sketch: Optional[DiffSketch] = None  # 变更行MinHash特征，审查完成后写入相似提交索引
+    reference: Optional[SimilarCommit] = None  # 只审查差异部分时参考的相似提交
 
 
 class AIReviewer:
@@ -37,12 +101,43 @@ class AIReviewer:
         self.diff_limit = config.get('ai.diff_limit', 8000)  # diff内容截断长度
         self.enable_chunked_review = config.get('ai.enable_chunked_review', True)  # 启用分块审查
         self.chunk_size = config.get('ai.chunk_size', 15000)  # 分块大小
+        # 模型上下文窗口（token），配置后分块按 上下文 - max_tokens - 提示词开销 装箱
+        self.context_window_tokens = config.get('ai.context_window_tokens', 0)
+        # 分块并发审查：单个提交的并发块数，以及进程内全部AI请求的并发上限
+        self.max_concurrent_chunks = config.get('ai.max_concurrent_chunks', 4)
+        # 进程内共享的限流器：全局并发上限（ai.max_concurrent_requests）内按AIMD自适应，并遵守RPM/TPM配额
+        self.rate_limiter = get_rate_limiter(config)
+        self.rate_limit_retries = config.get('ai.rate_limit.max_retries', 5)
+        # 与钉钉共用的连接池化HTTP传输层
+        self.http = get_http_transport(config)
+        self.request_timeout = config.get('ai.request_timeout', 60)  # 读取超时（秒）
+        # 流式响应：边生成边接收，超时按两次收到数据的间隔计算，不再限制总耗时
+        self.stream = config.get('ai.stream', False)
+        self.stream_idle_timeout = config.get('ai.stream_idle_timeout', 30)
+        # 流式响应默认不返回用量，通过 stream_options.include_usage 请求；接口不支持时自动关闭
+        self.stream_usage = self.stream
+        # 输出达到 max_tokens 被截断时的续写次数
+        self.max_continuations = config.get('ai.max_continuations', 2)
+        # 发送前去掉只有空白变化、只调整顺序和整块移动的变更
+        self.diff_minimize = config.get('ai.diff_minimize.enabled', True)
+        self.min_moved_lines = config.get('ai.diff_minimize.min_moved_lines', 3)
+        # 结构化输出：通过 response_format 约束JSON结构，提示词中不再附带格式示例；接口不支持时自动关闭
+        self.structured_output = config.get('ai.structured_output', False)
+        # asyncio流水线使用的异步传输层，由 attach_async_transport 绑定
+        self.async_http = None
+        
+        # 按规范化diff哈希缓存审查结果，模型或提示词变化后自动失效
+        self.review_cache = ReviewCache.from_config(config)
+        # 分块审查时按文件diff哈希保存评论，大型合并提交只为新增的变更付费
+        self.file_review_cache = ReviewCache.from_config(config, namespace='file_reviews')
+        # 已审查提交的MinHash索引，用于近似重复提交只审查差异部分
+        self.similarity_index = SimilarityIndex.from_config(config)
+        self.review_cache_version = self._make_review_cache_version()
         
         # 文件过滤配置
         file_filters = config.get('batch_review.file_filters', {})
-        self.enable_file_filtering = file_filters.get('enable_file_filtering', True)
-        self.exclude_extensions = [ext.lower() for ext in file_filters.get('exclude_extensions', [])]
-        self.include_extensions = [ext.lower() for ext in file_filters.get('include_extensions', [])]
+        self.file_filter = FileFilter.from_config(config)
+        self.enable_file_filtering = self.file_filter.enabled
         self.show_filter_stats = file_filters.get('show_filter_stats', True)
         
         self.logger = logging.getLogger(__name__)
@@ -61,25 +156,11 @@ class AIReviewer:
             if not file_path:
                 continue
                 
-            # 获取文件扩展名
-            import os
-            _, ext = os.path.splitext(file_path)
-            ext = ext.lower()
-            
-            # 判断是否应该排除
-            should_exclude = False
-            
-            # 检查排除列表
-            if ext in self.exclude_extensions:
-                should_exclude = True
-                excluded_files.append({'path': file_path, 'reason': f'排除扩展名: {ext}'})
-            
-            # 检查包含列表（如果指定了包含列表）
-            elif self.include_extensions and ext not in self.include_extensions:
-                should_exclude = True
-                excluded_files.append({'path': file_path, 'reason': f'不在包含列表: {ext}'})
-            
-            if not should_exclude:
+            # 按扩展名判断是否应该排除
+            reason = self.file_filter.get_exclude_reason(file_path)
+            if reason:
+                excluded_files.append({'path': file_path, 'reason': reason})
+            else:
                 filtered_files.append(file_info)
         
         # 生成过滤统计
@@ -106,110 +187,54 @@ class AIReviewer:
         if not filtered_files:
             return ""
         
-        # 获取过滤后的文件路径集合
-        filtered_paths = set()
-        for file_info in filtered_files:
-            path = file_info.get('path', '')
-            if path:
-                # 处理各种路径格式
-                filtered_paths.add(path)
-                if path.startswith('/'):
-                    filtered_paths.add(path[1:])
-                else:
-                    filtered_paths.add('/' + path)
-        
-        # 分割diff内容按文件
-        lines = diff_content.split('\n')
-        filtered_lines = []
-        current_file_included = False
-        current_file_path = None
-        in_file_content = False
-        
-        for line in lines:
-            # 检测文件分界线
-            if line.startswith('Index: '):
-                current_file_path = line.replace('Index: ', '').strip()
-                # 检查这个文件是否在过滤后的列表中
-                current_file_included = any(
-                    current_file_path in filtered_paths or
-                    current_file_path.endswith(path.lstrip('/')) or
-                    path.lstrip('/').endswith(current_file_path) or
-                    current_file_path == path.lstrip('/')
-                    for path in [f.get('path', '') for f in filtered_files]
-                )
-                in_file_content = True
-                if current_file_included:
-                    filtered_lines.append(line)
-            elif line.startswith('==='):
-                # 分隔线
-                if current_file_included:
-                    filtered_lines.append(line)
-            elif line.startswith('---') or line.startswith('+++'):
-                # 文件头信息
-                if current_file_included:
-                    filtered_lines.append(line)
-            elif line.startswith('@@'):
-                # 差异块头
-                if current_file_included:
-                    filtered_lines.append(line)
-            else:
-                # 文件内容行
-                if current_file_included and in_file_content:
-                    filtered_lines.append(line)
+        # 路径统一规范化后建立查找表，每个文件只需常数次查询
+        lookup = DiffPathLookup(filtered_files)
         
-        return '\n'.join(filtered_lines)
+        # 按索引逐文件判断，保留文件的diff直接按偏移切片
+        index = DiffIndex.parse(diff_content)
+        filtered_parts = [index.file_text(entry) for entry in index.files
+                          if entry.path in lookup]
+        
+        return ''.join(filtered_parts)
     
     def review_commit(self, commit: SVNCommit, monitor=None) -> Optional[ReviewResult]:
         """对提交进行AI代码审查"""
         try:
-            if monitor:
-                monitor.log_details("构建审查提示...", 2)
+            prepared = self._prepare_review(commit, monitor)
+            if prepared.result is not None:
+                return prepared.result
             
-            # 应用文件过滤
-            if self.enable_file_filtering and commit.changed_files:
-                filtered_files, filter_stats = self.filter_files_for_review(
-                    commit.changed_files, monitor)
-                
-                # 如果所有文件都被过滤掉了，跳过审查
-                if not filtered_files:
-                    if monitor:
-                        monitor.log_details("所有文件都被过滤，跳过审查", 2)
-                    return ReviewResult(
-                        commit_revision=commit.revision,
-                        overall_score=8,  # 默认分数
-                        summary=f"提交包含 {filter_stats['original_count']} 个文件，"
-                               f"全部为非代码文件(图片、视频等)，已自动跳过审查",
-                        detailed_comments=[],
-                        suggestions=[],
-                        risks=[]
-                    )
+            if prepared.chunked:
+                result = self._review_commit_chunked(prepared.commit, monitor)
+            else:
+                result = self._review_commit_standard(prepared.commit, monitor,
+                                                      reference=prepared.reference)
+            return self._finish_review(prepared, result)
                 
-                # 更新commit对象的文件列表
-                filtered_commit = SVNCommit(
-                    revision=commit.revision,
-                    author=commit.author,
-                    date=commit.date,
-                    message=commit.message,
-                    changed_files=filtered_files,
-                    diff_content=self._filter_diff_content(commit.diff_content, filtered_files)
-                )
-                commit = filtered_commit
-            
-            # 检查diff内容大小
-            diff_size = len(commit.diff_content)
+        except Exception as e:
+            self.logger.error(f"代码审查失败 (提交 {commit.revision}): {e}")
             if monitor:
-                monitor.log_details(f"过滤后diff大小: {diff_size:,} 字符", 2)
+                monitor.log_details(f"审查异常: {str(e)}", 2)
+        
+        return None
+    
+    async def review_commit_async(self, commit: SVNCommit, monitor=None) -> Optional[ReviewResult]:
+        """review_commit 的asyncio版本，需先通过 attach_async_transport 绑定异步传输层
+
+        diff指纹、MinHash签名和缓存/索引读写在线程中执行，大型diff不会阻塞事件循环上的其他请求。
+        """
+        try:
+            prepared = await asyncio.to_thread(self._prepare_review, commit, monitor)
+            if prepared.result is not None:
+                return prepared.result
             
-            # 根据大小决定审查策略
-            if self.enable_chunked_review and diff_size > self.chunk_size:
-                if monitor:
-                    monitor.log_details("启用分块审查模式", 2)
-                return self._review_commit_chunked(commit, monitor)
+            if prepared.chunked:
+                result = await self._review_commit_chunked_async(prepared.commit, monitor)
             else:
-                if monitor:
-                    monitor.log_details("使用标准审查模式", 2)
-                return self._review_commit_standard(commit, monitor)
-                
+                result = await self._review_commit_standard_async(prepared.commit, monitor,
+                                                                  reference=prepared.reference)
+            return await asyncio.to_thread(self._finish_review, prepared, result)
+        
         except Exception as e:
             self.logger.error(f"代码审查失败 (提交 {commit.revision}): {e}")
             if monitor:
@@ -217,10 +242,180 @@ class AIReviewer:
         
         return None
     
-    def _review_commit_standard(self, commit: SVNCommit, monitor=None) -> Optional[ReviewResult]:
+    def attach_async_transport(self, http):
+        """绑定异步HTTP传输层（在事件循环内调用）"""
+        self.async_http = http
+    
+    def _prepare_review(self, commit: SVNCommit, monitor=None) -> ReviewPreparation:
+        """应用预检计划和文件过滤，确定审查方式；无需调用AI时直接给出结果"""
+        if monitor:
+            monitor.log_details("构建审查提示...", 2)
+        
+        # 预检计划判定为跳过的提交不再调用AI
+        plan = commit.review_plan
+        if plan is not None:
+            if monitor:
+                monitor.log_details(f"预检计划: {plan.strategy}，{plan.file_count} 个文件，"
+                                    f"预估 {plan.estimated_chars:,} 字符 / "
+                                    f"{plan.estimated_chunks} 块", 2)
+            if plan.strategy == 'skip':
+                return ReviewPreparation(commit=commit, plan=plan, result=ReviewResult(
+                    commit_revision=commit.revision,
+                    overall_score=8,  # 默认分数
+                    summary=plan.reason,
+                    detailed_comments=[],
+                    suggestions=[],
+                    risks=[]
+                ))
+        
+        # 应用文件过滤
+        if self.enable_file_filtering and commit.changed_files:
+            filtered_files, filter_stats = self.filter_files_for_review(
+                commit.changed_files, monitor)
+            
+            # 如果所有文件都被过滤掉了，跳过审查
+            if not filtered_files:
+                if monitor:
+                    monitor.log_details("所有文件都被过滤，跳过审查", 2)
+                return ReviewPreparation(commit=commit, plan=plan, result=ReviewResult(
+                    commit_revision=commit.revision,
+                    overall_score=8,  # 默认分数
+                    summary=f"提交包含 {filter_stats['original_count']} 个文件，"
+                           f"全部为非代码文件(图片、视频等)，已自动跳过审查",
+                    detailed_comments=[],
+                    suggestions=[],
+                    risks=[]
+                ))
+            
+            # 更新commit对象的文件列表
+            commit = SVNCommit(
+                revision=commit.revision,
+                author=commit.author,
+                date=commit.date,
+                message=commit.message,
+                changed_files=filtered_files,
+                diff_content=self._filter_diff_content(commit.diff_content, filtered_files),
+                review_plan=commit.review_plan
+            )
+        
+        # 检查diff内容大小
+        diff_size = len(commit.diff_content)
+        if monitor:
+            monitor.log_details(f"过滤后diff大小: {diff_size:,} 字符", 2)
+        
+        # 相同补丁（合并到其他分支、cherry-pick、重新应用的回退）直接复用已有审查结果
+        index = DiffIndex.parse(commit.diff_content)
+        fingerprint = diff_fingerprint(commit.diff_content, index) if self.review_cache.enabled else None
+        cached = self.review_cache.get(fingerprint, self.review_cache_version)
+        if cached is not None:
+            result = self._result_from_cache(commit.revision, cached)
+            if result is not None:
+                self.logger.info(f"提交 {commit.revision} 的diff与版本 {cached.get('revision')} 相同，"
+                                 f"复用审查结果")
+                if monitor:
+                    monitor.log_details(f"审查结果缓存命中 (版本 {cached.get('revision')})，跳过AI调用", 2)
+                return ReviewPreparation(commit=commit, plan=plan, result=result)
+        
+        # 与已审查提交高度相似时（多一行的同一修复、解决冲突后的合并），只审查相对该提交的差异
+        sketch = self.similarity_index.sketch(index)
+        similar = self.similarity_index.find_similar(sketch, self.review_cache_version, commit.revision)
+        if similar is not None:
+            prepared = self._prepare_delta_review(commit, plan, index, sketch, similar, monitor)
+            if prepared is not None:
+                prepared.fingerprint = fingerprint
+                return prepared
+        
+        # 根据预检计划和实际大小决定审查策略
+        planned_chunked = plan is not None and plan.strategy in ('chunked', 'sample')
+        chunked = self.enable_chunked_review and (planned_chunked or diff_size > self.chunk_size)
+        if monitor:
+            monitor.log_details("启用分块审查模式" if chunked else "使用标准审查模式", 2)
+        return ReviewPreparation(commit=commit, plan=plan, chunked=chunked,
+                                 fingerprint=fingerprint, sketch=sketch)
+    
+    def _prepare_delta_review(self, commit: SVNCommit, plan, index: DiffIndex, sketch,
+                              similar: SimilarCommit, monitor=None) -> Optional[ReviewPreparation]:
+        """构建只包含相对相似提交新增差异块的审查；差异太大不值得走捷径时返回None"""
+        delta = build_delta_diff(index, sketch, similar.hashes)
+        self.logger.info(f"提交 {commit.revision} 与已审查的版本 {similar.revision} "
+                         f"相似度 {similar.similarity:.0%}，差异部分 {len(delta):,}/"
+                         f"{len(commit.diff_content):,} 字符")
+        
+        if not delta:
+            # 变更行全部包含在相似提交中
+            result = self._result_from_cache(commit.revision, {'revision': similar.revision,
+                                                               'result': similar.result})
+            if result is not None:
+                result.reused_similarity = similar.similarity
+            if result is not None and monitor:
+                monitor.log_details(f"变更已全部包含在版本 {similar.revision} 中，复用其审查结果", 2)
+            return ReviewPreparation(commit=commit, plan=plan, result=result) if result else None
+        
+        if self.enable_chunked_review and len(delta) > self.chunk_size:
+            return None
+        
+        if monitor:
+            monitor.log_details(f"与版本 {similar.revision} 相似度 {similar.similarity:.0%}，"
+                                f"只审查差异部分 ({len(delta):,} 字符)", 2)
+        delta_commit = SVNCommit(
+            revision=commit.revision,
+            author=commit.author,
+            date=commit.date,
+            message=commit.message,
+            changed_files=commit.changed_files,
+            diff_content=delta,
+            review_plan=commit.review_plan
+        )
+        return ReviewPreparation(commit=delta_commit, plan=plan, sketch=sketch, reference=similar)
+    
+    def _finish_review(self, prepared: ReviewPreparation,
+                       result: Optional[ReviewResult]) -> Optional[ReviewResult]:
+        """审查结束后的统一处理"""
+        plan = prepared.plan
+        # 抽样审查时在总结中注明
+        if result and plan is not None and plan.strategy == 'sample':
+            result.summary = f"⚠️ {plan.reason}\n{result.summary}"
+        if result and not result.complete:
+            # 降级的结果不复用，相同diff的提交下次重新审查
+            self.logger.info(f"提交 {result.commit_revision} 的审查结果不完整，不写入结果缓存")
+        elif result and (prepared.fingerprint or prepared.sketch):
+            fields = asdict(result)
+            for name in RESULT_META_FIELDS:
+                del fields[name]
+            self.review_cache.put(prepared.fingerprint, self.review_cache_version,
+                                  result.commit_revision, fields)
+            self.similarity_index.add(prepared.sketch, self.review_cache_version,
+                                      result.commit_revision, fields)
+        return result
+    
+    def _result_from_cache(self, revision: str, cached: Dict[str, Any]) -> Optional[ReviewResult]:
+        """由缓存条目构建当前版本的审查结果，条目格式不符时返回None"""
+        try:
+            result = ReviewResult(commit_revision=revision, **cached['result'])
+        except (KeyError, TypeError) as e:
+            self.logger.warning(f"审查结果缓存条目无效: {e}")
+            return None
+        source_revision = str(cached.get('revision', ''))
+        if source_revision and source_revision != str(revision):
+            result.reused_from = source_revision
+        return result
+    
+    def _make_review_cache_version(self) -> str:
+        """审查结果缓存版本，模型、提示词模板或系统提示词变化后旧结果失效"""
+        return ReviewCache.make_version(self.model, self._prompt_template(), self.system_prompt)
+    
+    def _prompt_template(self) -> str:
+        """用占位提交生成的审查提示词，作为结果缓存版本的一部分，提示词模板修改后旧结果失效"""
+        placeholder = SVNCommit(revision='', author='', date=datetime(2000, 1, 1),
+                                message='', changed_files=[], diff_content='')
+        return self._review_instructions() + self._build_review_prompt(placeholder)
+    
+    def _review_commit_standard(self, commit: SVNCommit, monitor=None,
+                                diff_limit: int = None,
+                                reference: SimilarCommit = None) -> Optional[ReviewResult]:
         """标准审查模式（单次处理）"""
         # 构建审查提示
-        review_prompt = self._build_review_prompt(commit, self.diff_limit)
+        review_prompt = self._build_review_prompt(commit, diff_limit or self.diff_limit, reference, monitor)
         
         if monitor:
             prompt_length = len(review_prompt)
@@ -229,7 +424,24 @@ class AIReviewer:
         
         # 调用AI API
         response = self._call_ai_api(review_prompt, monitor)
+        return self._handle_review_response(commit, response, monitor)
+    
+    async def _review_commit_standard_async(self, commit: SVNCommit, monitor=None,
+                                            diff_limit: int = None,
+                                            reference: SimilarCommit = None) -> Optional[ReviewResult]:
+        """_review_commit_standard 的asyncio版本"""
+        review_prompt = self._build_review_prompt(commit, diff_limit or self.diff_limit, reference, monitor)
+        
+        if monitor:
+            monitor.log_details(f"提示长度: {len(review_prompt):,} 字符", 2)
+            monitor.log_details("调用AI API...", 2)
         
+        response = await self._call_ai_api_async(review_prompt, monitor)
+        return self._handle_review_response(commit, response, monitor)
+    
+    def _handle_review_response(self, commit: SVNCommit, response: Optional[str],
+                                monitor=None) -> Optional[ReviewResult]:
+        """解析AI响应"""
         if response:
             if monitor:
                 monitor.log_details("解析AI响应...", 2)
@@ -247,43 +459,179 @@ class AIReviewer:
     
     def _review_commit_chunked(self, commit: SVNCommit, monitor=None) -> Optional[ReviewResult]:
         """分块审查模式（适用于大型提交）"""
+        chunks, chunk_commits, chunk_diff_limit = self._prepare_chunks(commit, monitor)
+        # 全部文件diff都已审查过的块直接复用评论
+        results = self._reuse_reviewed_chunks(commit, chunks, monitor)
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        def review_chunk(i: int) -> Optional[ReviewResult]:
+            if monitor:
+                monitor.log_details(f"审查第 {i + 1}/{len(chunks)} 块...", 3)
+            result = self._review_commit_standard(chunk_commits[i], monitor, chunk_diff_limit)
+            if result and result.complete:
+                self._remember_chunk_review(chunks[i], result)
+            return result
+        
+        # 各块并发审查，结果按块顺序合并
+        workers = max(1, min(self.max_concurrent_chunks, len(pending)))
+        if workers == 1:
+            for i in pending:
+                results[i] = review_chunk(i)
+        else:
+            with ThreadPoolExecutor(max_workers=workers,
+                                    thread_name_prefix=f"review-r{commit.revision}") as executor:
+                futures = [(i, executor.submit(review_chunk, i)) for i in pending]
+                for i, future in futures:
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"分块审查失败 (提交 {commit.revision}): {e}")
+        
+        return self._merge_chunk_reviews(commit, results, monitor)
+    
+    async def _review_commit_chunked_async(self, commit: SVNCommit,
+                                           monitor=None) -> Optional[ReviewResult]:
+        """_review_commit_chunked 的asyncio版本，块并发数同样受 max_concurrent_chunks 限制"""
+        chunks, chunk_commits, chunk_diff_limit = await asyncio.to_thread(
+            self._prepare_chunks, commit, monitor)
+        results = await asyncio.to_thread(self._reuse_reviewed_chunks, commit, chunks, monitor)
+        pending = [i for i, result in enumerate(results) if result is None]
+        chunk_semaphore = asyncio.Semaphore(max(1, self.max_concurrent_chunks))
+        
+        async def review_chunk(i: int) -> Optional[ReviewResult]:
+            async with chunk_semaphore:
+                if monitor:
+                    monitor.log_details(f"审查第 {i + 1}/{len(chunks)} 块...", 3)
+                result = await self._review_commit_standard_async(chunk_commits[i], monitor,
+                                                                  chunk_diff_limit)
+            if result and result.complete:
+                await asyncio.to_thread(self._remember_chunk_review, chunks[i], result)
+            return result
+        
+        reviewed = await asyncio.gather(*(review_chunk(i) for i in pending),
+                                        return_exceptions=True)
+        for i, result in zip(pending, reviewed):
+            if isinstance(result, Exception):
+                self.logger.error(f"分块审查失败 (提交 {commit.revision}): {result}")
+            else:
+                results[i] = result
+        
+        return self._merge_chunk_reviews(commit, results, monitor)
+    
+    def _prepare_chunks(self, commit: SVNCommit, monitor=None) -> tuple:
+        """按token预算分块，返回 (分块信息, 每块的提交对象, 每块的diff截断长度)"""
         if monitor:
             monitor.log_details("开始分块审查...", 2)
         
-        # 分析文件变更，按文件分块
-        chunks = self._split_diff_by_files(commit.diff_content, commit.changed_files)
+        # 按token预算把文件装箱分块
+        chunk_tokens = self._get_chunk_token_budget(commit)
+        chunks = self._split_diff_by_files(commit.diff_content, commit.changed_files, chunk_tokens)
+        # 块已按预算装箱，审查时不再按diff_limit截断
+        chunk_diff_limit = max(self.diff_limit, chunk_tokens * CHARS_PER_TOKEN)
         
         if monitor:
-            monitor.log_details(f"分为 {len(chunks)} 个块进行审查", 2)
+            monitor.log_details(f"分为 {len(chunks)} 个块进行审查 "
+                                f"(每块预算 {chunk_tokens:,} tokens)", 2)
         
-        chunk_results = []
-        for i, chunk in enumerate(chunks, 1):
-            if monitor:
-                monitor.log_details(f"审查第 {i}/{len(chunks)} 块...", 3)
-            
-            # 创建临时commit对象用于审查
-            temp_commit = SVNCommit(
-                revision=commit.revision,
-                author=commit.author,
-                date=commit.date,
-                message=commit.message,
-                changed_files=chunk['files'],
-                diff_content=chunk['diff']
-            )
+        # 创建临时commit对象用于审查
+        chunk_commits = [SVNCommit(
+            revision=commit.revision,
+            author=commit.author,
+            date=commit.date,
+            message=commit.message,
+            changed_files=chunk['files'],
+            diff_content=chunk['diff']
+        ) for chunk in chunks]
+        return chunks, chunk_commits, chunk_diff_limit
+    
+    def _reuse_reviewed_chunks(self, commit: SVNCommit, chunks: List[Dict],
+                               monitor=None) -> List[Optional[ReviewResult]]:
+        """查找每块中各文件diff的已有评论，全部命中的块构建复用结果，其余为None"""
+        results: List[Optional[ReviewResult]] = [None] * len(chunks)
+        if not self.file_review_cache.enabled:
+            return results
+        
+        for i, chunk in enumerate(chunks):
+            # 只有 svn:mergeinfo 等无可审查内容的片段没有哈希，不影响复用
+            pieces = [piece for piece in chunk.get('pieces', []) if piece['digest']]
+            if not pieces:
+                continue
             
-            # 审查当前块
-            chunk_result = self._review_commit_standard(temp_commit, monitor)
-            if chunk_result:
-                chunk_results.append(chunk_result)
+            entries = []
+            for piece in pieces:
+                entry = self.file_review_cache.get(piece['digest'], self.review_cache_version)
+                if entry is None:
+                    break
+                entries.append((piece, entry))
+            else:
+                comments = []
+                for piece, entry in entries:
+                    for comment in entry['result'].get('comments', []):
+                        # 评论归属到当前提交中的文件路径
+                        comments.append(dict(comment, file=piece['path']))
+                sources = sorted({str(entry.get('revision', '')) for _, entry in entries} - {''}, key=str)
+                results[i] = ReviewResult(
+                    commit_revision=commit.revision,
+                    overall_score=min(entry['result'].get('score', 8) for _, entry in entries),
+                    summary=f"{len({piece['path'] for piece in pieces})} 个文件的变更已在版本 {', '.join(sources)} 中审查过，复用其评论",
+                    detailed_comments=comments,
+                    suggestions=[],
+                    risks=[]
+                )
+        
+        reused = sum(1 for result in results if result is not None)
+        if reused:
+            self.logger.info(f"提交 {commit.revision}: {reused}/{len(chunks)} 块的文件变更已审查过，跳过AI调用")
+            if monitor:
+                monitor.log_details(f"{reused}/{len(chunks)} 块复用已有的文件评论", 2)
+        return results
+    
+    def _remember_chunk_review(self, chunk: Dict, result: ReviewResult):
+        """按文件保存块审查结果中的评论，没有评论的文件也记录（表示已审查且无问题）
+
+        只应传入完整解析的结果：解析失败的结果没有评论，记录下来会把块中文件当作无问题。
+        """
+        pieces = [piece for piece in chunk.get('pieces', []) if piece['digest']]
+        if not pieces or not self.file_review_cache.enabled:
+            return
         
-        # 合并分块结果
-        if chunk_results:
-            return self._merge_chunk_results(commit.revision, chunk_results, monitor)
+        lookup = DiffPathLookup([{'path': piece['path']} for piece in pieces])
+        comments_by_path: Dict[str, List[Dict]] = {piece['path']: [] for piece in pieces}
+        for comment in result.detailed_comments:
+            file_info = lookup.find(str(comment.get('file', '')))
+            if file_info is None and len(comments_by_path) == 1:
+                # 块中只有一个文件时，未写明文件的评论也属于它
+                file_info = {'path': pieces[0]['path']}
+            if file_info is not None:
+                comments_by_path[file_info['path']].append(comment)
         
-        return None
+        stored_paths = set()
+        for piece in pieces:
+            # 同一文件拆成多片时评论只记在第一片，避免复用时重复
+            comments = [] if piece['path'] in stored_paths else comments_by_path[piece['path']]
+            stored_paths.add(piece['path'])
+            self.file_review_cache.put(piece['digest'], self.review_cache_version,
+                                       result.commit_revision,
+                                       {'comments': comments, 'score': result.overall_score})
     
-    def _build_review_prompt(self, commit: SVNCommit, diff_limit: int = None) -> str:
-        """构建代码审查提示"""
+    def _merge_chunk_reviews(self, commit: SVNCommit, results: List[Optional[ReviewResult]],
+                             monitor=None) -> Optional[ReviewResult]:
+        """按块顺序合并分块结果；有块审查失败或结果不完整时，合并结果标记为不完整"""
+        chunk_results = [result for result in results if result]
+        if not chunk_results:
+            return None
+        
+        merged = self._merge_chunk_results(commit.revision, chunk_results, monitor)
+        merged.complete = (len(chunk_results) == len(results)
+                           and all(result.complete for result in chunk_results))
+        if len(chunk_results) < len(results):
+            self.logger.warning(f"提交 {commit.revision}: {len(results) - len(chunk_results)}/"
+                                f"{len(results)} 块审查失败，合并其余块的结果")
+        return merged
+    
+    def _build_review_prompt(self, commit: SVNCommit, diff_limit: int = None,
+                             reference: SimilarCommit = None, monitor=None) -> str:
+        """构建代码审查提示，reference为只审查差异部分时参考的相似提交"""
         if diff_limit is None:
             diff_limit = self.diff_limit
             
@@ -309,8 +657,10 @@ class AIReviewer:
                 f"- {action_desc}: {file_info['path']}"
             )
         
+        # 去掉空白、顺序和移动造成的噪音后再检查大小
+        diff_content, minimized_note = self._minimize_diff(commit.diff_content, monitor)
+        
         # 检查diff内容大小并适当截断
-        diff_content = commit.diff_content
         original_size = len(diff_content)
         
         if original_size > diff_limit:
@@ -322,15 +672,58 @@ class AIReviewer:
         else:
             truncated_note = ""
         
+        if reference is not None:
+            prompt_parts.extend([
+                "",
+                "## 相似提交的审查结果",
+                f"本提交与已审查的版本 {reference.revision} 变更内容相似度约 {reference.similarity:.0%}，"
+                f"下面只列出包含不同变更的差异块。版本 {reference.revision} 的审查结果如下，"
+                f"请结合它给出本提交的完整审查结果（仍然适用的评论请保留）：",
+                "```json",
+                json.dumps(reference.result, ensure_ascii=False, indent=2),
+                "```",
+            ])
+        
         prompt_parts.extend([
             "",
-            "## 代码变更详情",
+            "## 代码变更详情" if reference is None
+            else f"## 代码变更详情（仅与版本 {reference.revision} 不同的部分）",
             "```diff",
             diff_content,
             "```",
-            truncated_note,
-            "",
-            "请对以上代码变更进行详细审查，并按以下JSON格式返回结果：",
+            minimized_note + truncated_note
+        ])
+        
+        return "\n".join(prompt_parts)
+    
+    def _minimize_diff(self, diff_content: str, monitor=None) -> tuple:
+        """精简diff，返回 (精简后的diff, 提示词中的说明)"""
+        if not self.diff_minimize or not diff_content:
+            return diff_content, ""
+        minimized, stats = minimize_diff(diff_content, self.min_moved_lines)
+        if not stats.changed:
+            return diff_content, ""
+        
+        if monitor:
+            monitor.log_details(f"diff精简: 节省 {stats.saved_chars:,} 字符 "
+                                f"({stats.original_size:,} -> {stats.minimized_size:,})，"
+                                f"仅空白 {stats.whitespace_hunks} 块，仅调整顺序 {stats.reordered_hunks} 块，"
+                                f"移动 {stats.moved_blocks} 处共 {stats.moved_lines} 行", 2)
+        note = (f"\n注：以 `{NOTE_PREFIX.strip()}` 开头的行是本地预处理的说明，"
+                f"对应的只有空白变化、只调整顺序或内容未变的移动代码已省略。")
+        return minimized, note
+    
+    def _review_instructions(self) -> str:
+        """审查要求和输出格式，放在用户消息开头
+
+        与系统提示词一起构成每次请求逐字节相同的前缀，版本、作者等随提交变化的内容都在其后，
+        支持前缀缓存的接口可以复用这部分的计算。结构化输出模式下格式由 response_format 约束，不再附带JSON示例。
+        """
+        if self.structured_output:
+            return "## 审查要求\n请对下面提交中的代码变更进行详细审查，按约定的JSON结构返回结果。\n\n"
+        return "\n".join([
+            "## 审查要求",
+            "请对下面提交中的代码变更进行详细审查，并按以下JSON格式返回结果：",
             "```json",
             "{",
             '  "overall_score": 8,',
@@ -352,86 +745,74 @@ class AIReviewer:
             '    "潜在风险2"',
             '  ]',
             "}",
-            "```"
+            "```",
+            "",
+            ""
         ])
-        
-        return "\n".join(prompt_parts)
     
     def _smart_truncate_diff(self, diff_content: str, limit: int) -> str:
         """智能截断diff内容，保留关键信息"""
         if len(diff_content) <= limit:
             return diff_content
         
-        lines = diff_content.split('\n')
-        important_lines = []
+        index = DiffIndex.parse(diff_content)
+        if not index.files:
+            cut = diff_content.rfind('\n', 0, limit)
+            return diff_content[:cut + 1 if cut > 0 else limit] + "... (内容已截断) ..."
+        
+        parts = []
         current_size = 0
         
-        # 优先保留文件头和重要变更
-        for line in lines:
-            line_size = len(line) + 1  # +1 for newline
-            
-            # 保留文件头信息（以---、+++、@@开头的行）
-            if (line.startswith('---') or line.startswith('+++') or 
-                line.startswith('@@') or line.startswith('Index:')):
-                important_lines.append(line)
-                current_size += line_size
-                continue
+        # 优先保留文件头，差异块按完整块保留，最后一个放不下的块按行截断
+        for entry in index.files:
+            header = index.header_text(entry)
+            parts.append(header)
+            current_size += len(header)
             
-            # 检查是否还有空间
-            if current_size + line_size > limit:
+            for hunk in entry.hunks:
+                hunk_size = hunk.end - hunk.start
+                if current_size + hunk_size <= limit:
+                    parts.append(index.hunk_text(hunk))
+                    current_size += hunk_size
+                    continue
+                
+                # 检查是否还有空间
+                cut = diff_content.rfind('\n', hunk.start, hunk.start + max(0, limit - current_size))
+                if cut > hunk.start:
+                    parts.append(index.slice(hunk.start, cut + 1))
                 # 添加截断提示
-                important_lines.append("... (内容已截断) ...")
-                break
-            
-            important_lines.append(line)
-            current_size += line_size
+                parts.append("... (内容已截断) ...")
+                return ''.join(parts)
         
-        return '\n'.join(important_lines)
+        return ''.join(parts)
     
-    def _split_diff_by_files(self, diff_content: str, changed_files: List) -> List[Dict]:
-        """按文件分割diff内容"""
-        chunks = []
-        lines = diff_content.split('\n')
-        current_chunk = []
-        current_files = []
-        current_size = 0
+    def _get_chunk_token_budget(self, commit: SVNCommit) -> int:
+        """计算单块diff可用的token数（上下文窗口减去响应和提示词开销）"""
+        if not self.context_window_tokens:
+            return ChunkPlanner.chunk_token_budget(self.chunk_size)
         
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            line_size = len(line) + 1
-            
-            # 检测文件分界线
-            if line.startswith('Index:') or line.startswith('==='):
-                # 如果当前块已有内容且达到大小限制，保存当前块
-                if current_chunk and current_size > self.chunk_size:
-                    chunks.append({
-                        'diff': '\n'.join(current_chunk),
-                        'files': current_files.copy()
-                    })
-                    current_chunk = []
-                    current_files = []
-                    current_size = 0
-                
-                # 开始新文件
-                if line.startswith('Index:'):
-                    file_path = line.replace('Index: ', '').strip()
-                    # 在changed_files中查找对应文件信息
-                    file_info = next((f for f in changed_files 
-                                    if f.get('path', '').endswith(file_path)), 
-                                   {'path': file_path, 'action': 'M'})
-                    current_files.append(file_info)
-            
-            current_chunk.append(line)
-            current_size += line_size
-            i += 1
+        empty_commit = SVNCommit(
+            revision=commit.revision,
+            author=commit.author,
+            date=commit.date,
+            message=commit.message,
+            changed_files=commit.changed_files,
+            diff_content=""
+        )
+        overhead = estimate_tokens(len(self.system_prompt) +
+                                   len(self._build_review_prompt(empty_commit)) +
+                                   len(self._review_instructions()))
+        return ChunkPlanner.chunk_token_budget(self.chunk_size, self.context_window_tokens,
+                                               self.max_tokens, overhead)
+    
+    def _split_diff_by_files(self, diff_content: str, changed_files: List,
+                             chunk_tokens: int = None) -> List[Dict]:
+        """按文件分割diff内容，按token预算把文件装箱为尽量少的块"""
+        if chunk_tokens is None:
+            chunk_tokens = ChunkPlanner.chunk_token_budget(self.chunk_size)
         
-        # 添加最后一块
-        if current_chunk:
-            chunks.append({
-                'diff': '\n'.join(current_chunk),
-                'files': current_files
-            })
+        index = DiffIndex.parse(diff_content)
+        chunks = ChunkPlanner(chunk_tokens).plan(index, changed_files)
         
         return chunks if chunks else [{'diff': diff_content, 'files': changed_files}]
     
@@ -473,8 +854,30 @@ class AIReviewer:
             risks=list(set(risks))  # 去重
         )
     
-    def _call_ai_api(self, prompt: str, monitor=None) -> Optional[str]:
-        """调用AI API"""
+    def _build_messages(self, prompt: str, partial_output: str = None) -> List[Dict[str, str]]:
+        """构建对话消息；partial_output 为被截断的已有输出时，追加续写请求"""
+        messages = [
+            {
+                'role': 'system',
+                'content': self.system_prompt
+            },
+            {
+                'role': 'user',
+                'content': self._review_instructions() + prompt
+            }
+        ]
+        if partial_output:
+            messages.extend([
+                {'role': 'assistant', 'content': partial_output},
+                {'role': 'user', 'content': CONTINUE_PROMPT}
+            ])
+        return messages
+    
+    def _build_api_request(self, messages: List[Dict[str, str]], continuing: bool = False) -> tuple:
+        """构建chat completions请求，返回 (url, headers, data)
+
+        续写请求不带 response_format：按schema约束时模型会重新输出完整对象，而不是接着已有输出写。
+        """
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
@@ -482,68 +885,120 @@ class AIReviewer:
         
         data = {
             'model': self.model,
-            'messages': [
-                {
-                    'role': 'system',
-                    'content': self.system_prompt
-                },
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
+            'messages': messages,
             'max_tokens': self.max_tokens,
             'temperature': self.temperature
         }
+        if self.stream:
+            data['stream'] = True
+            if self.stream_usage:
+                data['stream_options'] = {'include_usage': True}
+        if self.structured_output and not continuing:
+            data['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'code_review', 'strict': True, 'schema': REVIEW_RESULT_SCHEMA}
+            }
+        return f"{self.api_base}/chat/completions", headers, data
+    
+    def _call_ai_api(self, prompt: str, monitor=None) -> Optional[str]:
+        """调用AI API，输出达到 max_tokens 被截断时请求续写并拼接"""
+        output = ''
+        for continuation in range(self.max_continuations + 1):
+            options = self._optional_request_params()
+            continuing = bool(output)
+            completion = self._request_completion(self._build_messages(prompt, output), monitor, continuing)
+            while completion is None and self._optional_request_params() != options:
+                # 接口不支持结构化输出或流式用量统计，去掉相应参数重新请求
+                options = self._optional_request_params()
+                completion = self._request_completion(self._build_messages(prompt, output), monitor, continuing)
+            if completion is None:
+                # 续写失败时保留已有输出，解析时修复为只包含完整字段的结果
+                return output or None
+            output = join_continuation(output, completion.content)
+            if not self._should_continue(completion, output, continuation, monitor):
+                break
+        return output
+    
+    async def _call_ai_api_async(self, prompt: str, monitor=None) -> Optional[str]:
+        """_call_ai_api 的asyncio版本"""
+        output = ''
+        for continuation in range(self.max_continuations + 1):
+            options = self._optional_request_params()
+            continuing = bool(output)
+            completion = await self._request_completion_async(
+                self._build_messages(prompt, output), monitor, continuing)
+            while completion is None and self._optional_request_params() != options:
+                options = self._optional_request_params()
+                completion = await self._request_completion_async(
+                    self._build_messages(prompt, output), monitor, continuing)
+            if completion is None:
+                return output or None
+            output = join_continuation(output, completion.content)
+            if not self._should_continue(completion, output, continuation, monitor):
+                break
+        return output
+    
+    def _optional_request_params(self) -> tuple:
+        """接口可能不支持的可选请求参数的启用状态，被拒绝后关闭"""
+        return self.structured_output, self.stream_usage
+    
+    def _should_continue(self, completion: ChatCompletion, output: str, continuation: int,
+                         monitor=None) -> bool:
+        """输出因 max_tokens 截断且审查结果JSON未写完时是否继续请求"""
+        if completion.finish_reason != 'length' or not needs_continuation(output):
+            return False
+        if continuation >= self.max_continuations:
+            self.logger.warning(f"AI输出达到max_tokens上限被截断，已续写 {continuation} 次，停止续写")
+            return False
+        self.logger.info(f"AI输出达到max_tokens上限被截断（{len(output)} 字符），"
+                         f"请求第 {continuation + 1} 次续写")
+        if monitor:
+            monitor.log_details(f"输出被截断，第 {continuation + 1} 次续写", 3)
+        return True
+    
+    def _request_completion(self, messages: List[Dict[str, str]], monitor=None,
+                            continuing: bool = False) -> Optional[ChatCompletion]:
+        """发送一次chat completions请求；continuing 表示这是续写请求"""
+        url, headers, data = self._build_api_request(messages, continuing)
+        tokens = self._estimate_request_tokens(messages)
         
         try:
             if monitor:
                 monitor.log_details(f"发送请求到: {self.api_base}", 3)
                 monitor.log_details(f"使用模型: {self.model}", 3)
-                
-            import time
-            start_time = time.time()
-            
-            response = requests.post(
-                f"{self.api_base}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=60
-            )
-            
-            api_time = time.time() - start_time
             
-            if monitor:
-                monitor.log_details(f"API响应时间: {api_time:.2f}秒", 3)
-                monitor.log_details(f"HTTP状态码: {response.status_code}", 3)
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                
-                if monitor:
-                    content_length = len(content)
-                    monitor.log_details(f"响应内容长度: {content_length} 字符", 3)
-                    
-                    # 检查token使用情况
-                    usage = result.get('usage', {})
-                    if usage:
-                        prompt_tokens = usage.get('prompt_tokens', 0)
-                        completion_tokens = usage.get('completion_tokens', 0)
-                        total_tokens = usage.get('total_tokens', 0)
-                        monitor.log_details(f"Token使用: {prompt_tokens}+{completion_tokens}={total_tokens}", 3)
+            for attempt in range(self.rate_limit_retries + 1):
+                # 共享限流器决定何时发送：并发名额、RPM/TPM配额、Retry-After暂停
+                waited = self.rate_limiter.acquire(tokens)
+                self._log_rate_limit_wait(waited, monitor)
+                status_code = response_headers = None
+                try:
+                    start_time = time.time()
+                    # 审查请求重复发送无副作用，读取超时也可重试；限流响应交给限流器处理
+                    response = self.http.post(
+                        url,
+                        idempotent=True,
+                        read_timeout=self._read_timeout(),
+                        retry_statuses=(),
+                        stream=self.stream,
+                        headers=headers,
+                        json=data
+                    )
+                    status_code, response_headers = response.status_code, response.headers
+                    if self._should_retry_rate_limited(response, attempt, monitor):
+                        response.close()
+                        continue
+                    if self.stream and response.status_code == 200:
+                        # 流式响应读完后才释放并发名额
+                        return self._read_stream(response, start_time, monitor, tokens, continuing)
+                finally:
+                    self.rate_limiter.release(status_code, response_headers)
                 
-                return content
-            else:
-                error_msg = f"AI API调用失败: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                if monitor:
-                    monitor.log_details(f"API错误: {response.status_code}", 3)
-                    monitor.log_details(f"错误信息: {response.text[:200]}", 3)
-                return None
+                api_time = time.time() - start_time
+                return self._handle_api_response(response, api_time, monitor, tokens)
                 
         except requests.Timeout:
-            error_msg = "AI API请求超时 (60秒)"
+            error_msg = f"AI API请求超时 ({self._read_timeout()}秒)"
             self.logger.error(error_msg)
             if monitor:
                 monitor.log_details("API请求超时", 3)
@@ -561,16 +1016,277 @@ class AIReviewer:
                 monitor.log_details(f"未知错误: {str(e)}", 3)
             return None
     
+    async def _request_completion_async(self, messages: List[Dict[str, str]], monitor=None,
+                                        continuing: bool = False) -> Optional[ChatCompletion]:
+        """_request_completion 的asyncio版本，通过 attach_async_transport 绑定的传输层发送"""
+        url, headers, data = self._build_api_request(messages, continuing)
+        tokens = self._estimate_request_tokens(messages)
+        
+        try:
+            if monitor:
+                monitor.log_details(f"发送请求到: {self.api_base}", 3)
+                monitor.log_details(f"使用模型: {self.model}", 3)
+            
+            for attempt in range(self.rate_limit_retries + 1):
+                waited = await self.rate_limiter.acquire_async(tokens)
+                self._log_rate_limit_wait(waited, monitor)
+                status_code = response_headers = None
+                try:
+                    start_time = time.time()
+                    response = await self.async_http.post(
+                        url,
+                        idempotent=True,
+                        read_timeout=self._read_timeout(),
+                        retry_statuses=(),
+                        stream=self.stream,
+                        headers=headers,
+                        json=data
+                    )
+                    status_code, response_headers = response.status_code, response.headers
+                    if self.stream:
+                        if response.status_code == 200:
+                            return await self._read_stream_async(response, start_time, monitor,
+                                                                 tokens, continuing)
+                        # 错误响应读取完整响应体后按普通响应处理
+                        response = await response.read()
+                finally:
+                    self.rate_limiter.release(status_code, response_headers)
+                
+                if self._should_retry_rate_limited(response, attempt, monitor):
+                    continue
+                api_time = time.time() - start_time
+                return self._handle_api_response(response, api_time, monitor, tokens)
+        
+        except HttpTimeoutError:
+            self.logger.error(f"AI API请求超时 ({self._read_timeout()}秒)")
+            if monitor:
+                monitor.log_details("API请求超时", 3)
+            return None
+        except HttpRequestError as e:
+            self.logger.error(f"AI API请求异常: {e}")
+            if monitor:
+                monitor.log_details(f"网络请求异常: {str(e)}", 3)
+            return None
+        except Exception as e:
+            self.logger.error(f"AI API调用发生未知错误: {e}")
+            if monitor:
+                monitor.log_details(f"未知错误: {str(e)}", 3)
+            return None
+    
+    def _read_timeout(self) -> float:
+        """读取超时：流式响应为两次收到数据的最长间隔，否则为等待完整响应的时间"""
+        return self.stream_idle_timeout if self.stream else self.request_timeout
+    
+    def _read_stream(self, response, start_time: float, monitor=None,
+                     estimated_tokens: int = 0, continuing: bool = False) -> Optional[ChatCompletion]:
+        """逐行读取SSE响应并拼接内容；续写请求读到响应结束，不在JSON对象闭合时提前停止"""
+        collector = StreamCollector(start_time, stop_on_json_close=not continuing,
+                                    wait_for_usage=self.stream_usage)
+        # text/event-stream 未声明编码时 requests 按ISO-8859-1解码
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if collector.feed_line(line):
+                    break
+        except requests.RequestException as e:
+            # 读取超时在逐行读取时以 ConnectionError 抛出
+            return self._stream_interrupted(collector, e, monitor)
+        finally:
+            response.close()
+        return self._finish_stream(collector, monitor, estimated_tokens)
+    
+    async def _read_stream_async(self, response, start_time: float, monitor=None,
+                                 estimated_tokens: int = 0,
+                                 continuing: bool = False) -> Optional[ChatCompletion]:
+        """_read_stream 的asyncio版本"""
+        collector = StreamCollector(start_time, stop_on_json_close=not continuing,
+                                    wait_for_usage=self.stream_usage)
+        try:
+            async for line in response.iter_lines():
+                if collector.feed_line(line):
+                    break
+        except HttpRequestError as e:
+            return self._stream_interrupted(collector, e, monitor)
+        finally:
+            response.close()
+        return self._finish_stream(collector, monitor, estimated_tokens)
+    
+    def _stream_interrupted(self, collector: StreamCollector, error: Exception,
+                            monitor=None) -> Optional[ChatCompletion]:
+        self.logger.error(f"AI API流式响应中断（{self.stream_idle_timeout}秒内无新数据或连接断开，"
+                          f"已接收 {len(collector.content)} 字符）: {error}")
+        if monitor:
+            monitor.log_details(f"流式响应中断: {str(error)}", 3)
+        return None
+    
+    def _finish_stream(self, collector: StreamCollector, monitor=None,
+                       estimated_tokens: int = 0) -> Optional[ChatCompletion]:
+        """流式响应结束：记录首个token耗时和用量，返回输出"""
+        api_time = time.time() - collector.start_time
+        if collector.error:
+            self.logger.error(f"AI API流式响应返回错误: {collector.error}")
+            if monitor:
+                monitor.log_details(f"API错误: {collector.error[:200]}", 3)
+            return None
+        
+        content = collector.content
+        ttft = collector.ttft
+        if ttft is not None:
+            self.logger.debug(f"AI API流式响应: 首个token {ttft:.2f}秒，总耗时 {api_time:.2f}秒，"
+                              f"{collector.events} 个事件")
+        if monitor:
+            monitor.log_details(f"API响应时间: {api_time:.2f}秒", 3)
+            if ttft is not None:
+                monitor.log_details(f"首个token耗时: {ttft:.2f}秒", 3)
+            monitor.log_details(f"响应内容长度: {len(content)} 字符", 3)
+        self._record_usage(collector.usage, estimated_tokens, content, monitor)
+        
+        if not content:
+            self.logger.error("AI API流式响应没有内容")
+            return None
+        if (collector.stop_on_json_close and not collector.json_complete
+                and collector.finish_reason != 'length'):
+            self.logger.warning(f"AI流式响应结束时审查结果JSON不完整 (结束原因: {collector.finish_reason})")
+        return ChatCompletion(content, collector.finish_reason)
+    
+    def _record_usage(self, usage: Dict[str, Any], estimated_tokens: int, content: str,
+                      monitor=None):
+        """按实际用量修正TPM令牌桶；没有用量（如流式响应提前结束）时按内容长度估算"""
+        total_tokens = usage.get('total_tokens', 0)
+        if not total_tokens and estimated_tokens:
+            total_tokens = estimated_tokens - self.max_tokens + estimate_tokens(len(content))
+        self.rate_limiter.record_usage(estimated_tokens, total_tokens)
+        
+        if not usage:
+            return
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        # 命中接口提示词缓存的token（OpenAI: prompt_tokens_details.cached_tokens，DeepSeek: prompt_cache_hit_tokens）
+        cached_tokens = ((usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+                         or usage.get('prompt_cache_hit_tokens') or 0)
+        if prompt_tokens:
+            self.logger.debug(f"提示词token: {prompt_tokens}，缓存命中: {cached_tokens} "
+                              f"({cached_tokens / prompt_tokens:.0%})")
+        
+        # 检查token使用情况
+        if monitor:
+            completion_tokens = usage.get('completion_tokens', 0)
+            monitor.log_details(f"Token使用: {prompt_tokens}+{completion_tokens}={usage.get('total_tokens', 0)}", 3)
+            if cached_tokens:
+                monitor.log_details(f"提示词缓存命中: {cached_tokens} tokens", 3)
+    
+    def _estimate_request_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """预估单次请求消耗的token（全部消息 + 完整的max_tokens），用于TPM限流"""
+        return estimate_tokens(sum(len(message['content']) for message in messages)) + self.max_tokens
+    
+    def _should_retry_rate_limited(self, response, attempt: int, monitor=None) -> bool:
+        """限流或服务端过载时是否再次排队重试（等待时间由限流器根据响应头决定）"""
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= self.rate_limit_retries:
+            return False
+        self.logger.warning(f"AI API返回 {response.status_code}，"
+                            f"第 {attempt + 1}/{self.rate_limit_retries} 次重新排队")
+        if monitor:
+            monitor.log_details(f"API限流/过载 ({response.status_code})，等待后重试", 3)
+        return True
+    
+    def _log_rate_limit_wait(self, waited: float, monitor=None):
+        if waited >= 1 and monitor:
+            monitor.log_details(f"限流等待 {waited:.1f}秒", 3)
+    
+    def _handle_api_response(self, response, api_time: float, monitor=None,
+                             estimated_tokens: int = 0) -> Optional[ChatCompletion]:
+        """处理chat completions响应（requests.Response 或 AsyncResponse），返回输出"""
+        if monitor:
+            monitor.log_details(f"API响应时间: {api_time:.2f}秒", 3)
+            monitor.log_details(f"HTTP状态码: {response.status_code}", 3)
+        
+        if response.status_code == 200:
+            result = response.json()
+            choice = result['choices'][0]
+            content = choice['message']['content']
+            
+            if monitor:
+                content_length = len(content)
+                monitor.log_details(f"响应内容长度: {content_length} 字符", 3)
+            self._record_usage(result.get('usage') or {}, estimated_tokens, content, monitor)
+            
+            return ChatCompletion(content, choice.get('finish_reason'))
+        else:
+            if self._structured_output_rejected(response):
+                self._disable_structured_output()
+                self.logger.warning("AI接口不支持 response_format 结构化输出，改用提示词中的JSON格式示例")
+                if monitor:
+                    monitor.log_details("接口不支持结构化输出，回退到提示词格式", 3)
+                return None
+            if self._stream_usage_rejected(response):
+                self.stream_usage = False
+                self.logger.warning("AI接口不支持 stream_options，流式响应不再请求用量统计")
+                if monitor:
+                    monitor.log_details("接口不支持stream_options，去掉后重新请求", 3)
+                return None
+            error_msg = f"AI API调用失败: {response.status_code} - {response.text}"
+            self.logger.error(error_msg)
+            if monitor:
+                monitor.log_details(f"API错误: {response.status_code}", 3)
+                monitor.log_details(f"错误信息: {response.text[:200]}", 3)
+            return None
+    
+    def _disable_structured_output(self):
+        """关闭结构化输出；提示词随之改为带JSON格式示例的版本，结果缓存版本同步更新"""
+        self.structured_output = False
+        self.review_cache_version = self._make_review_cache_version()
+    
+    def _structured_output_rejected(self, response) -> bool:
+        """请求因 response_format 被接口拒绝（不支持结构化输出或JSON schema）"""
+        if not self.structured_output or response.status_code not in (400, 422):
+            return False
+        text = response.text.lower()
+        return 'response_format' in text or 'json_schema' in text
+    
+    def _stream_usage_rejected(self, response) -> bool:
+        """请求因 stream_options 被接口拒绝"""
+        if not self.stream_usage or response.status_code not in (400, 422):
+            return False
+        text = response.text.lower()
+        return 'stream_options' in text or 'include_usage' in text
+    
+    def _parse_structured_response(self, revision: str, response: str) -> Optional[ReviewResult]:
+        """严格解析结构化输出：整个响应必须是符合schema的JSON，否则返回None"""
+        try:
+            review_data = json.loads(response)
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"结构化输出不是有效的JSON，按普通响应解析: {e}")
+            return None
+        errors = validate_json(review_data, REVIEW_RESULT_SCHEMA)
+        if errors:
+            self.logger.warning(f"结构化输出不符合审查结果schema，按普通响应解析: {'; '.join(errors[:5])}")
+            return None
+        return ReviewResult(commit_revision=revision, **review_data)
+    
     def _parse_review_response(self, revision: str, response: str) -> ReviewResult:
         """解析AI审查响应"""
+        if self.structured_output:
+            result = self._parse_structured_response(revision, response)
+            if result is not None:
+                return result
+        
         try:
             # 尝试从响应中提取JSON
-            start_idx = response.find('{')
-            end_idx = response.rfind('}') + 1
+            json_str, complete = extract_json_object(response)
             
-            if start_idx != -1 and end_idx != 0:
-                json_str = response[start_idx:end_idx]
-                review_data = json.loads(json_str)
+            if json_str is not None:
+                review_data = json.loads(json_str) if complete else None
+                repaired = review_data is None
+                if review_data is None:
+                    # 输出被截断（续写后仍不完整或续写失败），保留已写完的字段
+                    review_data = repair_truncated_json(json_str)
+                    if review_data is None:
+                        raise json.JSONDecodeError("审查结果JSON不完整且无法修复", json_str, len(json_str))
+                    # 最后一条评论可能只写了文件名
+                    review_data['detailed_comments'] = [
+                        comment for comment in review_data.get('detailed_comments', [])
+                        if isinstance(comment, dict) and comment.get('comment')
+                    ]
+                    self.logger.warning(f"版本 {revision} 的审查结果JSON不完整，已保留完整的字段")
                 
                 return ReviewResult(
                     commit_revision=revision,
@@ -578,7 +1294,8 @@ class AIReviewer:
                     summary=review_data.get('summary', ''),
                     detailed_comments=review_data.get('detailed_comments', []),
                     suggestions=review_data.get('suggestions', []),
-                    risks=review_data.get('risks', [])
+                    risks=review_data.get('risks', []),
+                    complete=not repaired
                 )
             else:
                 # 如果无法解析JSON，创建简单的结果
@@ -588,7 +1305,8 @@ class AIReviewer:
                     summary=response[:500],
                     detailed_comments=[],
                     suggestions=[],
-                    risks=[]
+                    risks=[],
+                    complete=False
                 )
                 
         except json.JSONDecodeError as e:
@@ -600,7 +1318,8 @@ class AIReviewer:
                 summary=response[:500],
                 detailed_comments=[],
                 suggestions=[],
-                risks=[]
+                risks=[],
+                complete=False
             )
         except Exception as e:
             self.logger.error(f"解析AI响应时发生错误: {e}")
@@ -610,5 +1329,6 @@ class AIReviewer:
                 summary="审查结果解析失败",
                 detailed_comments=[],
                 suggestions=[],
-                risks=["审查结果解析异常"]
+                risks=["审查结果解析异常"],
+                complete=False
             )
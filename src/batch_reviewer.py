@@ -16,6 +16,8 @@ import time
 
 from config_manager import ConfigManager
 from ai_reviewer import AIReviewer
+from diff_cache import DiffCache, diff_cache_options, get_repository_uuid
+from diff_reader import StreamingDiffReader, build_diff_commands
 
 
 class BatchReviewer:
@@ -32,6 +34,10 @@ class BatchReviewer:
         self.reports_dir = self.batch_config.get('reports_dir', 'reports')
         self.report_format = self.batch_config.get('report_format', 'html')
         
+        # 共享的diff缓存
+        self.diff_cache = DiffCache.from_config(self.config_manager)
+        self.diff_reader = StreamingDiffReader.from_config(self.config_manager)
+        
         # 确保报告目录存在
         os.makedirs(self.reports_dir, exist_ok=True)
         
@@ -178,34 +184,38 @@ class BatchReviewer:
         username = self.config['svn']['username']
         password = self.config['svn']['password']
         
-        try:
-            cmd = [
-                'svn', 'diff',
-                f'{repository_url}',
-                f'-c{revision}',
-                '--username', username,
-                '--password', password,
-                '--non-interactive',
-                '--trust-server-cert'
-            ]
-            
-            result = subprocess.run(
-                cmd, capture_output=True, text=True,
-                encoding='utf-8', timeout=120
-            )
-            
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                self.logger.warning(f"获取版本 {revision} 差异失败: {result.stderr}")
-                return f"获取差异失败: {result.stderr}"
-                
-        except subprocess.TimeoutExpired:
-            self.logger.error(f"获取版本 {revision} 差异超时")
-            return "获取差异超时"
-        except Exception as e:
-            self.logger.error(f"获取版本 {revision} 差异异常: {e}")
-            return f"获取差异异常: {e}"
+        options = diff_cache_options(repository_url, self.diff_reader.cache_options())
+        repo_uuid = get_repository_uuid(repository_url, username, password)
+        cached = self.diff_cache.get(repo_uuid, revision, options)
+        if cached is not None:
+            return cached
+        
+        auth_args = [
+            '--username', username,
+            '--password', password,
+            '--non-interactive',
+            '--trust-server-cert'
+        ]
+        cmd = ['svn'] + build_diff_commands(
+            repository_url, revision, diff_options=self.diff_reader.diff_options)[0] + auth_args
+        # 带diff参数获取失败时（如svn版本过旧）回退为不带额外参数的完整diff
+        fallback_cmd = (['svn'] + build_diff_commands(repository_url, revision)[0] + auth_args
+                        if self.diff_reader.diff_options else None)
+        
+        # 流式读取，超大diff按预算截断
+        result = self.diff_reader.read_with_fallback([cmd], [fallback_cmd] if fallback_cmd else None)
+        
+        if result.success:
+            if result.truncated:
+                self.logger.info(f"版本 {revision} 的diff超出预算，已截断")
+            if result.fallback:
+                options = diff_cache_options(repository_url,
+                                             self.diff_reader.cache_options(include_diff_options=False))
+            self.diff_cache.put(repo_uuid, revision, options, result.content)
+            return result.content
+        else:
+            self.logger.warning(f"获取版本 {revision} 差异失败: {result.error}")
+            return f"获取差异失败: {result.error}"
     
     def batch_review_commits(self, commits: List[Dict[str, Any]],
                              progress_callback: Optional[callable] = None
@@ -0,0 +1,286 @@
+"""
+分块规划模块
+按token估算每个文件diff的大小，把文件装箱到尽量少的块中，每块都不超过模型可用的上下文预算；
+单个文件超出预算时在差异块（@@）和函数/类边界处拆分，每一片都重复文件头
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from commit_planner import CHARS_PER_TOKEN, estimate_tokens
+from diff_index import DiffIndex, DiffPathLookup, FileEntry, HunkEntry
+from review_cache import file_digest, normalize_file_diff
+
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$')
+
+# 常见语言的函数/类定义行，用于在超大差异块内部选择拆分点
+FUNCTION_BOUNDARY_PATTERN = re.compile(
+    r'\s*(?:@\w+|(?:export\s+)?(?:default\s+)?(?:async\s+)?'
+    r'(?:def|class|function|func|fn|interface|struct|enum|impl|namespace|module|sub|proc)\b|'
+    r'(?:(?:public|private|protected|internal|static|virtual|override|final|abstract|inline|const)\s+)+'
+    r'|(?!(?:return|else|if|for|while|switch|case|new|throw|delete|await|yield)\b)'
+    r'(?:[\w:<>\*&,\[\]]+\s+)+[\w:~]+\s*\([^;]*$)'
+)
+
+
+@dataclass
+class DiffPiece:
+    """参与装箱的一段diff：完整文件，或超大文件拆出的一片"""
+    path: str
+    offset: int  # 在原始diff中的位置，用于恢复顺序
+    text: str
+    tokens: int
+    part: int = 1
+    parts: int = 1
+    digest: str = ''  # 规范化内容的哈希，用于复用已审查文件的评论
+
+
+@dataclass
+class FileGroup:
+    """需要放在同一块中审查的相关文件（如头文件和源文件）"""
+    entries: List[DiffPiece] = field(default_factory=list)
+    tokens: int = 0
+
+
+@dataclass
+class ChunkBin:
+    """一个审查块"""
+    groups: List[FileGroup] = field(default_factory=list)
+    tokens: int = 0
+
+    @property
+    def first_offset(self) -> int:
+        return min(piece.offset for group in self.groups for piece in group.entries)
+
+
+class ChunkPlanner:
+    """基于token预算的装箱分块规划器"""
+
+    def __init__(self, chunk_tokens: int):
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def chunk_chars(self) -> int:
+        """单块预算对应的字符数"""
+        return self.chunk_tokens * CHARS_PER_TOKEN
+
+    @staticmethod
+    def chunk_token_budget(chunk_size: int, context_window_tokens: int = 0,
+                           max_tokens: int = 0, prompt_overhead_tokens: int = 0) -> int:
+        """计算单块diff可用的token数
+
+        配置了模型上下文窗口时，使用上下文减去响应max_tokens和提示词开销；否则按chunk_size字符数估算。
+        """
+        if context_window_tokens and context_window_tokens > 0:
+            return max(1, context_window_tokens - max_tokens - prompt_overhead_tokens)
+        return max(1, estimate_tokens(chunk_size))
+
+    def plan(self, index: DiffIndex, changed_files: List[Dict[str, str]]) -> List[Dict]:
+        """把diff中的文件装箱为审查块，返回 [{'diff': ..., 'files': [...]}]，块按diff中的原始顺序排列"""
+        if not index.files:
+            return []
+
+        groups = self._group_related_files(index)
+
+        # 相关文件整体超出预算时拆开，单个文件超出预算时按差异块拆分
+        items: List[FileGroup] = []
+        for group in groups:
+            if group.tokens > self.chunk_tokens and len(group.entries) > 1:
+                items.extend(FileGroup([piece], piece.tokens) for piece in group.entries)
+            else:
+                items.append(group)
+
+        # 首次适应递减（FFD）装箱
+        bins: List[ChunkBin] = []
+        for item in sorted(items, key=lambda g: g.tokens, reverse=True):
+            for chunk_bin in bins:
+                if chunk_bin.tokens + item.tokens <= self.chunk_tokens:
+                    chunk_bin.groups.append(item)
+                    chunk_bin.tokens += item.tokens
+                    break
+            else:
+                bins.append(ChunkBin([item], item.tokens))
+
+        bins.sort(key=lambda b: b.first_offset)
+
+        lookup = DiffPathLookup(changed_files)
+        chunks = []
+        for i, chunk_bin in enumerate(bins):
+            pieces = sorted((piece for group in chunk_bin.groups for piece in group.entries),
+                            key=lambda p: p.offset)
+            parts = [piece.text for piece in pieces]
+            if i == 0 and index.preamble_end:
+                parts.insert(0, index.preamble())
+
+            files = []
+            seen_paths = set()
+            for piece in pieces:
+                if piece.path in seen_paths:
+                    continue
+                seen_paths.add(piece.path)
+                files.append(lookup.find(piece.path) or {'path': piece.path, 'action': 'M'})
+
+            chunks.append({
+                'diff': ''.join(parts),
+                'files': files,
+                'tokens': chunk_bin.tokens,
+                'pieces': [{'path': piece.path, 'digest': piece.digest} for piece in pieces]
+            })
+
+        self.logger.debug(f"{len(index.files)} 个文件装箱为 {len(chunks)} 块 "
+                          f"(每块预算 {self.chunk_tokens:,} tokens)")
+        return chunks
+
+    @staticmethod
+    def _text_tokens(text: str) -> int:
+        return estimate_tokens(len(text)) + 1
+
+    def _group_related_files(self, index: DiffIndex) -> List[FileGroup]:
+        """同一目录下主文件名相同的文件（如 foo.h / foo.cpp）归为一组，超大文件拆分为多片单独成组"""
+        groups: Dict[tuple, FileGroup] = {}
+        standalone: List[FileGroup] = []
+        for entry in index.files:
+            pieces = self._split_entry(index, entry)
+            if len(pieces) > 1:
+                standalone.extend(FileGroup([piece], piece.tokens) for piece in pieces)
+                continue
+
+            directory, name = os.path.split(entry.path)
+            key = (directory, os.path.splitext(name)[0].lower())
+            group = groups.setdefault(key, FileGroup())
+            group.entries.append(pieces[0])
+            group.tokens += pieces[0].tokens
+        return list(groups.values()) + standalone
+
+    def _split_entry(self, index: DiffIndex, entry: FileEntry) -> List[DiffPiece]:
+        """单个文件diff超出预算时，在差异块和函数边界处拆分，每片重复文件头"""
+        text = index.file_text(entry)
+        tokens = self._text_tokens(text)
+        if tokens <= self.chunk_tokens or not entry.hunks:
+            digest = file_digest(entry.path, normalize_file_diff(index, entry))
+            return [DiffPiece(entry.path, entry.start, text, tokens, digest=digest)]
+
+        header = index.header_text(entry)
+        # 预留token估算时的取整余量
+        budget = max(1, self.chunk_chars - len(header) - CHARS_PER_TOKEN)
+
+        # 先拆分超大的差异块，再把相邻的差异块合并到不超过预算
+        segments = []  # (offset, text)
+        for hunk in entry.hunks:
+            hunk_text = index.hunk_text(hunk)
+            if len(hunk_text) <= budget:
+                segments.append((hunk.start, hunk_text))
+            else:
+                segments.extend(self._split_hunk(hunk, hunk_text, budget))
+
+        # 最后一个差异块之后的属性变化等内容附在最后一片
+        trailing = index.slice(entry.hunks[-1].end, entry.end)
+
+        bodies = []  # (offset, [texts], size)
+        for offset, segment in segments:
+            if bodies and bodies[-1][2] + len(segment) <= budget:
+                bodies[-1][1].append(segment)
+                bodies[-1] = (bodies[-1][0], bodies[-1][1], bodies[-1][2] + len(segment))
+            else:
+                bodies.append((offset, [segment], len(segment)))
+        if trailing:
+            bodies[-1][1].append(trailing)
+
+        pieces = []
+        for i, (offset, body, _) in enumerate(bodies, 1):
+            piece_text = header + ''.join(body)
+            pieces.append(DiffPiece(entry.path, offset, piece_text, self._text_tokens(piece_text),
+                                    part=i, parts=len(bodies),
+                                    digest=self._piece_digest(entry.path, piece_text)))
+
+        self.logger.debug(f"文件 {entry.path} diff超出单块预算，拆分为 {len(pieces)} 片")
+        return pieces
+
+    @staticmethod
+    def _piece_digest(path: str, piece_text: str) -> str:
+        """拆分出的一片（文件头 + 部分差异块）的规范化哈希"""
+        piece_index = DiffIndex.parse(piece_text)
+        if not piece_index.files:
+            return ''
+        return file_digest(path, normalize_file_diff(piece_index, piece_index.files[0]))
+
+    def _split_hunk(self, hunk: HunkEntry, hunk_text: str, budget: int) -> List[tuple]:
+        """把超大差异块按函数/类边界（找不到时按行）拆分，每段重新生成 @@ 行号头"""
+        first_newline = hunk_text.find('\n')
+        if first_newline == -1:
+            return [(hunk.start, hunk_text)]
+
+        match = HUNK_HEADER_PATTERN.match(hunk_text[:first_newline].rstrip('\r'))
+        if not match:
+            return [(hunk.start, hunk_text)]
+        old_line = int(match.group(1))
+        new_line = int(match.group(3))
+        context = match.group(5)
+        # 每段会重新生成 @@ 头，预留其长度（行号位数可能增加）
+        budget = max(1, budget - first_newline - 16)
+
+        segments = []
+        seg_start = first_newline + 1
+        seg_old_line, seg_new_line = old_line, new_line
+        boundary: Optional[tuple] = None  # (位置, 旧行号, 新行号)
+        previous_is_boundary = False
+        pos = seg_start
+        length = len(hunk_text)
+
+        while pos < length:
+            newline = hunk_text.find('\n', pos)
+            line_end = length if newline == -1 else newline + 1
+            marker = hunk_text[pos]
+
+            # 当前段超出预算时在最近的函数边界处切开，边界太靠前（切出的段过小）时按当前行切开
+            if pos > seg_start and line_end - seg_start > budget:
+                if boundary and boundary[0] - seg_start >= budget // 4:
+                    cut, cut_old, cut_new = boundary
+                else:
+                    cut, cut_old, cut_new = pos, old_line, new_line
+                segments.append(self._make_segment(hunk.start + seg_start, hunk_text[seg_start:cut],
+                                                   seg_old_line, seg_new_line, context))
+                seg_start, seg_old_line, seg_new_line = cut, cut_old, cut_new
+                boundary = None
+
+            # 装饰器与紧随其后的定义行视为同一个边界
+            is_boundary = (marker in ' +-' and
+                           FUNCTION_BOUNDARY_PATTERN.match(hunk_text, pos + 1, line_end) is not None)
+            if is_boundary and not previous_is_boundary and pos > seg_start:
+                boundary = (pos, old_line, new_line)
+            previous_is_boundary = is_boundary
+
+            if marker in ' -':
+                old_line += 1
+            if marker in ' +':
+                new_line += 1
+            pos = line_end
+
+        if seg_start < length:
+            segments.append(self._make_segment(hunk.start + seg_start, hunk_text[seg_start:],
+                                               seg_old_line, seg_new_line, context))
+        return segments
+
+    @staticmethod
+    def _make_segment(offset: int, body: str, old_start: int, new_start: int,
+                      context: str) -> tuple:
+        """为拆出的差异段生成正确的 @@ -旧起始,行数 +新起始,行数 @@ 头"""
+        old_count = new_count = 0
+        pos = 0
+        while pos < len(body):
+            marker = body[pos]
+            if marker in ' -':
+                old_count += 1
+            if marker in ' +':
+                new_count += 1
+            newline = body.find('\n', pos)
+            if newline == -1:
+                break
+            pos = newline + 1
+        header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{context}\n"
+        return offset, header + body
@@ -0,0 +1,178 @@
+"""
+提交预检规划模块
+在下载diff之前，根据 svn diff --summarize 和日志中的文件类型估算提交大小，提前选择审查策略
+"""
+
+import logging
+import math
+import urllib.parse
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+
+# 与 debugTools/commit_size_analyzer.py 一致的粗略估算：约3个字符对应1个token
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(chars: int) -> int:
+    """按字符数粗略估算token数"""
+    return chars // CHARS_PER_TOKEN
+
+
+@dataclass
+class CommitPlan:
+    """提交审查预检计划"""
+    revision: str
+    strategy: str  # standard | chunked | sample | skip
+    file_count: int = 0
+    added_files: int = 0
+    modified_files: int = 0
+    deleted_files: int = 0
+    estimated_chars: int = 0
+    estimated_tokens: int = 0
+    estimated_chunks: int = 1
+    review_files: List[Dict[str, str]] = field(default_factory=list)  # 需要下载diff的文件
+    reason: str = ""
+
+
+class CommitPlanner:
+    """提交预检规划器"""
+
+    def __init__(self, run_svn: Callable[[List[str]], str], repository_url: str,
+                 repository_root: Optional[str] = None, file_filter=None,
+                 chunk_size: int = 15000, enable_chunked_review: bool = True,
+                 avg_added_file_chars: int = 4000, avg_modified_file_chars: int = 1500,
+                 max_review_chars: int = 300000, oversized_action: str = 'sample',
+                 sample_files: int = 20):
+        self.run_svn = run_svn
+        self.repository_url = repository_url
+        self.repository_root = repository_root
+        self.file_filter = file_filter
+        self.chunk_size = chunk_size
+        self.enable_chunked_review = enable_chunked_review
+        self.avg_added_file_chars = avg_added_file_chars
+        self.avg_modified_file_chars = avg_modified_file_chars
+        self.max_review_chars = max_review_chars
+        self.oversized_action = oversized_action
+        self.sample_files = sample_files
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config, run_svn: Callable[[List[str]], str], repository_url: str,
+                    repository_root: Optional[str] = None, file_filter=None) -> 'CommitPlanner':
+        """根据 ai.preflight 配置创建规划器"""
+        return cls(
+            run_svn=run_svn,
+            repository_url=repository_url,
+            repository_root=repository_root,
+            file_filter=file_filter,
+            chunk_size=config.get('ai.chunk_size', 15000),
+            enable_chunked_review=config.get('ai.enable_chunked_review', True),
+            avg_added_file_chars=config.get('ai.preflight.avg_added_file_chars', 4000),
+            avg_modified_file_chars=config.get('ai.preflight.avg_modified_file_chars', 1500),
+            max_review_chars=config.get('ai.preflight.max_review_chars', 300000),
+            oversized_action=config.get('ai.preflight.oversized_action', 'sample'),
+            sample_files=config.get('ai.preflight.sample_files', 20)
+        )
+
+    def plan(self, revision: str, changed_files: List[Dict[str, str]],
+             summary_output: Optional[str] = None) -> CommitPlan:
+        """根据变更文件列表生成审查计划（不下载diff内容）
+        
+        summary_output为调用方预先获取的 summary_command() 输出，为None时在此执行。
+        """
+        if summary_output is not None:
+            content_changes = self.parse_content_changes(summary_output)
+        else:
+            content_changes = self._get_content_changes(revision)
+
+        review_files = []
+        for file_info in changed_files:
+            path = file_info.get('path') or ''
+            if file_info.get('kind', 'file') == 'dir':
+                continue
+            if self.file_filter is not None and not self.file_filter.is_reviewable(path):
+                continue
+            # 只有属性变化、内容未变的文件不计入大小估算
+            if content_changes is not None and path not in content_changes:
+                continue
+            review_files.append(file_info)
+
+        plan = CommitPlan(revision=revision, strategy='standard',
+                          file_count=len(review_files), review_files=review_files)
+        for file_info in review_files:
+            action = file_info.get('action', '')
+            if action == 'A':
+                plan.added_files += 1
+            elif action == 'D':
+                plan.deleted_files += 1
+            else:
+                plan.modified_files += 1
+
+        plan.estimated_chars = (plan.added_files * self.avg_added_file_chars +
+                                (plan.modified_files + plan.deleted_files) * self.avg_modified_file_chars)
+        plan.estimated_tokens = estimate_tokens(plan.estimated_chars)
+
+        if not review_files:
+            plan.strategy = 'skip'
+            plan.reason = "没有需要审查的文件内容变更"
+        elif plan.estimated_chars > self.max_review_chars:
+            if self.oversized_action == 'skip':
+                plan.strategy = 'skip'
+                plan.reason = (f"提交过大（{plan.file_count} 个文件，预估 "
+                               f"{plan.estimated_chars:,} 字符），已跳过AI审查")
+            else:
+                plan.strategy = 'sample'
+                plan.review_files = self._sample(review_files)
+                plan.reason = (f"提交过大（{plan.file_count} 个文件，预估 "
+                               f"{plan.estimated_chars:,} 字符），抽样审查 {len(plan.review_files)} 个文件")
+        elif self.enable_chunked_review and plan.estimated_chars > self.chunk_size:
+            plan.strategy = 'chunked'
+
+        if plan.strategy in ('chunked', 'sample') and self.chunk_size > 0:
+            plan.estimated_chunks = max(1, math.ceil(
+                min(plan.estimated_chars, self.max_review_chars) / self.chunk_size))
+
+        self.logger.info(f"提交 {revision} 预检: {plan.file_count} 个文件，预估 "
+                         f"{plan.estimated_chars:,} 字符，策略 {plan.strategy}")
+        return plan
+
+    def _sample(self, review_files: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """抽样选择需要审查的文件，优先修改的文件，其次新增文件"""
+        modified = [f for f in review_files if f.get('action') not in ('A', 'D')]
+        added = [f for f in review_files if f.get('action') == 'A']
+        return (modified + added)[:self.sample_files]
+
+    def summary_command(self, revision: str) -> Optional[List[str]]:
+        """获取内容变化文件的 svn diff --summarize 命令参数，无法确定仓库根URL时返回None"""
+        if not self.repository_root:
+            return None
+        return ['diff', '--summarize', '--xml', f'-c{revision}', self.repository_url]
+
+    def _get_content_changes(self, revision: str) -> Optional[set]:
+        """通过 svn diff --summarize 获取内容发生变化的文件路径（相对仓库根），失败时返回None"""
+        command = self.summary_command(revision)
+        if not command:
+            return None
+        return self.parse_content_changes(self.run_svn(command))
+
+    def parse_content_changes(self, output: str) -> Optional[set]:
+        """解析 svn diff --summarize --xml 输出，失败时返回None"""
+        if not output or not self.repository_root:
+            return None
+
+        try:
+            root = ET.fromstring(output)
+        except ET.ParseError as e:
+            self.logger.warning(f"解析diff摘要失败: {e}")
+            return None
+
+        changed = set()
+        for path in root.iter('path'):
+            if path.get('item', 'none') == 'none' or not path.text:
+                continue
+            url = path.text
+            if url.startswith(self.repository_root):
+                changed.add(urllib.parse.unquote(url[len(self.repository_root):]))
+        return changed
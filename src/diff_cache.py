@@ -0,0 +1,186 @@
+"""
+Diff缓存模块
+SVN版本一经提交不会再变化，按仓库UUID、版本号和diff参数缓存压缩后的diff内容
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# (仓库URL, 信息项) -> 值 的进程内缓存，避免重复执行 svn info
+_repository_info: Dict[tuple, str] = {}
+_info_lock = threading.Lock()
+
+
+def _get_repository_info_item(repository_url: str, item: str, username: str = None,
+                              password: str = None) -> Optional[str]:
+    """通过 svn info --show-item 获取仓库信息，失败时返回None"""
+    cache_key = (repository_url, item)
+    with _info_lock:
+        if cache_key in _repository_info:
+            return _repository_info[cache_key]
+
+    cmd = ['svn', 'info', repository_url, '--show-item', item]
+    if username:
+        cmd.extend(['--username', username])
+    if password:
+        cmd.extend(['--password', password])
+    cmd.extend(['--non-interactive', '--trust-server-cert'])
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True,
+                                encoding='utf-8', timeout=30)
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"获取仓库信息 {item} 失败: {e}")
+        return None
+
+    value = result.stdout.strip() if result.returncode == 0 else ''
+    if not value:
+        logging.getLogger(__name__).warning(f"获取仓库信息 {item} 失败: {result.stderr.strip()}")
+        return None
+
+    with _info_lock:
+        _repository_info[cache_key] = value
+    return value
+
+
+def get_repository_uuid(repository_url: str, username: str = None,
+                        password: str = None) -> Optional[str]:
+    """获取仓库UUID，失败时返回None"""
+    return _get_repository_info_item(repository_url, 'repos-uuid', username, password)
+
+
+def get_repository_root(repository_url: str, username: str = None,
+                        password: str = None) -> Optional[str]:
+    """获取仓库根URL，失败时返回None"""
+    return _get_repository_info_item(repository_url, 'repos-root-url', username, password)
+
+
+def diff_cache_options(repository_url: str, reader_options: List[str],
+                       targets: Optional[List[str]] = None) -> List[str]:
+    """diff缓存键中版本号之外的参数：仓库URL、diff路径以及读取预算和diff参数（StreamingDiffReader.cache_options）
+
+    监控、批量审查和诊断工具都通过它组织缓存键，同一版本的diff只下载和保存一次。
+    """
+    return [repository_url] + list(targets or []) + list(reader_options)
+
+
+class DiffCache:
+    """基于磁盘的压缩diff缓存，超出容量时按最近访问时间淘汰（LRU）"""
+
+    def __init__(self, cache_dir: str = "data/cache", max_size_mb: float = 500,
+                 enabled: bool = True):
+        self.cache_dir = Path(cache_dir) / 'diffs'
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'DiffCache':
+        """根据配置创建缓存实例"""
+        return cls(
+            cache_dir=config.get('data.cache_dir', 'data/cache'),
+            max_size_mb=config.get('data.diff_cache.max_size_mb', 500),
+            enabled=config.get('data.diff_cache.enabled', True)
+        )
+
+    @staticmethod
+    def make_key(repo_uuid: str, revision: str, options: List[str] = None) -> str:
+        """根据仓库UUID、版本号和diff参数生成缓存键"""
+        raw = '\0'.join([repo_uuid, str(revision)] + list(options or []))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.diff.gz"
+
+    def get(self, repo_uuid: Optional[str], revision: str,
+            options: List[str] = None) -> Optional[str]:
+        """读取缓存的diff，未命中返回None"""
+        if not self.enabled or not repo_uuid:
+            return None
+
+        path = self._entry_path(self.make_key(repo_uuid, revision, options))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"读取diff缓存失败 (版本 {revision}): {e}")
+            return None
+
+        # 更新访问时间，用于LRU淘汰
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.logger.debug(f"diff缓存命中: 版本 {revision}")
+        return content
+
+    def put(self, repo_uuid: Optional[str], revision: str,
+            options: List[str], diff_content: str):
+        """写入diff缓存"""
+        if not self.enabled or not repo_uuid:
+            return
+
+        path = self._entry_path(self.make_key(repo_uuid, revision, options))
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(diff_content)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f"写入diff缓存失败 (版本 {revision}): {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """缓存总大小超出上限时，淘汰最久未访问的条目"""
+        with self._lock:
+            removed = evict_lru(self.cache_dir, '.diff.gz', self.max_size_bytes)
+        if removed:
+            self.logger.info(f"diff缓存超出容量，已淘汰 {removed} 个条目")
+
+
+def evict_lru(cache_dir: Path, suffix: str, max_size_bytes: int) -> int:
+    """目录中以suffix结尾的文件总大小超出上限时，按修改时间（访问时会更新）淘汰最旧的，返回淘汰数量"""
+    entries = []
+    total_size = 0
+    try:
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"扫描缓存目录 {cache_dir} 失败: {e}")
+        return 0
+
+    if total_size <= max_size_bytes:
+        return 0
+
+    removed = 0
+    for _, size, entry_path in sorted(entries):
+        if total_size <= max_size_bytes:
+            break
+        try:
+            os.remove(entry_path)
+            total_size -= size
+            removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,180 @@
+"""
+Diff索引模块
+单次遍历diff文本，建立按文件和差异块（hunk）的偏移索引，过滤、分块、截断和统计都按偏移切片原始文本，
+不再各自把整个diff拆成行列表
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+
+@dataclass
+class HunkEntry:
+    """单个差异块在diff文本中的位置"""
+    start: int
+    end: int
+    added_lines: int = 0
+    deleted_lines: int = 0
+
+
+@dataclass
+class FileEntry:
+    """单个文件的diff在diff文本中的位置（从 Index: 行开始）"""
+    path: str
+    start: int
+    end: int
+    header_end: int  # 文件头（Index/===/---/+++）结束位置，即第一个差异块的起点
+    hunks: List[HunkEntry] = field(default_factory=list)
+    added_lines: int = 0
+    deleted_lines: int = 0
+    binary: bool = False
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+@dataclass
+class DiffIndex:
+    """diff文本的结构化索引"""
+    text: str
+    files: List[FileEntry] = field(default_factory=list)
+    preamble_end: int = 0  # 第一个 Index: 行之前的内容
+    total_lines: int = 0
+    added_lines: int = 0
+    deleted_lines: int = 0
+
+    @classmethod
+    def parse(cls, text: str) -> 'DiffIndex':
+        """单次遍历diff文本建立索引"""
+        index = cls(text=text or "")
+        text = index.text
+        length = len(text)
+        current: Optional[FileEntry] = None
+        hunk: Optional[HunkEntry] = None
+        pos = 0
+        index.preamble_end = length
+
+        while pos < length:
+            newline = text.find('\n', pos)
+            line_end = length if newline == -1 else newline + 1
+            index.total_lines += 1
+            first = text[pos]
+
+            if first == 'I' and text.startswith('Index: ', pos):
+                if current is None:
+                    index.preamble_end = pos
+                else:
+                    index._close_file(current, hunk, pos)
+                current = FileEntry(path=text[pos + 7:line_end].strip(), start=pos,
+                                    end=length, header_end=line_end)
+                hunk = None
+            elif current is not None:
+                if first == '@' and text.startswith('@@', pos):
+                    if hunk is not None:
+                        hunk.end = pos
+                    hunk = HunkEntry(start=pos, end=line_end)
+                    current.hunks.append(hunk)
+                elif hunk is not None and first in ' +-\\\r\n':
+                    if first == '+':
+                        hunk.added_lines += 1
+                    elif first == '-':
+                        hunk.deleted_lines += 1
+                    hunk.end = line_end
+                else:
+                    # 属性变化、分隔线等非差异块内容
+                    if hunk is not None:
+                        hunk = None
+                    if first == 'C' and text.startswith('Cannot display', pos):
+                        current.binary = True
+                    elif first == 'B' and text.startswith('Binary files', pos):
+                        current.binary = True
+                    if not current.hunks:
+                        current.header_end = line_end
+
+            pos = line_end
+
+        if current is not None:
+            index._close_file(current, hunk, length)
+        return index
+
+    def _close_file(self, entry: FileEntry, hunk: Optional[HunkEntry], end: int):
+        entry.end = end
+        if hunk is not None and hunk.end > end:
+            hunk.end = end
+        for item in entry.hunks:
+            entry.added_lines += item.added_lines
+            entry.deleted_lines += item.deleted_lines
+        self.added_lines += entry.added_lines
+        self.deleted_lines += entry.deleted_lines
+        self.files.append(entry)
+
+    def preamble(self) -> str:
+        """第一个文件之前的内容"""
+        return self.text[:self.preamble_end]
+
+    def file_text(self, entry: FileEntry) -> str:
+        """单个文件的diff文本"""
+        return self.text[entry.start:entry.end]
+
+    def header_text(self, entry: FileEntry) -> str:
+        """单个文件的文件头"""
+        return self.text[entry.start:entry.header_end]
+
+    def hunk_text(self, hunk: HunkEntry) -> str:
+        """单个差异块的文本"""
+        return self.text[hunk.start:hunk.end]
+
+    def slice(self, start: int, end: int) -> str:
+        """按偏移切片原始diff文本"""
+        return self.text[start:end]
+
+
+def normalize_diff_path(path: str) -> str:
+    """统一路径格式：去掉首尾空白和开头的/，反斜杠转为/"""
+    return (path or '').strip().replace('\\', '/').lstrip('/')
+
+
+class DiffPathLookup:
+    """diff中 Index: 路径（相对仓库URL）与日志变更路径（相对仓库根）的查找表
+    
+    预先登记每个变更路径按目录边界的所有后缀，查找时只需常数次哈希查询，
+    过滤和分块的耗时与文件数量呈线性关系。
+    """
+
+    def __init__(self, changed_files: Iterable[Dict[str, str]]):
+        self._full: Dict[str, Dict[str, str]] = {}
+        self._suffixes: Dict[str, Dict[str, str]] = {}
+        for file_info in changed_files:
+            path = normalize_diff_path(file_info.get('path', ''))
+            if not path:
+                continue
+            self._full.setdefault(path, file_info)
+            self._suffixes.setdefault(path, file_info)
+            pos = path.find('/')
+            while pos != -1:
+                self._suffixes.setdefault(path[pos + 1:], file_info)
+                pos = path.find('/', pos + 1)
+
+    def find(self, diff_path: str) -> Optional[Dict[str, str]]:
+        """查找diff路径对应的变更文件信息，找不到时返回None"""
+        path = normalize_diff_path(diff_path)
+        if not path:
+            return None
+
+        # diff路径相对仓库URL，是变更路径的后缀
+        file_info = self._suffixes.get(path)
+        if file_info is not None:
+            return file_info
+
+        # diff路径比变更路径更长（diff的URL在变更路径之上）
+        pos = path.find('/')
+        while pos != -1:
+            file_info = self._full.get(path[pos + 1:])
+            if file_info is not None:
+                return file_info
+            pos = path.find('/', pos + 1)
+        return None
+
+    def __contains__(self, diff_path: str) -> bool:
+        return self.find(diff_path) is not None
@@ -0,0 +1,260 @@
+"""
+Diff精简模块
+发送给AI前在本地去掉不值得审查的变更：只有空白变化的差异块、只调整了导入语句顺序的差异块（如import排序），
+以及内容未变、只是换了位置的代码块（文件内移动、跨文件移动和重命名），替换为一行以 "\\ " 开头的说明
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from diff_index import DiffIndex, HunkEntry
+
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+
+# 缩进有语义的文件，比较时保留行首缩进
+INDENT_SENSITIVE_SUFFIXES = ('.py', '.yaml', '.yml', 'makefile', '.mk')
+
+# 导入语句：只有全部由这类行组成的差异块调整顺序才替换为说明，普通语句的顺序（如先释放后使用、加锁解锁）需要审查
+IMPORT_LINE_PATTERN = re.compile(
+    r'^\s*(?:import\s|from\s+\S+\s+import\s|#\s*include\s*[<"]|#\s*import\s*[<"]'
+    r'|using\s+(?:static\s+|namespace\s+)?[\w.:]+(?:\s*=\s*[\w.:<>]+)?\s*;'
+    r'|use\s+[\w:{}, *]+;|require(?:_once)?[\s(]'
+    r'|(?:local|const|let|var)\s+\w+\s*=\s*require\s*\(?)'
+)
+
+# 只有标点或简单收尾语句的行（如 "}"、"return 0;"、"else"）到处都有，不能作为判断代码块移动的依据
+TRIVIAL_LINE_PATTERN = re.compile(
+    r'^[\W_]*(?:(?:return(?:\s*(?:-?\d+|true|false|null|nullptr|None|nil|NULL))?'
+    r'|break|continue|pass|end|else)\b[\W_]*)?$'
+)
+
+# 说明行的前缀：unified diff 中以 "\" 开头的行是差异块内的附注（如 "\ No newline at end of file"）
+NOTE_PREFIX = "\\ [已省略] "
+
+
+@dataclass
+class MinimizeStats:
+    """一次精简的统计"""
+    whitespace_hunks: int = 0
+    reordered_hunks: int = 0
+    moved_blocks: int = 0
+    moved_lines: int = 0
+    original_size: int = 0
+    minimized_size: int = 0
+
+    @property
+    def saved_chars(self) -> int:
+        return self.original_size - self.minimized_size
+
+    @property
+    def changed(self) -> bool:
+        return self.minimized_size < self.original_size
+
+
+@dataclass
+class _Line:
+    marker: str  # ' ' / '+' / '-' / '\\'
+    text: str    # 含换行符的原始行
+    key: str     # 空白压缩后的内容，用于比较（缩进有语义的文件保留行首缩进）
+    path: str
+    line_no: int  # 删除行为旧文件行号，其余为新文件行号
+
+
+@dataclass
+class _Hunk:
+    entry: HunkEntry
+    header: str
+    lines: List[_Line] = field(default_factory=list)
+    note: Optional[str] = None  # 整个差异块被替换时的说明
+
+
+@dataclass
+class _MovedBlock:
+    lines: List[_Line]
+    note: str
+
+
+def _line_key(body: str, keep_indent: bool) -> str:
+    """去掉首尾空白并把连续空白压缩为一个空格；不删除行内空白，字符串中 "a b" 改为 "ab" 不算空白变化"""
+    key = ' '.join(body.split())
+    if keep_indent and key:
+        return body[:len(body) - len(body.lstrip())] + key
+    return key
+
+
+def _parse_hunk(index: DiffIndex, path: str, hunk: HunkEntry) -> _Hunk:
+    raw_lines = index.hunk_text(hunk).splitlines(keepends=True)
+    header = raw_lines[0]
+    match = HUNK_HEADER_PATTERN.match(header)
+    old_no, new_no = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+    keep_indent = path.lower().endswith(INDENT_SENSITIVE_SUFFIXES)
+
+    parsed = _Hunk(entry=hunk, header=header)
+    for raw in raw_lines[1:]:
+        marker = raw[:1] if raw[:1] in '+-\\' else ' '
+        if marker == '-':
+            parsed.lines.append(_Line(marker, raw, _line_key(raw[1:], keep_indent), path, old_no))
+            old_no += 1
+        elif marker == '+':
+            parsed.lines.append(_Line(marker, raw, _line_key(raw[1:], keep_indent), path, new_no))
+            new_no += 1
+        else:
+            parsed.lines.append(_Line(marker, raw, '', path, new_no))
+            if marker == ' ':
+                old_no += 1
+                new_no += 1
+    return parsed
+
+
+def _is_import_line(line: _Line) -> bool:
+    body = line.text[1:]
+    return not body.strip() or IMPORT_LINE_PATTERN.match(body) is not None
+
+
+def _collapse_hunk(hunk: _Hunk, stats: MinimizeStats):
+    """只有空白变化或只调整了导入语句顺序的差异块替换为说明"""
+    changed = [line for line in hunk.lines if line.marker in '+-']
+    removed = [line.key for line in changed if line.marker == '-']
+    added = [line.key for line in changed if line.marker == '+']
+    if not removed or not added:
+        return
+    if removed == added:
+        hunk.note = f"仅空白变化（-{len(removed)}/+{len(added)} 行）"
+        stats.whitespace_hunks += 1
+    elif (len(removed) > 1 and sorted(removed) == sorted(added)
+          and all(_is_import_line(line) for line in changed)):
+        hunk.note = f"仅调整导入语句顺序（{len(removed)} 行，内容未变）"
+        stats.reordered_hunks += 1
+
+
+def _is_trivial_line(line: _Line) -> bool:
+    return TRIVIAL_LINE_PATTERN.match(line.key) is not None
+
+
+def _runs(hunks: List[_Hunk], marker: str) -> List[Tuple[Tuple[int, int], List[_Line]]]:
+    """连续的删除行或新增行，附带所在的修改区域 (差异块序号, 区域序号)
+
+    同一修改区域（两段上下文行之间）的删除行和新增行是原地替换，而不是移动。
+    """
+    runs = []
+    for hunk_no, hunk in enumerate(hunks):
+        if hunk.note is not None:
+            continue
+        region = 0
+        run: List[_Line] = []
+        for line in hunk.lines:
+            if line.marker == marker:
+                run.append(line)
+            elif line.marker != '\\':
+                if run:
+                    runs.append(((hunk_no, region), run))
+                run = []
+                if line.marker == ' ':
+                    region += 1
+        if run:
+            runs.append(((hunk_no, region), run))
+    return runs
+
+
+def _find_moved_blocks(hunks: List[_Hunk], min_lines: int,
+                       stats: MinimizeStats) -> Dict[int, _MovedBlock]:
+    """按连续 min_lines 行的哈希匹配删除行和新增行，返回 {块首行id: 移动块}
+
+    只由标点或简单收尾语句组成的行不计入 min_lines，同一修改区域内的删除和新增不视为移动。
+    """
+    removed_runs = _runs(hunks, '-')
+    added_runs = _runs(hunks, '+')
+    windows: Dict[Tuple[str, ...], List[Tuple[int, int]]] = {}
+    for run_i, (_, run) in enumerate(added_runs):
+        for j in range(len(run) - min_lines + 1):
+            key = tuple(line.key for line in run[j:j + min_lines])
+            windows.setdefault(key, []).append((run_i, j))
+
+    used = set()
+    blocks: Dict[int, _MovedBlock] = {}
+    for region, run in removed_runs:
+        i = 0
+        while i <= len(run) - min_lines:
+            key = tuple(line.key for line in run[i:i + min_lines])
+            match = None
+            for run_j, j in windows.get(key, ()):
+                added_region, added = added_runs[run_j]
+                if added_region == region or id(added[j]) in used:
+                    continue
+                # 向后延伸到内容不再相同为止
+                length = min_lines
+                while (i + length < len(run) and j + length < len(added)
+                       and run[i + length].key == added[j + length].key
+                       and id(added[j + length]) not in used):
+                    length += 1
+                if sum(1 for line in run[i:i + length] if not _is_trivial_line(line)) >= min_lines:
+                    match = (added[j:j + length], length)
+                    break
+            if match is None:
+                i += 1
+                continue
+
+            added_block, length = match
+            removed_block = run[i:i + length]
+            used.update(id(line) for line in added_block)
+            source, target = removed_block[0], added_block[0]
+            target_at = f"第 {target.line_no} 行附近" if target.path == source.path \
+                else f" {target.path} 第 {target.line_no} 行附近"
+            source_at = f"原第 {source.line_no} 行附近" if target.path == source.path \
+                else f" {source.path} 原第 {source.line_no} 行附近"
+            blocks[id(source)] = _MovedBlock(removed_block, f"{length} 行移动到{target_at}（内容未变）")
+            blocks[id(target)] = _MovedBlock(added_block, f"{length} 行从{source_at}移动到此处（内容未变）")
+            stats.moved_blocks += 1
+            stats.moved_lines += length
+            i += length
+    return blocks
+
+
+def _render_hunk(hunk: _Hunk, blocks: Dict[int, _MovedBlock], skipped: set) -> str:
+    if hunk.note is not None:
+        return f"{hunk.header}{NOTE_PREFIX}{hunk.note}\n"
+    parts = [hunk.header]
+    for line in hunk.lines:
+        block = blocks.get(id(line))
+        if block is not None:
+            parts.append(f"{NOTE_PREFIX}{block.note}\n")
+            skipped.update(id(item) for item in block.lines)
+        elif id(line) not in skipped:
+            parts.append(line.text)
+    return ''.join(parts)
+
+
+def minimize_diff(diff_content: str, min_moved_lines: int = 3,
+                  index: DiffIndex = None) -> Tuple[str, MinimizeStats]:
+    """精简diff文本，返回 (精简后的diff, 统计)；文件头、属性变化等差异块以外的内容保持不变"""
+    stats = MinimizeStats(original_size=len(diff_content or ''),
+                          minimized_size=len(diff_content or ''))
+    if not diff_content:
+        return diff_content, stats
+    index = index or DiffIndex.parse(diff_content)
+
+    hunks: List[_Hunk] = []
+    for entry in index.files:
+        for hunk in entry.hunks:
+            parsed = _parse_hunk(index, entry.path, hunk)
+            _collapse_hunk(parsed, stats)
+            hunks.append(parsed)
+
+    blocks = _find_moved_blocks(hunks, max(1, min_moved_lines), stats)
+    if not blocks and not stats.whitespace_hunks and not stats.reordered_hunks:
+        return diff_content, stats
+
+    parts = []
+    pos = 0
+    skipped: set = set()
+    for hunk in hunks:
+        parts.append(index.slice(pos, hunk.entry.start))
+        parts.append(_render_hunk(hunk, blocks, skipped))
+        pos = hunk.entry.end
+    parts.append(index.slice(pos, len(index.text)))
+
+    minimized = ''.join(parts)
+    stats.minimized_size = len(minimized)
+    return minimized, stats
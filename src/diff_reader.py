@@ -0,0 +1,435 @@
+"""
+流式diff读取模块
+通过管道逐行读取 svn diff 输出，边读边按文件和总量字节预算截断，避免超大提交占满内存
+"""
+
+import asyncio
+import logging
+import subprocess
+import threading
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class DiffReadResult:
+    """流式读取diff的结果"""
+    content: str = ""
+    success: bool = False
+    truncated: bool = False  # 是否因预算截断（单文件或总量）
+    bytes_read: int = 0  # 实际从svn读取的字节数
+    truncated_files: List[str] = field(default_factory=list)
+    error: str = ""
+    fallback: bool = False  # 是否已改用回退命令（不带额外参数的完整diff或逐个文件diff）
+
+
+class StreamingDiffReader:
+    """按 Index: 边界解析的流式diff读取器"""
+
+    FILE_TRUNCATED_NOTE = "... (该文件diff超出单文件预算 {limit:,} 字节，已截断) ...\n"
+    TOTAL_TRUNCATED_NOTE = "... (diff超出总预算 {limit:,} 字节，后续内容已省略) ...\n"
+
+    def __init__(self, max_total_bytes: int = 2000000, max_file_bytes: int = 200000,
+                 timeout: int = 120, diff_options: List[str] = None):
+        self.max_total_bytes = max_total_bytes
+        self.max_file_bytes = max_file_bytes
+        self.timeout = timeout
+        self.diff_options = list(diff_options or [])
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config) -> 'StreamingDiffReader':
+        """根据配置创建读取器"""
+        return cls(
+            max_total_bytes=config.get('svn.diff_max_total_bytes', 2000000),
+            max_file_bytes=config.get('svn.diff_max_file_bytes', 200000),
+            timeout=config.get('svn.diff_timeout', 120),
+            diff_options=build_diff_options_from_config(config)
+        )
+
+    def cache_options(self, include_diff_options: bool = True) -> List[str]:
+        """参与diff缓存键的预算和diff参数，配置变化后不会命中旧的结果"""
+        options = [f'max_total_bytes={self.max_total_bytes}',
+                   f'max_file_bytes={self.max_file_bytes}']
+        if include_diff_options:
+            options.extend(self.diff_options)
+        return options
+
+    def read_all(self, commands: List[List[str]]) -> DiffReadResult:
+        """依次执行多条diff命令并拼接输出，总预算在各命令间共享"""
+        merged = DiffReadResult(success=True)
+        parts = []
+        used_bytes = 0
+
+        for command in commands:
+            remaining = self.max_total_bytes - used_bytes
+            if remaining <= 0:
+                merged.truncated = True
+                break
+
+            result = self.read(command, max_total_bytes=remaining)
+            if not result.success:
+                return result
+
+            parts.append(result.content)
+            used_bytes += len(result.content.encode('utf-8'))
+            merged.bytes_read += result.bytes_read
+            merged.truncated = merged.truncated or result.truncated
+            merged.truncated_files.extend(result.truncated_files)
+
+        merged.content = ''.join(parts)
+        return merged
+
+    def read_with_fallback(self, commands: List[List[str]],
+                           fallback_commands: Optional[List[List[str]]] = None) -> DiffReadResult:
+        """执行diff命令；失败且提供了 fallback_commands 时改用回退命令重试
+
+        较旧的svn客户端或服务端不支持 -x、--ignore-properties、--no-diff-* 等参数时，仍能取得diff。
+        回退命令通常是不带额外参数的完整diff，复制提交为逐个文件diff（见 build_file_diff_commands）。
+        """
+        result = self.read_all(commands)
+        if result.success or not fallback_commands:
+            return result
+
+        self.logger.warning(f"获取diff失败，改用回退命令: {result.error.strip()}")
+        result = self.read_all(fallback_commands)
+        result.fallback = True
+        return result
+
+    def read(self, command: List[str], max_total_bytes: int = None) -> DiffReadResult:
+        """执行diff命令并流式读取输出"""
+        result = DiffReadResult()
+        if max_total_bytes is None:
+            max_total_bytes = self.max_total_bytes
+
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        except Exception as e:
+            result.error = f"启动SVN命令失败: {e}"
+            return result
+
+        # 后台读取stderr，避免管道写满导致svn阻塞
+        stderr_chunks = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()),
+            daemon=True
+        )
+        stderr_thread.start()
+
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(self.timeout, on_timeout)
+        timer.start()
+
+        collector = _DiffCollector(self, result, max_total_bytes)
+        killed = False
+
+        try:
+            for line in process.stdout:
+                if not collector.feed(line):
+                    # 已超出审查预算，不再继续下载剩余diff
+                    process.kill()
+                    killed = True
+                    break
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            timer.cancel()
+            stderr_thread.join(timeout=5)
+
+        if timed_out.is_set():
+            result.error = f"SVN命令执行超时 ({self.timeout}秒)"
+            return result
+
+        stderr = b''.join(chunk for chunk in stderr_chunks if chunk)
+        if returncode != 0 and not killed:
+            result.error = stderr.decode('utf-8', errors='replace')
+            return result
+
+        collector.finish()
+        return result
+
+    async def read_all_async(self, commands: List[List[str]]) -> DiffReadResult:
+        """read_all 的asyncio版本"""
+        merged = DiffReadResult(success=True)
+        parts = []
+        used_bytes = 0
+
+        for command in commands:
+            remaining = self.max_total_bytes - used_bytes
+            if remaining <= 0:
+                merged.truncated = True
+                break
+
+            result = await self.read_async(command, max_total_bytes=remaining)
+            if not result.success:
+                return result
+
+            parts.append(result.content)
+            used_bytes += len(result.content.encode('utf-8'))
+            merged.bytes_read += result.bytes_read
+            merged.truncated = merged.truncated or result.truncated
+            merged.truncated_files.extend(result.truncated_files)
+
+        merged.content = ''.join(parts)
+        return merged
+
+    async def read_with_fallback_async(self, commands: List[List[str]],
+                                       fallback_commands: Optional[List[List[str]]] = None) -> DiffReadResult:
+        """read_with_fallback 的asyncio版本"""
+        result = await self.read_all_async(commands)
+        if result.success or not fallback_commands:
+            return result
+
+        self.logger.warning(f"获取diff失败，改用回退命令: {result.error.strip()}")
+        result = await self.read_all_async(fallback_commands)
+        result.fallback = True
+        return result
+
+    async def read_async(self, command: List[str], max_total_bytes: int = None) -> DiffReadResult:
+        """read 的asyncio版本：通过 asyncio.create_subprocess_exec 流式读取，不占用线程"""
+        result = DiffReadResult()
+        if max_total_bytes is None:
+            max_total_bytes = self.max_total_bytes
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                limit=max(self.max_file_bytes, 1024 * 1024))
+        except Exception as e:
+            result.error = f"启动SVN命令失败: {e}"
+            return result
+
+        # 并发读取stderr，避免管道写满导致svn阻塞
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        collector = _DiffCollector(self, result, max_total_bytes)
+        killed = False
+
+        async def consume():
+            nonlocal killed
+            while True:
+                try:
+                    line = await process.stdout.readline()
+                except ValueError:
+                    # 单行超出缓冲上限（必然超出单文件预算），该行已被丢弃，剩余部分随后按截断处理
+                    collector.truncate_current_file()
+                    continue
+                if not line:
+                    break
+                if not collector.feed(line):
+                    process.kill()
+                    killed = True
+                    break
+
+        try:
+            await asyncio.wait_for(consume(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            stderr_task.cancel()
+            result.error = f"SVN命令执行超时 ({self.timeout}秒)"
+            return result
+
+        returncode = await process.wait()
+        try:
+            stderr = await asyncio.wait_for(stderr_task, timeout=5)
+        except asyncio.TimeoutError:
+            stderr = b''
+
+        if returncode != 0 and not killed:
+            result.error = stderr.decode('utf-8', errors='replace')
+            return result
+
+        collector.finish()
+        return result
+
+
+class _DiffCollector:
+    """按 Index: 边界累计字节数，超出单文件预算丢弃该文件剩余内容，超出总预算时通知调用方停止读取"""
+
+    def __init__(self, reader: StreamingDiffReader, result: DiffReadResult, max_total_bytes: int):
+        self.reader = reader
+        self.result = result
+        self.max_total_bytes = max_total_bytes
+        self.kept = []
+        self.kept_bytes = 0
+        self.file_bytes = 0
+        self.file_truncated = False
+        self.current_file = None
+
+    def feed(self, line: bytes) -> bool:
+        """处理一行输出，超出总预算时返回False"""
+        result = self.result
+        result.bytes_read += len(line)
+
+        if line.startswith(b'Index: '):
+            self.current_file = line[7:].strip().decode('utf-8', errors='replace')
+            self.file_bytes = 0
+            self.file_truncated = False
+
+        if self.file_truncated:
+            return True
+
+        if self.kept_bytes + len(line) > self.max_total_bytes:
+            self.kept.append(self.reader.TOTAL_TRUNCATED_NOTE.format(
+                limit=self.reader.max_total_bytes).encode('utf-8'))
+            result.truncated = True
+            return False
+
+        if self.file_bytes + len(line) > self.reader.max_file_bytes:
+            self.truncate_current_file()
+            return True
+
+        self.kept.append(line)
+        self.kept_bytes += len(line)
+        self.file_bytes += len(line)
+        return True
+
+    def truncate_current_file(self):
+        """丢弃当前文件的剩余内容"""
+        if self.file_truncated:
+            return
+        self.kept.append(self.reader.FILE_TRUNCATED_NOTE.format(
+            limit=self.reader.max_file_bytes).encode('utf-8'))
+        self.file_truncated = True
+        self.result.truncated = True
+        if self.current_file:
+            self.result.truncated_files.append(self.current_file)
+
+    def finish(self):
+        """生成最终内容"""
+        # 与文本模式一致，统一换行符
+        self.result.content = b''.join(self.kept).decode('utf-8', errors='replace').replace('\r\n', '\n')
+        self.result.success = True
+
+        if self.result.truncated:
+            self.reader.logger.info(f"diff已按预算截断: 保留 {self.kept_bytes:,} 字节，"
+                                    f"截断文件 {len(self.result.truncated_files)} 个")
+
+
+def build_diff_options(ignore_whitespace: bool = False, ignore_space_change: bool = False,
+                       ignore_eol_style: bool = False, ignore_properties: bool = False,
+                       no_diff_deleted: bool = False, no_diff_added: bool = False,
+                       context_lines: Optional[int] = None) -> List[str]:
+    """构建缩减diff体积的 svn diff 参数"""
+    extensions = []
+    if ignore_whitespace:
+        extensions.append('-w')
+    elif ignore_space_change:
+        extensions.append('-b')
+    if ignore_eol_style:
+        extensions.append('--ignore-eol-style')
+    if context_lines is not None:
+        extensions.append(f'-U{int(context_lines)}')
+
+    options = []
+    if extensions:
+        options.extend(['-x', ' '.join(extensions)])
+    if ignore_properties:
+        options.append('--ignore-properties')
+    if no_diff_deleted:
+        options.append('--no-diff-deleted')
+    if no_diff_added:
+        options.append('--no-diff-added')
+    return options
+
+
+def build_diff_options_from_config(config) -> List[str]:
+    """根据 svn.diff_options 配置构建 svn diff 参数"""
+    diff_options = config.get('svn.diff_options', {}) or {}
+    return build_diff_options(
+        ignore_whitespace=diff_options.get('ignore_whitespace', False),
+        ignore_space_change=diff_options.get('ignore_space_change', False),
+        ignore_eol_style=diff_options.get('ignore_eol_style', False),
+        ignore_properties=diff_options.get('ignore_properties', False),
+        no_diff_deleted=diff_options.get('no_diff_deleted', False),
+        no_diff_added=diff_options.get('no_diff_added', False),
+        context_lines=diff_options.get('context_lines')
+    )
+
+
+def scope_diff_targets(changed_files: List[Dict[str, str]], repository_url: str,
+                       repository_root: Optional[str], file_filter=None) -> Optional[List[str]]:
+    """计算需要diff的文件路径（相对repository_url）
+    
+    只保留仓库URL之下、通过扩展名过滤的文件，目录和被排除的文件不会被下载。
+    无法确定仓库根URL时返回None，表示需要对整个repository_url做diff。
+    """
+    if not repository_root or not repository_url.startswith(repository_root):
+        return None
+
+    # 日志中的变更路径相对于仓库根，这里换算成相对于repository_url的路径
+    url_prefix = urllib.parse.unquote(repository_url[len(repository_root):]).rstrip('/')
+
+    targets = []
+    for file_info in changed_files:
+        path = file_info.get('path') or ''
+        if file_info.get('kind', 'file') == 'dir':
+            continue
+        if not path.startswith(url_prefix + '/'):
+            continue
+        if file_filter is not None and not file_filter.is_reviewable(path):
+            continue
+
+        relative_path = path[len(url_prefix) + 1:]
+        # 路径中含有@时需要追加@，避免被svn当作peg版本
+        if '@' in relative_path:
+            relative_path += '@'
+        targets.append(relative_path)
+
+    return sorted(set(targets))
+
+
+def build_diff_commands(repository_url: str, revision: str,
+                        targets: Optional[List[str]] = None,
+                        max_command_chars: int = 6000,
+                        diff_options: List[str] = None) -> List[List[str]]:
+    """构建diff命令参数（不含svn和认证参数）
+    
+    targets为None时对整个repository_url做diff；否则使用 --old/--new 形式只diff指定路径，
+    并按命令行长度分组，避免超出系统命令行长度限制。
+    """
+    options = list(diff_options or [])
+    if targets is None:
+        return [['diff'] + options + [repository_url, f'-c{revision}']]
+
+    base = ['diff'] + options + [
+            f'--old={repository_url}@{int(revision) - 1}',
+            f'--new={repository_url}@{revision}']
+
+    commands = []
+    group = []
+    group_chars = 0
+    for target in targets:
+        if group and group_chars + len(target) + 1 > max_command_chars:
+            commands.append(base + group)
+            group = []
+            group_chars = 0
+        group.append(target)
+        group_chars += len(target) + 1
+
+    if group:
+        commands.append(base + group)
+    return commands
+
+
+def build_file_diff_commands(repository_url: str, revision: str,
+                             targets: List[str]) -> List[List[str]]:
+    """为每个文件构建 svn diff -c 命令（不含svn和认证参数）
+
+    带修改的复制提交按路径diff失败时（如复制得到的文件在上一版本不存在）的回退方式：
+    逐个文件diff只下载真实修改，完整diff会下载整个复制的目录树。
+    """
+    base_url = repository_url.rstrip('/')
+    commands = []
+    for target in targets:
+        # scope_diff_targets 为含@的路径追加的@在URL编码后不再需要
+        path = target[:-1] if target.endswith('@') and '@' in target[:-1] else target
+        commands.append(['diff', f"{base_url}/{urllib.parse.quote(path)}", f'-c{revision}'])
+    return commands
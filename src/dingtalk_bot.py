@@ -11,9 +11,10 @@ import hashlib
 import base64
 import urllib.parse
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from config_manager import config
+from http_client import HttpRequestError, get_http_transport
 from ai_reviewer import ReviewResult
 from svn_monitor import SVNCommit
 
@@ -23,6 +24,9 @@ class DingTalkBot:
         self.webhook_url = config.get('dingtalk.webhook_url')
         self.secret = config.get('dingtalk.secret')
         self.at_all = config.get('dingtalk.at_all', False)
+        # 与AI接口共用的连接池化HTTP传输层，分段消息复用同一连接
+        self.http = get_http_transport(config)
+        self.request_timeout = config.get('dingtalk.request_timeout', 10)  # 读取超时（秒）
         self.logger = logging.getLogger(__name__)
     
     def send_review_notification(
@@ -32,24 +36,64 @@ class DingTalkBot:
     ) -> bool:
         """发送代码审查通知"""
         try:
-            # 构建消息内容
-            message = self._build_review_message(commit, review_result)
-            
-            # 检查消息长度并分割
-            max_length = config.get('dingtalk.message_settings.max_message_length', 3000)
-            enable_split = config.get('dingtalk.message_settings.enable_message_split', True)
-            
-            if enable_split and len(message) > max_length:
-                return self._send_split_messages(commit, review_result, message)
-            else:
-                # 构建@用户列表
-                at_users = self._get_at_users(commit)
-                return self._send_message(message, at_users)
+            messages = self._build_notification_messages(commit, review_result)
+            results = [self._send_message(message, at_users) for message, at_users in messages]
+            return all(results)
             
         except Exception as e:
             self.logger.error(f"发送钉钉通知失败: {e}")
             return False
     
+    async def send_review_notification_async(
+        self,
+        commit: SVNCommit,
+        review_result: ReviewResult,
+        http
+    ) -> bool:
+        """send_review_notification 的asyncio版本，http 为 AsyncHttpTransport"""
+        try:
+            messages = self._build_notification_messages(commit, review_result)
+            # 分段消息按顺序发送，保证群内阅读顺序
+            results = []
+            for message, at_users in messages:
+                results.append(await self._send_message_async(http, message, at_users))
+            return all(results)
+        
+        except Exception as e:
+            self.logger.error(f"发送钉钉通知失败: {e}")
+            return False
+    
+    def _build_notification_messages(
+        self,
+        commit: SVNCommit,
+        review_result: ReviewResult
+    ) -> List[Tuple[str, Optional[List[str]]]]:
+        """构建要发送的消息列表 [(消息内容, @用户列表)]，超长时分割为多条"""
+        # 构建消息内容
+        message = self._build_review_message(commit, review_result)
+        
+        # 检查消息长度并分割
+        max_length = config.get('dingtalk.message_settings.max_message_length', 3000)
+        enable_split = config.get('dingtalk.message_settings.enable_message_split', True)
+        
+        # 构建@用户列表
+        at_users = self._get_at_users(commit)
+        if not (enable_split and len(message) > max_length):
+            return [(message, at_users)]
+        
+        # 第一条消息：基本信息和总结
+        messages = [(self._build_basic_info_message(commit, review_result), at_users)]
+        
+        # 第二条消息：详细评论
+        if review_result.detailed_comments:
+            messages.append((self._build_comments_message(review_result), None))
+        
+        # 第三条消息：建议和风险
+        suggestions_risks_msg = self._build_suggestions_risks_message(review_result)
+        if suggestions_risks_msg.strip():
+            messages.append((suggestions_risks_msg, None))
+        return messages
+    
     def _build_review_message(
         self, 
         commit: SVNCommit, 
@@ -84,6 +128,10 @@ class DingTalkBot:
             "",
         ]
         
+        # 复用的审查结果
+        if review_result.reused_from:
+            message_parts.extend([self._reuse_note(review_result), ""])
+        
         # 添加总结
         if review_result.summary:
             message_parts.extend([
@@ -161,40 +209,6 @@ class DingTalkBot:
         
         return "\n".join(message_parts)
     
-    def _send_split_messages(
-        self, 
-        commit: SVNCommit, 
-        review_result: ReviewResult,
-        full_message: str
-    ) -> bool:
-        """分割长消息并分批发送"""
-        try:
-            at_users = self._get_at_users(commit)
-            
-            # 第一条消息：基本信息和总结
-            basic_info = self._build_basic_info_message(commit, review_result)
-            success1 = self._send_message(basic_info, at_users)
-            
-            # 第二条消息：详细评论
-            if review_result.detailed_comments:
-                comments_msg = self._build_comments_message(review_result)
-                success2 = self._send_message(comments_msg)
-            else:
-                success2 = True
-            
-            # 第三条消息：建议和风险
-            suggestions_risks_msg = self._build_suggestions_risks_message(review_result)
-            if suggestions_risks_msg.strip():
-                success3 = self._send_message(suggestions_risks_msg)
-            else:
-                success3 = True
-            
-            return success1 and success2 and success3
-            
-        except Exception as e:
-            self.logger.error(f"分割消息发送失败: {e}")
-            return False
-    
     def _build_basic_info_message(
         self, 
         commit: SVNCommit, 
@@ -228,6 +242,10 @@ class DingTalkBot:
             "",
         ]
         
+        # 复用的审查结果
+        if review_result.reused_from:
+            message_parts.extend([self._reuse_note(review_result), ""])
+        
         # 添加总结
         if review_result.summary:
             message_parts.extend([
@@ -254,6 +272,13 @@ class DingTalkBot:
         
         return "\n".join(message_parts)
     
+    def _reuse_note(self, review_result: ReviewResult) -> str:
+        """复用审查结果的说明：diff完全相同为“相同”，近似重复注明相似度"""
+        if review_result.reused_similarity is not None:
+            return (f"♻️ 变更内容与版本 `{review_result.reused_from}` 相似"
+                    f"（相似度 {review_result.reused_similarity:.0%}），复用其审查结果")
+        return f"♻️ 变更内容与版本 `{review_result.reused_from}` 相同，复用其审查结果"
+    
     def _build_comments_message(self, review_result: ReviewResult) -> str:
         """构建详细评论消息"""
         message_parts = [
@@ -342,9 +367,55 @@ class DingTalkBot:
     
     def _send_message(self, message: str, at_users: List[str] = None) -> bool:
         """发送钉钉消息"""
+        request = self._build_message_request(message, at_users)
+        if request is None:
+            return False
+        url, data = request
+        
+        try:
+            # 重复发送会产生重复通知：只重试请求尚未发出的连接失败，不按状态码重试
+            response = self.http.post(
+                url,
+                read_timeout=self.request_timeout,
+                retry_statuses=(),
+                json=data,
+                headers={'Content-Type': 'application/json'}
+            )
+            return self._handle_send_response(response)
+                
+        except requests.RequestException as e:
+            self.logger.error(f"钉钉消息发送异常: {e}")
+            return False
+    
+    async def _send_message_async(self, http, message: str,
+                                  at_users: List[str] = None) -> bool:
+        """_send_message 的asyncio版本"""
+        request = self._build_message_request(message, at_users)
+        if request is None:
+            return False
+        url, data = request
+        
+        try:
+            # 重复发送会产生重复通知：只重试请求尚未发出的连接失败，不按状态码重试
+            response = await http.post(
+                url,
+                read_timeout=self.request_timeout,
+                retry_statuses=(),
+                json=data,
+                headers={'Content-Type': 'application/json'}
+            )
+            return self._handle_send_response(response)
+        
+        except HttpRequestError as e:
+            self.logger.error(f"钉钉消息发送异常: {e}")
+            return False
+    
+    def _build_message_request(self, message: str,
+                               at_users: List[str] = None) -> Optional[Tuple[str, dict]]:
+        """构建Webhook地址和消息体，未配置Webhook时返回None"""
         if not self.webhook_url:
             self.logger.error("钉钉Webhook URL未配置")
-            return False
+            return None
         
         # 生成签名
         url = self.webhook_url
@@ -377,31 +448,22 @@ class DingTalkBot:
                 'isAtAll': self.at_all
             }
         }
-        
-        try:
-            response = requests.post(
-                url,
-                json=data,
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    self.logger.info("钉钉消息发送成功")
-                    return True
-                else:
-                    self.logger.error(f"钉钉消息发送失败: {result}")
-                    return False
+        return url, data
+    
+    def _handle_send_response(self, response) -> bool:
+        """检查钉钉API响应（requests.Response 或 AsyncResponse）"""
+        if response.status_code == 200:
+            result = response.json()
+            if result.get('errcode') == 0:
+                self.logger.info("钉钉消息发送成功")
+                return True
             else:
-                self.logger.error(
-                    f"钉钉API调用失败: {response.status_code} - {response.text}"
-                )
+                self.logger.error(f"钉钉消息发送失败: {result}")
                 return False
-                
-        except requests.RequestException as e:
-            self.logger.error(f"钉钉消息发送异常: {e}")
+        else:
+            self.logger.error(
+                f"钉钉API调用失败: {response.status_code} - {response.text}"
+            )
             return False
     
     def _generate_signed_url(self) -> str:
@@ -425,3 +487,8 @@ class DingTalkBot:
         """发送错误通知"""
         message = f"## ❌ 代码审查服务异常\n\n{error_message}"
         return self._send_message(message)
+    
+    async def send_error_notification_async(self, error_message: str, http) -> bool:
+        """send_error_notification 的asyncio版本"""
+        message = f"## ❌ 代码审查服务异常\n\n{error_message}"
+        return await self._send_message_async(http, message)
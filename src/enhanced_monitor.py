@@ -3,6 +3,7 @@ SVN主动触发监听器
 支持SVN post-commit hook和定时检查两种模式
 """
 
+import asyncio
 import os
 import sys
 import threading
@@ -22,6 +23,7 @@ from svn_monitor import SVNMonitor, SVNCommit
 from commit_tracker import EnhancedCommitTracker, CommitStatus
 from ai_reviewer import AIReviewer
 from dingtalk_bot import DingTalkBot
+from review_pipeline import AsyncReviewPipeline, PipelineHooks, async_engine_available
 
 
 class SVNWebhookHandler(BaseHTTPRequestHandler):
@@ -85,6 +87,31 @@ class SVNWebhookHandler(BaseHTTPRequestHandler):
         pass
 
 
+class _TrackerHooks(PipelineHooks):
+    """把异步流水线各阶段的结果写入commit_tracker，与 _process_single_commit 的状态流转一致"""
+    
+    def __init__(self, commit_tracker: EnhancedCommitTracker):
+        self.commit_tracker = commit_tracker
+    
+    def should_review(self, commit: SVNCommit) -> bool:
+        return self.commit_tracker.start_review(commit.revision)
+    
+    def review_finished(self, commit: SVNCommit, result, elapsed: float):
+        if result:
+            self.commit_tracker.complete_review(commit.revision, result.overall_score, elapsed)
+        else:
+            self.commit_tracker.fail_review(commit.revision, "AI审查失败")
+    
+    def notification_finished(self, commit: SVNCommit, result, success: bool):
+        if success:
+            self.commit_tracker.complete_notification(commit.revision)
+        else:
+            self.commit_tracker.fail_notification(commit.revision, "钉钉通知发送失败")
+    
+    def commit_failed(self, revision: str, error: str):
+        self.commit_tracker.fail_review(revision, error)
+
+
 class EnhancedSVNMonitor:
     """增强的SVN监控器"""
     
@@ -100,6 +127,11 @@ class EnhancedSVNMonitor:
         self.webhook_port = config.get('svn.webhook.port', 8080)
         self.check_interval = config.get('svn.check_interval', 300)
         self.max_retry_attempts = config.get('svn.max_retry_attempts', 3)
+        # 新提交使用asyncio流水线处理（需要aiohttp），否则每个提交一个线程
+        self.async_engine = config.get('pipeline.engine', 'thread') == 'async'
+        if self.async_engine and not async_engine_available():
+            self.logger.warning("未安装aiohttp，异步流水线不可用，使用线程处理")
+            self.async_engine = False
         
         # 运行状态
         self.running = False
@@ -216,6 +248,10 @@ class EnhancedSVNMonitor:
     
     def _check_for_new_commits(self):
         """检查新提交"""
+        if self.async_engine:
+            self._check_for_new_commits_async()
+            return
+        
         try:
             # 获取最新提交
             commits = self.svn_monitor.get_latest_commits()
@@ -233,10 +269,38 @@ class EnhancedSVNMonitor:
                             args=(commit,),
                             daemon=True
                         ).start()
+                
+                # 提交状态已由commit_tracker持久化跟踪和重试，释放SVNMonitor中的待处理标记
+                self.svn_monitor.mark_commit_processed(commit.revision)
                         
         except Exception as e:
             self.logger.error(f"检查新提交失败: {e}")
     
+    def _check_for_new_commits_async(self):
+        """使用asyncio流水线处理新提交，状态通过回调写入commit_tracker"""
+        try:
+            entries = self.svn_monitor.fetch_new_entries()
+            
+            new_entries = []
+            for entry, changed_files in entries:
+                if (not self.commit_tracker.is_processed(entry['revision']) and
+                        self.commit_tracker.add_detected_commit(
+                            entry['revision'], entry['author'], entry['message'])):
+                    new_entries.append((entry, changed_files))
+                
+                # 提交状态已由commit_tracker持久化跟踪和重试，释放SVNMonitor中的待处理标记
+                self.svn_monitor.mark_commit_processed(entry['revision'])
+            
+            if new_entries:
+                pipeline = AsyncReviewPipeline.from_config(
+                    config, self.svn_monitor, self.ai_reviewer, self.dingtalk_bot,
+                    notify_errors=False
+                )
+                asyncio.run(pipeline.run(new_entries, _TrackerHooks(self.commit_tracker)))
+                
+        except Exception as e:
+            self.logger.error(f"检查新提交失败: {e}")
+    
     def _get_commit_info(self, revision: str) -> Optional[SVNCommit]:
         """获取指定提交的信息"""
         try:
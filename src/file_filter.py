@@ -0,0 +1,48 @@
+"""
+文件过滤模块
+根据扩展名黑白名单判断文件是否需要审查，供SVN监控和AI审查共用
+"""
+
+import os
+from typing import Optional
+
+
+class FileFilter:
+    """按扩展名过滤非代码文件"""
+
+    def __init__(self, exclude_extensions=None, include_extensions=None, enabled: bool = True):
+        self.enabled = enabled
+        self.exclude_extensions = set(ext.lower() for ext in (exclude_extensions or []))
+        self.include_extensions = set(ext.lower() for ext in (include_extensions or []))
+
+    @classmethod
+    def from_config(cls, config) -> 'FileFilter':
+        """根据 batch_review.file_filters 配置创建过滤器"""
+        file_filters = config.get('batch_review.file_filters', {}) or {}
+        return cls(
+            exclude_extensions=file_filters.get('exclude_extensions', []),
+            include_extensions=file_filters.get('include_extensions', []),
+            enabled=file_filters.get('enable_file_filtering', True)
+        )
+
+    def get_exclude_reason(self, file_path: str) -> Optional[str]:
+        """返回文件被排除的原因，不排除时返回None"""
+        if not self.enabled:
+            return None
+
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+
+        # 检查排除列表
+        if ext in self.exclude_extensions:
+            return f'排除扩展名: {ext}'
+
+        # 检查包含列表（如果指定了包含列表）
+        if self.include_extensions and ext not in self.include_extensions:
+            return f'不在包含列表: {ext}'
+
+        return None
+
+    def is_reviewable(self, file_path: str) -> bool:
+        """文件是否需要审查"""
+        return self.get_exclude_reason(file_path) is None
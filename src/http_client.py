@@ -0,0 +1,348 @@
+"""
+HTTP传输模块
+AI接口和钉钉Webhook共用的连接池化HTTP客户端：持久会话、按主机的连接池、keep-alive、
+连接/读取分离的超时、抖动退避重试，以及每个请求的耗时回调；另提供供asyncio流水线使用的aiohttp版本
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import Callable, Collection, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+# 服务端尚未处理请求或明确要求稍后重试的状态码
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+@dataclass
+class RequestTiming:
+    """单次HTTP请求（含重试）的耗时信息"""
+    method: str
+    host: str
+    status_code: Optional[int]
+    elapsed: float  # 秒，含重试等待
+    attempts: int
+    error: str = ""
+
+
+class HttpRequestError(Exception):
+    """异步传输层的请求异常（连接失败等）"""
+
+
+class HttpTimeoutError(HttpRequestError):
+    """异步传输层的请求超时"""
+
+
+def _connect_failed(error: requests.ConnectionError) -> bool:
+    """是否为建立连接阶段的失败（连接超时、拒绝连接、DNS解析失败），此时请求尚未发出"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class _TransportBase:
+    """同步/异步传输层共用的超时、重试和耗时回调"""
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 60,
+                 max_retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 10):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.logger = logging.getLogger(__name__)
+        self._timing_hooks: List[Callable[[RequestTiming], None]] = []
+
+    @staticmethod
+    def _config_kwargs(config) -> dict:
+        return {
+            'connect_timeout': config.get('http.connect_timeout', 5),
+            'read_timeout': config.get('http.read_timeout', 60),
+            'max_retries': config.get('http.max_retries', 2),
+            'backoff_base': config.get('http.backoff_base', 0.5),
+            'backoff_max': config.get('http.backoff_max', 10)
+        }
+
+    def add_timing_hook(self, hook: Callable[[RequestTiming], None]):
+        """注册请求耗时回调"""
+        self._timing_hooks.append(hook)
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float], reason: str) -> float:
+        """指数退避加全抖动，服务端给出 Retry-After 时优先使用"""
+        if retry_after is not None:
+            delay = min(retry_after, self.backoff_max)
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+        self.logger.warning(f"{reason}，{delay:.2f}秒后第 {attempt} 次重试")
+        return delay
+
+    @staticmethod
+    def _parse_retry_after(headers) -> Optional[float]:
+        value = headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def _emit_timing(self, method: str, host: str, status_code: Optional[int],
+                     start_time: float, attempts: int, error: str = ""):
+        timing = RequestTiming(method=method, host=host, status_code=status_code,
+                               elapsed=time.time() - start_time, attempts=attempts, error=error)
+        self.logger.debug(f"{method} {host} -> {status_code or error} "
+                          f"({timing.elapsed:.2f}秒, {attempts} 次尝试)")
+        for hook in self._timing_hooks:
+            try:
+                hook(timing)
+            except Exception as e:
+                self.logger.warning(f"请求耗时回调异常: {e}")
+
+
+class HttpTransport(_TransportBase):
+    """基于 requests.Session 的共享HTTP传输层"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 16, **kwargs):
+        super().__init__(**kwargs)
+
+        # pool_connections 为缓存的主机连接池数量，pool_maxsize 为每个主机保持的连接数
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_config(cls, config) -> 'HttpTransport':
+        """根据 http 配置创建传输层"""
+        return cls(
+            pool_connections=config.get('http.pool_connections', 10),
+            pool_maxsize=config.get('http.pool_maxsize', 16),
+            **cls._config_kwargs(config)
+        )
+
+    def post(self, url: str, idempotent: bool = False, read_timeout: float = None,
+             retry_statuses: Collection[int] = RETRY_STATUS_CODES,
+             **kwargs) -> requests.Response:
+        """发送POST请求
+
+        建立连接失败（请求尚未发出）和 retry_statuses（默认 429/502/503/504）总会重试；
+        请求发出后连接断开或读取超时时请求可能已被处理，只有调用方声明重复发送无副作用（idempotent=True）时才重试。
+        自行处理限流或不能重复发送的调用方可以传入空的 retry_statuses，直接拿到这些响应。
+        其余参数透传给 requests，stream=True 时 read_timeout 为两次读取之间的最长间隔。
+        """
+        return self.request('POST', url, idempotent=idempotent, read_timeout=read_timeout,
+                            retry_statuses=retry_statuses, **kwargs)
+
+    def request(self, method: str, url: str, idempotent: bool = None,
+                read_timeout: float = None,
+                retry_statuses: Collection[int] = RETRY_STATUS_CODES,
+                **kwargs) -> requests.Response:
+        """发送请求，按需抖动退避重试，失败时抛出 requests 的异常"""
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+        timeout: Tuple[float, float] = (self.connect_timeout, read_timeout or self.read_timeout)
+        host = urllib.parse.urlsplit(url).netloc
+
+        start_time = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # 连接失败/连接超时，或连接池中的keep-alive连接已被代理关闭（请求可能已发出）
+                if (idempotent or _connect_failed(e)) and attempt <= self.max_retries:
+                    self._sleep_before_retry(attempt, None, f"{host} 连接失败: {e}")
+                    continue
+                self._emit_timing(method, host, None, start_time, attempt, str(e))
+                raise
+            except requests.Timeout as e:
+                if idempotent and attempt <= self.max_retries:
+                    self._sleep_before_retry(attempt, None, f"{host} 读取超时")
+                    continue
+                self._emit_timing(method, host, None, start_time, attempt, str(e))
+                raise
+
+            if response.status_code in retry_statuses and attempt <= self.max_retries:
+                retry_after = self._parse_retry_after(response.headers)
+                response.close()
+                self._sleep_before_retry(attempt, retry_after,
+                                         f"{host} 返回 {response.status_code}")
+                continue
+
+            self._emit_timing(method, host, response.status_code, start_time, attempt)
+            return response
+
+    def _sleep_before_retry(self, attempt: int, retry_after: Optional[float], reason: str):
+        time.sleep(self._retry_delay(attempt, retry_after, reason))
+
+    def close(self):
+        self.session.close()
+
+
+@dataclass
+class AsyncResponse:
+    """异步请求的响应（已读取完整响应体）"""
+    status_code: int
+    headers: dict
+    text: str
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncStreamResponse:
+    """流式请求的响应，响应体由调用方逐行读取，用完必须调用 close"""
+
+    def __init__(self, response, aiohttp):
+        self._response = response
+        self._aiohttp = aiohttp
+        self.status_code = response.status
+        self.headers = dict(response.headers)
+
+    async def iter_lines(self):
+        """逐行读取响应体（UTF-8解码，去掉换行符）；两次读取之间超过读取超时时抛出 HttpTimeoutError"""
+        try:
+            async for line in self._response.content:
+                yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+        except asyncio.TimeoutError as e:
+            raise HttpTimeoutError("流式响应读取超时") from e
+        except self._aiohttp.ClientError as e:
+            raise HttpRequestError(str(e)) from e
+
+    async def read(self) -> AsyncResponse:
+        """读取完整响应体并释放连接（用于错误响应）"""
+        try:
+            text = await self._response.text(errors='replace')
+        except asyncio.TimeoutError as e:
+            raise HttpTimeoutError("响应读取超时") from e
+        except self._aiohttp.ClientError as e:
+            raise HttpRequestError(str(e)) from e
+        finally:
+            self._response.release()
+        return AsyncResponse(self.status_code, self.headers, text)
+
+    def close(self):
+        # 响应体未读完时连接不会放回连接池
+        self._response.release()
+
+
+class AsyncHttpTransport(_TransportBase):
+    """基于 aiohttp 的异步HTTP传输层，与 HttpTransport 使用相同的超时和重试策略
+
+    需要在事件循环内创建和关闭；未安装 aiohttp 时创建会抛出 ImportError。
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 16,
+                 keepalive_timeout: float = 30, **kwargs):
+        super().__init__(**kwargs)
+        import aiohttp
+        self._aiohttp = aiohttp
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host,
+                                         keepalive_timeout=keepalive_timeout)
+        # trust_env: 与requests一致读取 HTTP(S)_PROXY 环境变量
+        self.session = aiohttp.ClientSession(connector=connector, trust_env=True)
+
+    @classmethod
+    def from_config(cls, config) -> 'AsyncHttpTransport':
+        """根据 http 配置创建异步传输层"""
+        return cls(
+            limit=config.get('http.async_limit', 100),
+            limit_per_host=config.get('http.pool_maxsize', 16),
+            **cls._config_kwargs(config)
+        )
+
+    async def post(self, url: str, idempotent: bool = False, read_timeout: float = None,
+                   retry_statuses: Collection[int] = RETRY_STATUS_CODES,
+                   stream: bool = False, **kwargs):
+        """发送POST请求，重试策略同 HttpTransport.post"""
+        return await self.request('POST', url, idempotent=idempotent, read_timeout=read_timeout,
+                                  retry_statuses=retry_statuses, stream=stream, **kwargs)
+
+    async def request(self, method: str, url: str, idempotent: bool = None,
+                      read_timeout: float = None,
+                      retry_statuses: Collection[int] = RETRY_STATUS_CODES,
+                      stream: bool = False, **kwargs):
+        """发送请求，失败时抛出 HttpTimeoutError / HttpRequestError
+
+        stream=True 时收到响应头即返回 AsyncStreamResponse，read_timeout 为两次读取之间的最长间隔。
+        """
+        aiohttp = self._aiohttp
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                        sock_read=read_timeout or self.read_timeout)
+        host = urllib.parse.urlsplit(url).netloc
+
+        start_time = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self.session.request(method, url, timeout=timeout, **kwargs)
+                if stream and not (response.status in retry_statuses and attempt <= self.max_retries):
+                    self._emit_timing(method, host, response.status, start_time, attempt)
+                    return AsyncStreamResponse(response, aiohttp)
+                try:
+                    text = await response.text(errors='replace')
+                finally:
+                    response.release()
+                result = AsyncResponse(response.status, dict(response.headers), text)
+            except asyncio.TimeoutError as e:
+                connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', None)  # aiohttp 3.10+
+                connecting = connect_timeout is not None and isinstance(e, connect_timeout)
+                if (idempotent or connecting) and attempt <= self.max_retries:
+                    await asyncio.sleep(self._retry_delay(attempt, None, f"{host} 请求超时"))
+                    continue
+                self._emit_timing(method, host, None, start_time, attempt, "timeout")
+                raise HttpTimeoutError(f"{host} 请求超时") from e
+            except aiohttp.ClientError as e:
+                # 连接失败，或连接池中的keep-alive连接已被代理关闭（请求可能已发出）
+                connecting = isinstance(e, aiohttp.ClientConnectorError)
+                if (isinstance(e, aiohttp.ClientConnectionError) and (idempotent or connecting)
+                        and attempt <= self.max_retries):
+                    await asyncio.sleep(self._retry_delay(attempt, None, f"{host} 连接失败: {e}"))
+                    continue
+                self._emit_timing(method, host, None, start_time, attempt, str(e))
+                raise HttpRequestError(str(e)) from e
+
+            if result.status_code in retry_statuses and attempt <= self.max_retries:
+                retry_after = self._parse_retry_after(result.headers)
+                await asyncio.sleep(self._retry_delay(attempt, retry_after,
+                                                      f"{host} 返回 {result.status_code}"))
+                continue
+
+            self._emit_timing(method, host, result.status_code, start_time, attempt)
+            return result
+
+    async def close(self):
+        await self.session.close()
+
+
+# 进程内共享的传输层实例
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_http_transport(config=None) -> HttpTransport:
+    """获取进程内共享的HTTP传输层，首次调用时按配置创建"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            if config is None:
+                from config_manager import get_config
+                config = get_config()
+            _transport = HttpTransport.from_config(config)
+        return _transport
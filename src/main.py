@@ -3,6 +3,7 @@ AI SVN代码审查工具主程序
 监控SVN提交，使用AI进行代码审查，并通过钉钉发送通知
 """
 
+import asyncio
 import logging
 import schedule
 import time
@@ -19,6 +20,7 @@ from svn_monitor import SVNMonitor
 from enhanced_monitor import EnhancedSVNMonitor
 from ai_reviewer import AIReviewer
 from dingtalk_bot import DingTalkBot
+from review_pipeline import AsyncReviewPipeline, PipelineHooks, async_engine_available
 
 
 def setup_logging():
@@ -55,23 +57,49 @@ def setup_logging():
     return logger
 
 
+class _MarkProcessedHooks(PipelineHooks):
+    """异步流水线回调：通知发送成功后标记提交为已处理"""
+    
+    def __init__(self, svn_monitor: SVNMonitor):
+        self.svn_monitor = svn_monitor
+    
+    def notification_finished(self, commit, result, success):
+        if success:
+            self.svn_monitor.mark_commit_processed(commit.revision)
+
+
+def process_new_commits_async():
+    """使用asyncio流水线处理新提交，diff下载、AI审查和通知在各阶段之间重叠执行"""
+    svn_monitor = SVNMonitor()
+    pipeline = AsyncReviewPipeline.from_config(
+        get_config(), svn_monitor, AIReviewer(), DingTalkBot()
+    )
+    asyncio.run(pipeline.process_new_commits(_MarkProcessedHooks(svn_monitor)))
+
+
 def process_new_commits():
     """处理新提交的核心逻辑"""
     logger = logging.getLogger(__name__)
     
     try:
-        # 初始化各个组件
-        svn_monitor = SVNMonitor()
-        ai_reviewer = AIReviewer()
-        dingtalk_bot = DingTalkBot()
+        if get_config().get('pipeline.engine', 'thread') == 'async':
+            if async_engine_available():
+                process_new_commits_async()
+                return
+            logger.warning("未安装aiohttp，异步流水线不可用，使用同步处理")
         
-        # 检查新提交
+        # 检查新提交（监控路径没有新提交时只执行一次轻量探测）
+        svn_monitor = SVNMonitor()
         new_commits = svn_monitor.check_new_commits()
         
         if not new_commits:
             logger.debug("没有新的提交需要处理")
             return
         
+        # 初始化审查和通知组件
+        ai_reviewer = AIReviewer()
+        dingtalk_bot = DingTalkBot()
+        
         # 处理每个新提交
         for commit in new_commits:
             logger.info(f"开始处理提交: {commit.revision} (作者: {commit.author})")
@@ -0,0 +1,264 @@
+"""
+AI接口限流模块
+进程内共享的自适应限流器：请求数/令牌数两个令牌桶对齐服务商的RPM/TPM配额，读取 Retry-After 和
+x-ratelimit-* 响应头暂停或校准，并按AIMD（加性增、乘性减）调整并发数，遇到 429/5xx 时减半、成功时逐步增加。
+监控、增强监控和批量审查共用同一个实例
+"""
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Mapping, Optional
+
+
+def is_overload_status(status_code: Optional[int]) -> bool:
+    """是否为需要降低并发的响应状态码（限流和服务端过载）"""
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+_DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """解析 x-ratelimit-reset-* 的时长（如 1s、6m0s、20ms、59.5），单位秒"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[str]:
+    """大小写不敏感地读取响应头（requests 的headers本身不区分大小写，AsyncResponse 为普通dict）"""
+    value = headers.get(name)
+    if value is None:
+        lower = name.lower()
+        for key, item in headers.items():
+            if key.lower() == lower:
+                return item
+    return value
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = _header(headers, name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充量；单次消耗可以超过容量（桶变为负值，之后的请求等待补足）"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10):
+        self.burst_seconds = burst_seconds
+        self.per_minute = 0.0
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(per_minute)
+        self.level = self.capacity
+
+    def set_rate(self, per_minute: float):
+        self._refill()
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * self.burst_seconds)
+        self.level = min(self.level, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """可以消耗amount前需要等待的秒数"""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def consume(self, amount: float):
+        if self.per_minute > 0:
+            self._refill()
+            self.level -= amount
+
+    def refund(self, amount: float):
+        if self.per_minute > 0:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class AdaptiveRateLimiter:
+    """RPM/TPM令牌桶 + AIMD并发控制"""
+
+    def __init__(self, max_concurrency: int = 8, min_concurrency: int = 1,
+                 requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 adaptive: bool = True, backoff_base: float = 1, backoff_max: float = 60,
+                 decrease_interval: float = 2.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.adaptive = adaptive
+        # 自适应时从最大并发的一半起步，成功后逐步增加
+        self.concurrency = float(max(self.min_concurrency, self.max_concurrency // 2)
+                                 if adaptive else self.max_concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # 配置了配额时以配置为准，否则采用响应头中的 x-ratelimit-limit-*
+        self._configured_rpm = requests_per_minute > 0
+        self._configured_tpm = tokens_per_minute > 0
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.decrease_interval = decrease_interval
+
+        self.in_flight = 0
+        self.blocked_until = 0.0  # time.monotonic()，Retry-After 或配额耗尽时暂停所有请求
+        self._consecutive_overloads = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config) -> 'AdaptiveRateLimiter':
+        """根据 ai.rate_limit 配置创建限流器，并发上限为 ai.max_concurrent_requests"""
+        return cls(
+            max_concurrency=config.get('ai.max_concurrent_requests', 8),
+            min_concurrency=config.get('ai.rate_limit.min_concurrency', 1),
+            requests_per_minute=config.get('ai.rate_limit.requests_per_minute', 0),
+            tokens_per_minute=config.get('ai.rate_limit.tokens_per_minute', 0),
+            adaptive=config.get('ai.rate_limit.adaptive', True),
+            backoff_base=config.get('ai.rate_limit.backoff_base', 1),
+            backoff_max=config.get('ai.rate_limit.backoff_max', 60)
+        )
+
+    def _try_acquire(self, tokens: float) -> float:
+        """尝试占用一个请求名额（调用方持有锁），成功返回0，否则返回建议等待的秒数（-1表示等待并发名额释放）"""
+        wait = max(self.blocked_until - time.monotonic(),
+                   self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+        if self.in_flight >= int(self.concurrency):
+            return -1
+        self.in_flight += 1
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+        return 0.0
+
+    def acquire(self, tokens: float = 0) -> float:
+        """阻塞直到可以发送请求，返回等待的秒数；之后必须调用 release"""
+        start = time.monotonic()
+        with self._lock:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return time.monotonic() - start
+                self._released.wait(timeout=min(wait, 1.0) if wait > 0 else 1.0)
+
+    async def acquire_async(self, tokens: float = 0) -> float:
+        """acquire 的asyncio版本"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                wait = self._try_acquire(tokens)
+            if wait == 0:
+                return time.monotonic() - start
+            await asyncio.sleep(min(wait, 1.0) if wait > 0 else 0.05)
+
+    def release(self, status_code: Optional[int] = None, headers: Mapping[str, str] = None):
+        """请求结束：释放名额，根据状态码调整并发，根据响应头校准配额或暂停"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if headers:
+                self._apply_headers(status_code, headers)
+            if is_overload_status(status_code):
+                self._on_overload(status_code)
+            elif status_code is not None and status_code < 400:
+                self._on_success()
+            self._released.notify_all()
+
+    def record_usage(self, estimated_tokens: float, actual_tokens: float):
+        """按实际用量修正令牌桶（预估包含完整的max_tokens，通常偏高）"""
+        if actual_tokens and estimated_tokens > actual_tokens:
+            with self._lock:
+                self.tokens.refund(estimated_tokens - actual_tokens)
+                self._released.notify_all()
+
+    def _on_success(self):
+        self._consecutive_overloads = 0
+        if self.adaptive and self.concurrency < self.max_concurrency:
+            # 加性增：大约每完成一轮并发请求增加1
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+
+    def _on_overload(self, status_code: int):
+        self._consecutive_overloads += 1
+        now = time.monotonic()
+        if self.adaptive and now - self._last_decrease >= self.decrease_interval:
+            # 乘性减：同一时间段内并发请求的多个失败只减一次
+            self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+            self._last_decrease = now
+            self.logger.warning(f"AI接口返回 {status_code}，并发数降为 {int(self.concurrency)}")
+
+        if self.blocked_until <= now:
+            # 没有 Retry-After 时按连续失败次数指数退避（带抖动），所有请求一起暂停
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (self._consecutive_overloads - 1)))
+            self.blocked_until = now + random.uniform(delay / 2, delay)
+
+    def _apply_headers(self, status_code: Optional[int], headers: Mapping[str, str]):
+        now = time.monotonic()
+
+        retry_after = _header_float(headers, 'retry-after-ms')
+        if retry_after is not None:
+            retry_after /= 1000
+        else:
+            retry_after = parse_reset_duration(_header(headers, 'Retry-After'))
+        if retry_after is not None and is_overload_status(status_code):
+            self.blocked_until = max(self.blocked_until, now + min(retry_after, self.backoff_max))
+            self.logger.warning(f"AI接口要求 {retry_after:.1f}秒后重试，暂停发送请求")
+
+        limit_requests = _header_float(headers, 'x-ratelimit-limit-requests')
+        if limit_requests and not self._configured_rpm and limit_requests != self.requests.per_minute:
+            self.requests.set_rate(limit_requests)
+            self.logger.info(f"按响应头校准请求配额: {limit_requests:.0f} 次/分钟")
+        limit_tokens = _header_float(headers, 'x-ratelimit-limit-tokens')
+        if limit_tokens and not self._configured_tpm and limit_tokens != self.tokens.per_minute:
+            self.tokens.set_rate(limit_tokens)
+            self.logger.info(f"按响应头校准令牌配额: {limit_tokens:.0f} tokens/分钟")
+
+        # 配额已耗尽时暂停到重置时间
+        for kind in ('requests', 'tokens'):
+            remaining = _header_float(headers, f'x-ratelimit-remaining-{kind}')
+            if remaining is not None and remaining <= 0:
+                reset = parse_reset_duration(_header(headers, f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, now + min(reset, self.backoff_max))
+
+
+# 进程内共享的限流器
+_limiter: Optional[AdaptiveRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config=None) -> AdaptiveRateLimiter:
+    """获取进程内共享的AI接口限流器，首次调用时按配置创建"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if config is None:
+                from config_manager import get_config
+                config = get_config()
+            _limiter = AdaptiveRateLimiter.from_config(config)
+        return _limiter
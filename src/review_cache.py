@@ -0,0 +1,197 @@
+"""
+审查结果缓存模块
+同一补丁经常多次提交（合并到发布分支、cherry-pick、回退后重新应用），按规范化后的diff内容哈希缓存审查结果，
+去掉版本号、分支前缀和空白差异后内容相同的diff直接复用已有结果，不再调用AI
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from diff_cache import evict_lru
+from diff_index import DiffIndex, FileEntry, normalize_diff_path
+
+
+# 分支目录前缀：trunk/、branches/<名称>/、tags/<名称>/ 及其之前的项目目录
+BRANCH_PREFIX_PATTERN = re.compile(r'^(?:.*?/)?(?:trunk|branches/[^/]+|tags/[^/]+)(?:/|$)')
+
+# 文件头和属性段中的版本号，如 (revision 123)、r123、r5-10
+REVISION_PATTERN = re.compile(r'\b(?:revision\s+\d+|r\d+(?:-\d+)?)\b')
+
+# svn:mergeinfo 属性段（合并记录随分支不同，不影响代码内容）
+MERGEINFO_PATTERN = re.compile(r'^(?:Added|Modified|Deleted): svn:mergeinfo\s*$')
+PROPERTY_PATTERN = re.compile(r'^(?:Added|Modified|Deleted|Name): ')
+
+
+def strip_branch_prefix(path: str) -> str:
+    """去掉路径中的分支目录前缀，trunk/src/a.c 和 branches/1.0/src/a.c 都得到 src/a.c"""
+    path = normalize_diff_path(path)
+    return BRANCH_PREFIX_PATTERN.sub('', path, count=1) or path
+
+
+def normalize_file_diff(index: DiffIndex, entry: FileEntry) -> str:
+    """规范化单个文件的diff：去掉文件头、@@ 行号、版本号和 svn:mergeinfo，空白压缩为单个空格
+
+    只有svn:mergeinfo等被去掉的内容时返回空字符串。
+    """
+    lines = []
+    in_mergeinfo = False
+    text = index.text
+    pos = entry.header_end
+    end = entry.end
+    hunk_bounds = [(hunk.start, hunk.end) for hunk in entry.hunks]
+    hunk_i = 0
+
+    while pos < end:
+        newline = text.find('\n', pos, end)
+        line_end = end if newline == -1 else newline + 1
+        line = text[pos:line_end]
+
+        while hunk_i < len(hunk_bounds) and hunk_bounds[hunk_i][1] <= pos:
+            hunk_i += 1
+        in_hunk = hunk_i < len(hunk_bounds) and hunk_bounds[hunk_i][0] <= pos
+
+        if in_hunk:
+            if line.startswith('@@'):
+                lines.append('@@')
+            else:
+                # 保留 +/-/空格 标记，行内空白压缩
+                body = ' '.join(line[1:].split())
+                if body or line[:1] in '+-':
+                    lines.append(line[:1] + body)
+        else:
+            stripped = line.strip()
+            if MERGEINFO_PATTERN.match(stripped):
+                in_mergeinfo = True
+            elif PROPERTY_PATTERN.match(stripped):
+                in_mergeinfo = False
+
+            if (not in_mergeinfo and stripped and not stripped.startswith('___')
+                    and not stripped.startswith('Property changes on:')):
+                lines.append(' '.join(REVISION_PATTERN.sub('', stripped).split()))
+        pos = line_end
+
+    return '\n'.join(lines)
+
+
+def file_digest(path: str, normalized_body: str) -> str:
+    """单个文件规范化diff的哈希（路径去掉分支前缀），没有可比较的内容时返回空字符串"""
+    if not normalized_body:
+        return ''
+    raw = f"{strip_branch_prefix(path)}\0{normalized_body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def diff_fingerprint(diff_content: str, index: DiffIndex = None) -> Optional[str]:
+    """规范化后的diff内容哈希，文件按去掉分支前缀后的路径排序；没有可比较的内容时返回None"""
+    if not diff_content:
+        return None
+    index = index or DiffIndex.parse(diff_content)
+
+    files = []
+    for entry in index.files:
+        body = normalize_file_diff(index, entry)
+        if body:
+            files.append((strip_branch_prefix(entry.path), body))
+    if not files:
+        return None
+
+    digest = hashlib.sha256()
+    for path, body in sorted(files):
+        digest.update(path.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(body.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """按规范化diff哈希缓存审查结果的磁盘缓存，超出容量时按最近访问时间淘汰（LRU）
+
+    缓存键包含版本标识（模型、提示词模板和系统提示词的哈希），任何一项变化后旧结果自动失效。
+    """
+
+    def __init__(self, cache_dir: str = "data/cache", max_size_mb: float = 50,
+                 enabled: bool = True, namespace: str = 'reviews'):
+        self.cache_dir = Path(cache_dir) / namespace
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, namespace: str = 'reviews') -> 'ReviewCache':
+        """根据配置创建缓存实例；namespace='file_reviews' 为分块审查的按文件评论缓存"""
+        enabled = config.get('data.review_cache.enabled', True)
+        if namespace == 'file_reviews':
+            enabled = enabled and config.get('data.review_cache.per_file', True)
+        return cls(
+            cache_dir=config.get('data.cache_dir', 'data/cache'),
+            max_size_mb=config.get('data.review_cache.max_size_mb', 50),
+            enabled=enabled,
+            namespace=namespace
+        )
+
+    @staticmethod
+    def make_version(*parts: str) -> str:
+        """根据模型、提示词模板、系统提示词等生成版本标识"""
+        raw = '\0'.join(str(part or '') for part in parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    def _entry_path(self, fingerprint: str, version: str) -> Path:
+        return self.cache_dir / f"{version}-{fingerprint}.json"
+
+    def get(self, fingerprint: Optional[str], version: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的审查结果，返回 {'revision': 原审查版本, 'result': 结果字段}，未命中返回None"""
+        if not self.enabled or not fingerprint:
+            return None
+
+        path = self._entry_path(fingerprint, version)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"读取审查结果缓存失败: {e}")
+            return None
+
+        # 更新访问时间，用于LRU淘汰
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, fingerprint: Optional[str], version: str, revision: str,
+            result: Dict[str, Any]):
+        """写入审查结果"""
+        if not self.enabled or not fingerprint:
+            return
+
+        path = self._entry_path(fingerprint, version)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        entry = {'revision': revision, 'created_at': time.time(), 'result': result}
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f"写入审查结果缓存失败 (版本 {revision}): {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            removed = evict_lru(self.cache_dir, '.json', self.max_size_bytes)
+        if removed:
+            self.logger.info(f"审查结果缓存超出容量，已淘汰 {removed} 个条目")
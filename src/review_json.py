@@ -0,0 +1,190 @@
+"""
+审查结果JSON解析模块
+从模型输出中取出审查结果JSON；输出因长度限制被截断时，拼接续写内容，并把不完整的JSON修复为只包含完整字段的对象；
+另由审查结果dataclass生成结构化输出（response_format）使用的JSON schema，并按schema校验结果
+"""
+
+import dataclasses
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple, get_args, get_origin, get_type_hints
+
+from stream_parser import JsonObjectScanner
+
+
+# 续写请求的提示
+CONTINUE_PROMPT = "输出因长度限制被截断。请从中断处继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。"
+
+# 续写时检查重复的最大长度（部分模型会重复中断前的一小段内容）
+_MAX_OVERLAP = 200
+
+
+def extract_json_object(text: str) -> Tuple[Optional[str], bool]:
+    """取出文本中第一个顶层JSON对象，返回 (对象文本, 是否完整)；没有 '{' 时返回 (None, False)
+
+    不完整时返回从 '{' 到文本末尾的内容。
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if not scanner.started:
+        return None, False
+    if scanner.complete:
+        return text[scanner.start:scanner.end], True
+    return text[scanner.start:], False
+
+
+def repair_truncated_json(text: str) -> Optional[Dict[str, Any]]:
+    """把截断的JSON对象修复为只包含完整字段的对象，无法修复时返回None
+
+    从头扫描，记录每个可以安全截断的位置（容器刚打开、逗号之前、容器刚闭合）及当时未闭合的容器，
+    截断到最后一个安全位置并补齐括号；未写完的字段和数组元素被丢弃。
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    cut: Optional[Tuple[int, List[str]]] = None
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            if stack:
+                in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+            cut = (i + 1, list(stack))
+        elif ch in '}]':
+            if not stack:
+                break
+            stack.pop()
+            cut = (i + 1, list(stack))
+            if not stack:
+                break
+        elif ch == ',' and stack:
+            cut = (i, list(stack))
+
+    if cut is None:
+        return None
+    end, open_containers = cut
+    closers = ''.join('}' if bracket == '{' else ']' for bracket in reversed(open_containers))
+    try:
+        data = json.loads(text[:end] + closers)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def join_continuation(output: str, continuation: str) -> str:
+    """把续写内容接到已有输出之后，去掉续写开头重复的代码块标记和与已有输出重叠的部分"""
+    if not output:
+        return continuation
+    stripped = continuation.lstrip()
+    if stripped.startswith('```'):
+        newline = stripped.find('\n')
+        continuation = stripped[newline + 1:] if newline != -1 else ''
+
+    for size in range(min(len(output), len(continuation), _MAX_OVERLAP), 10, -1):
+        if output.endswith(continuation[:size]):
+            return output + continuation[size:]
+    return output + continuation
+
+
+def needs_continuation(output: str) -> bool:
+    """输出中的审查结果JSON是否还没有写完"""
+    _, complete = extract_json_object(output)
+    return not complete
+
+
+_JSON_TYPES = {str: 'string', int: 'integer', float: 'number', bool: 'boolean'}
+
+
+def _type_schema(tp, object_fields: Sequence[str] = None,
+                 descriptions: Dict[str, str] = None) -> Dict[str, Any]:
+    """Python类型注解对应的JSON schema；Dict[str, X] 需要给出字段名（strict模式不允许任意键）"""
+    origin = get_origin(tp)
+    if origin is list:
+        return {'type': 'array', 'items': _type_schema(get_args(tp)[0], object_fields, descriptions)}
+    if origin is dict:
+        if not object_fields:
+            raise ValueError(f"字典类型 {tp} 需要指定字段名")
+        value_schema = _type_schema(get_args(tp)[1])
+        properties = {}
+        for name in object_fields:
+            properties[name] = dict(value_schema)
+            if descriptions and name in descriptions:
+                properties[name]['description'] = descriptions[name]
+        return {'type': 'object', 'properties': properties,
+                'required': list(object_fields), 'additionalProperties': False}
+    if tp in _JSON_TYPES:
+        return {'type': _JSON_TYPES[tp]}
+    raise ValueError(f"不支持的字段类型: {tp}")
+
+
+def dataclass_json_schema(cls, exclude: Sequence[str] = (),
+                          descriptions: Dict[str, str] = None,
+                          object_fields: Dict[str, Sequence[str]] = None,
+                          item_descriptions: Dict[str, Dict[str, str]] = None) -> Dict[str, Any]:
+    """由dataclass字段生成JSON schema，满足strict结构化输出的要求（字段全部必填、不允许额外字段）
+
+    object_fields 为 Dict 类型字段（或其列表元素）的字段名，item_descriptions 为这些字段的说明。
+    """
+    hints = get_type_hints(cls)
+    descriptions = descriptions or {}
+    object_fields = object_fields or {}
+    item_descriptions = item_descriptions or {}
+    properties = {}
+    for field in dataclasses.fields(cls):
+        if field.name in exclude:
+            continue
+        schema = _type_schema(hints[field.name], object_fields.get(field.name),
+                              item_descriptions.get(field.name))
+        if field.name in descriptions:
+            schema['description'] = descriptions[field.name]
+        properties[field.name] = schema
+    return {'type': 'object', 'properties': properties,
+            'required': list(properties), 'additionalProperties': False}
+
+
+def validate_json(data: Any, schema: Dict[str, Any], path: str = '$') -> List[str]:
+    """按 dataclass_json_schema 生成的schema校验数据，返回错误列表（为空表示通过）"""
+    expected = schema.get('type')
+    if expected == 'object':
+        if not isinstance(data, dict):
+            return [f"{path} 应为对象"]
+        errors = []
+        properties = schema.get('properties', {})
+        for name in schema.get('required', []):
+            if name not in data:
+                errors.append(f"{path}.{name} 缺失")
+        if schema.get('additionalProperties') is False:
+            errors.extend(f"{path}.{name} 不是约定的字段" for name in data if name not in properties)
+        for name, value in data.items():
+            if name in properties:
+                errors.extend(validate_json(value, properties[name], f"{path}.{name}"))
+        return errors
+    if expected == 'array':
+        if not isinstance(data, list):
+            return [f"{path} 应为数组"]
+        errors = []
+        for i, item in enumerate(data):
+            errors.extend(validate_json(item, schema['items'], f"{path}[{i}]"))
+        return errors
+
+    # bool 是 int 的子类，需单独排除
+    python_types = {'string': str, 'integer': int, 'number': (int, float), 'boolean': bool}
+    if expected in python_types:
+        if (not isinstance(data, python_types[expected])
+                or (expected != 'boolean' and isinstance(data, bool))):
+            return [f"{path} 应为 {expected}"]
+    if 'enum' in schema and data not in schema['enum']:
+        return [f"{path} 应为 {'/'.join(map(str, schema['enum']))} 之一"]
+    if 'minimum' in schema and data < schema['minimum']:
+        return [f"{path} 不应小于 {schema['minimum']}"]
+    if 'maximum' in schema and data > schema['maximum']:
+        return [f"{path} 不应大于 {schema['maximum']}"]
+    return []
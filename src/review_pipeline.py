@@ -0,0 +1,223 @@
+"""
+异步审查流水线模块
+获取diff、AI审查、钉钉通知三个阶段通过有界 asyncio.Queue 连接，每个阶段由固定数量的协程消费，
+svn子进程和HTTP请求都在同一个事件循环中并发等待，一个提交的审查不会阻塞下一个提交的diff下载
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from http_client import AsyncHttpTransport
+from svn_monitor import SVNCommit
+
+
+# 队列结束标记，每个消费协程收到一个后退出
+_STOP = object()
+
+
+def async_engine_available() -> bool:
+    """异步流水线依赖 aiohttp，未安装时调用方应回退到同步处理"""
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class PipelineStats:
+    """一次流水线运行的统计"""
+    fetched: int = 0
+    reviewed: int = 0
+    notified: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+
+class PipelineHooks:
+    """流水线各阶段的回调，默认不做任何处理；在事件循环线程中同步调用，应保持轻量"""
+
+    def should_review(self, commit: SVNCommit) -> bool:
+        """审查前调用，返回False时跳过该提交"""
+        return True
+
+    def review_finished(self, commit: SVNCommit, result, elapsed: float):
+        """审查结束后调用，result为None表示审查失败"""
+
+    def notification_finished(self, commit: SVNCommit, result, success: bool):
+        """通知发送后调用"""
+
+    def commit_failed(self, revision: str, error: str):
+        """处理提交时发生异常"""
+
+
+class AsyncReviewPipeline:
+    """基于asyncio的 获取→审查→通知 流水线"""
+
+    def __init__(self, svn_monitor, ai_reviewer, dingtalk_bot, config,
+                 fetch_workers: int = 2, review_workers: int = 4,
+                 notify_workers: int = 1, queue_size: int = 8,
+                 notify_errors: bool = True):
+        self.svn_monitor = svn_monitor
+        self.ai_reviewer = ai_reviewer
+        self.dingtalk_bot = dingtalk_bot
+        self.config = config
+        self.fetch_workers = max(1, fetch_workers)
+        self.review_workers = max(1, review_workers)
+        self.notify_workers = max(1, notify_workers)
+        self.queue_size = max(1, queue_size)
+        # 处理异常时是否发送钉钉错误通知
+        self.notify_errors = notify_errors
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config, svn_monitor, ai_reviewer, dingtalk_bot,
+                    notify_errors: bool = True) -> 'AsyncReviewPipeline':
+        """根据 pipeline 配置创建流水线"""
+        return cls(
+            svn_monitor, ai_reviewer, dingtalk_bot, config,
+            fetch_workers=config.get('pipeline.fetch_workers', 2),
+            review_workers=config.get('pipeline.review_workers', 4),
+            notify_workers=config.get('pipeline.notify_workers', 1),
+            queue_size=config.get('pipeline.queue_size', 8),
+            notify_errors=notify_errors
+        )
+
+    async def process_new_commits(self, hooks: PipelineHooks = None) -> PipelineStats:
+        """拉取高水位之后的新提交并运行流水线
+
+        svn log 和状态文件读写仍是同步实现，放到线程中执行，不阻塞事件循环。
+        """
+        entries = await asyncio.to_thread(self.svn_monitor.fetch_new_entries)
+        if not entries:
+            return PipelineStats()
+        self.logger.info(f"发现 {len(entries)} 个新提交")
+        return await self.run(entries, hooks)
+
+    async def run(self, entries: List[Tuple[Dict[str, Any], List[Dict[str, str]]]],
+                  hooks: PipelineHooks = None) -> PipelineStats:
+        """处理 fetch_new_entries 返回的 [(日志条目, 变更文件)]，全部完成后返回"""
+        hooks = hooks or PipelineHooks()
+        stats = PipelineStats()
+        if not entries:
+            return stats
+        start_time = time.time()
+
+        # 仓库UUID/根URL的查询是阻塞的 svn info 调用，先在线程中完成并缓存
+        await asyncio.to_thread(self.svn_monitor.warm_up)
+
+        http = AsyncHttpTransport.from_config(self.config)
+        self.ai_reviewer.attach_async_transport(http)
+        try:
+            fetch_queue: asyncio.Queue = asyncio.Queue()
+            review_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+            notify_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+            for item in entries:
+                fetch_queue.put_nowait(item)
+            for _ in range(self.fetch_workers):
+                fetch_queue.put_nowait(_STOP)
+
+            fetchers = [asyncio.create_task(self._fetch_worker(fetch_queue, review_queue, stats, hooks, http))
+                        for _ in range(self.fetch_workers)]
+            reviewers = [asyncio.create_task(self._review_worker(review_queue, notify_queue, stats, hooks, http))
+                         for _ in range(self.review_workers)]
+            notifiers = [asyncio.create_task(self._notify_worker(notify_queue, stats, hooks, http))
+                         for _ in range(self.notify_workers)]
+
+            # 上游阶段全部结束后再向下游发送结束标记
+            await asyncio.gather(*fetchers)
+            for _ in range(self.review_workers):
+                await review_queue.put(_STOP)
+            await asyncio.gather(*reviewers)
+            for _ in range(self.notify_workers):
+                await notify_queue.put(_STOP)
+            await asyncio.gather(*notifiers)
+        finally:
+            await http.close()
+
+        stats.elapsed = time.time() - start_time
+        self.logger.info(f"流水线处理完成: 获取 {stats.fetched}，审查 {stats.reviewed}，"
+                         f"通知 {stats.notified}，失败 {stats.failed}，耗时 {stats.elapsed:.1f}秒")
+        return stats
+
+    async def _fetch_worker(self, fetch_queue: asyncio.Queue, review_queue: asyncio.Queue,
+                            stats: PipelineStats, hooks: PipelineHooks, http):
+        """获取阶段：预检并下载diff"""
+        while True:
+            item = fetch_queue.get_nowait()
+            if item is _STOP:
+                return
+            entry, changed_files = item
+            revision = entry['revision']
+            try:
+                commit = await self.svn_monitor.build_commit_async(entry, changed_files)
+            except Exception as e:
+                await self._handle_failure(revision, f"获取提交 {revision} 失败: {e}", stats, hooks, http)
+                continue
+            stats.fetched += 1
+            await review_queue.put(commit)
+
+    async def _review_worker(self, review_queue: asyncio.Queue, notify_queue: asyncio.Queue,
+                             stats: PipelineStats, hooks: PipelineHooks, http):
+        """审查阶段：调用AI接口"""
+        while True:
+            commit = await review_queue.get()
+            if commit is _STOP:
+                return
+            try:
+                if not hooks.should_review(commit):
+                    continue
+                self.logger.info(f"正在对提交 {commit.revision} 进行AI审查 (作者: {commit.author})...")
+                start_time = time.time()
+                result = await self.ai_reviewer.review_commit_async(commit)
+                hooks.review_finished(commit, result, time.time() - start_time)
+            except Exception as e:
+                await self._handle_failure(commit.revision, f"处理提交 {commit.revision} 时发生异常: {e}",
+                                           stats, hooks, http)
+                continue
+
+            if result:
+                stats.reviewed += 1
+                self.logger.info(f"提交 {commit.revision} 审查完成，评分: {result.overall_score}/10")
+                await notify_queue.put((commit, result))
+            else:
+                stats.failed += 1
+                self.logger.error(f"提交 {commit.revision} AI审查失败")
+
+    async def _notify_worker(self, notify_queue: asyncio.Queue, stats: PipelineStats,
+                             hooks: PipelineHooks, http):
+        """通知阶段：发送钉钉消息"""
+        while True:
+            item = await notify_queue.get()
+            if item is _STOP:
+                return
+            commit, result = item
+            try:
+                success = await self.dingtalk_bot.send_review_notification_async(commit, result, http)
+                hooks.notification_finished(commit, result, success)
+            except Exception as e:
+                await self._handle_failure(commit.revision, f"处理提交 {commit.revision} 时发生异常: {e}",
+                                           stats, hooks, http)
+                continue
+
+            if success:
+                stats.notified += 1
+                self.logger.info(f"提交 {commit.revision} 处理完成")
+            else:
+                stats.failed += 1
+                self.logger.error(f"提交 {commit.revision} 钉钉通知发送失败")
+
+    async def _handle_failure(self, revision: str, error: str, stats: PipelineStats,
+                              hooks: PipelineHooks, http: AsyncHttpTransport):
+        stats.failed += 1
+        self.logger.error(error)
+        try:
+            hooks.commit_failed(revision, error)
+            if self.notify_errors:
+                await self.dingtalk_bot.send_error_notification_async(error, http)
+        except Exception as e:
+            self.logger.error(f"处理提交 {revision} 失败回调异常: {e}")
@@ -0,0 +1,295 @@
+"""
+相似提交索引模块
+对已审查提交的新增/删除行建立 MinHash 签名和 LSH 分桶索引；新提交与某个历史提交高度相似时
+（同一修复多加一行、解决冲突后的合并等），只把相对该提交的差异部分连同其审查结果发给AI
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from diff_index import DiffIndex
+from review_cache import strip_branch_prefix
+
+
+# MinHash 使用的梅森素数和置换数量；LSH 分为 BANDS 段，每段 ROWS 个值
+_PRIME = (1 << 61) - 1
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# 新增条目追加到 index.log，累计到该数量后才重写 index.json 并清空日志
+COMPACT_EVERY = 100
+
+# 固定种子生成置换参数，保证重启后签名可比较
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def line_hash(path: str, line: str) -> int:
+    """变更行的64位哈希：去掉分支前缀的路径 + 行标记(+/-) + 压缩空白后的内容"""
+    body = ' '.join(line[1:].split())
+    raw = f"{path}\0{line[:1]}{body}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'big')
+
+
+def changed_line_hashes(index: DiffIndex) -> Dict[int, Set[int]]:
+    """按差异块收集新增/删除行的哈希，返回 {差异块起始偏移: 行哈希集合}"""
+    hunks: Dict[int, Set[int]] = {}
+    text = index.text
+    for entry in index.files:
+        path = strip_branch_prefix(entry.path)
+        for hunk in entry.hunks:
+            hashes = set()
+            pos = text.find('\n', hunk.start, hunk.end) + 1  # 跳过 @@ 行
+            while 0 < pos < hunk.end:
+                newline = text.find('\n', pos, hunk.end)
+                line_end = hunk.end if newline == -1 else newline + 1
+                if text[pos] in '+-':
+                    hashes.add(line_hash(path, text[pos:line_end]))
+                pos = line_end
+            if hashes:
+                hunks[hunk.start] = hashes
+    return hunks
+
+
+def minhash_signature(hashes: Set[int]) -> List[int]:
+    """计算集合的 MinHash 签名"""
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """由两个签名估算 Jaccard 相似度"""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+@dataclass
+class DiffSketch:
+    """一个diff的相似度特征"""
+    hunk_hashes: Dict[int, Set[int]]  # 差异块偏移 -> 变更行哈希
+    hashes: Set[int]
+    signature: List[int]
+
+    @classmethod
+    def from_index(cls, index: DiffIndex) -> 'DiffSketch':
+        hunk_hashes = changed_line_hashes(index)
+        hashes = set().union(*hunk_hashes.values()) if hunk_hashes else set()
+        return cls(hunk_hashes, hashes, minhash_signature(hashes) if hashes else [])
+
+
+@dataclass
+class SimilarCommit:
+    """与新提交相似的已审查提交"""
+    revision: str
+    similarity: float
+    hashes: Set[int]  # 该提交的变更行哈希
+    result: Dict[str, Any]  # 该提交的审查结果字段
+
+
+def build_delta_diff(index: DiffIndex, sketch: DiffSketch, known_hashes: Set[int]) -> str:
+    """只保留包含相似提交中没有的变更行的差异块（带文件头），全部已知时返回空字符串"""
+    parts = []
+    for entry in index.files:
+        new_hunks = [hunk for hunk in entry.hunks
+                     if not sketch.hunk_hashes.get(hunk.start, set()) <= known_hashes]
+        if new_hunks:
+            parts.append(index.header_text(entry))
+            parts.extend(index.hunk_text(hunk) for hunk in new_hunks)
+    return ''.join(parts)
+
+
+class SimilarityIndex:
+    """已审查提交的 MinHash/LSH 索引，保存在磁盘上
+
+    签名保存在 index.json，之后新增的条目逐行追加到 index.log，加载时依次读取两者并重建分桶；
+    每个提交的变更行哈希和审查结果单独保存，超出条目上限时淘汰最早的提交。
+    """
+
+    def __init__(self, cache_dir: str = "data/cache", threshold: float = 0.8,
+                 min_lines: int = 10, max_entries: int = 1000, max_lines: int = 5000,
+                 enabled: bool = True):
+        self.index_dir = Path(cache_dir) / 'similarity'
+        self.threshold = threshold
+        self.min_lines = min_lines
+        self.max_entries = max_entries
+        self.max_lines = max_lines
+        self.enabled = enabled
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None  # 延迟加载
+        self._buckets: Dict[str, Set[str]] = {}
+        self._log_lines = 0  # index.log 中尚未合并到 index.json 的条目数
+
+    @classmethod
+    def from_config(cls, config) -> 'SimilarityIndex':
+        """根据配置创建索引"""
+        return cls(
+            cache_dir=config.get('data.cache_dir', 'data/cache'),
+            threshold=config.get('ai.near_duplicate.threshold', 0.8),
+            min_lines=config.get('ai.near_duplicate.min_changed_lines', 10),
+            max_entries=config.get('ai.near_duplicate.max_entries', 1000),
+            max_lines=config.get('ai.near_duplicate.max_changed_lines', 5000),
+            enabled=config.get('ai.near_duplicate.enabled', True)
+        )
+
+    def sketch(self, index: DiffIndex) -> Optional[DiffSketch]:
+        """计算diff的相似度特征，变更行太少或太多时返回None"""
+        if not self.enabled:
+            return None
+        sketch = DiffSketch.from_index(index)
+        if len(sketch.hashes) < self.min_lines or len(sketch.hashes) > self.max_lines:
+            return None
+        return sketch
+
+    def find_similar(self, sketch: Optional[DiffSketch], version: str,
+                     exclude_revision: str = None) -> Optional[SimilarCommit]:
+        """查找相似度不低于阈值的已审查提交（取最相似的一个）"""
+        if sketch is None:
+            return None
+
+        with self._lock:
+            self._load()
+            candidates = set()
+            for key in self._band_keys(sketch.signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best = None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry['version'] != version or entry['revision'] == exclude_revision:
+                    continue
+                similarity = estimate_similarity(sketch.signature, entry['signature'])
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry_id, entry)
+
+        if best is None:
+            return None
+        similarity, entry_id, entry = best
+        detail = self._read_detail(entry_id)
+        if detail is None:
+            return None
+        return SimilarCommit(revision=entry['revision'], similarity=similarity,
+                             hashes=set(detail['hashes']), result=detail['result'])
+
+    def add(self, sketch: Optional[DiffSketch], version: str, revision: str,
+            result: Dict[str, Any]):
+        """记录已审查提交"""
+        if sketch is None:
+            return
+
+        entry_id = hashlib.sha256(f"{version}\0{revision}\0{sketch.signature}".encode('utf-8')).hexdigest()[:24]
+        detail = {'hashes': sorted(sketch.hashes), 'result': result}
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            self._write_json(self.index_dir / f"{entry_id}.json", detail)
+        except Exception as e:
+            self.logger.warning(f"写入相似提交索引失败 (版本 {revision}): {e}")
+            return
+
+        with self._lock:
+            self._load()
+            entry = {'revision': str(revision), 'version': version,
+                     'signature': sketch.signature, 'added_at': time.time()}
+            self._entries[entry_id] = entry
+            self._add_to_buckets(entry_id, sketch.signature)
+            self._evict()
+            try:
+                if self._log_lines + 1 >= COMPACT_EVERY:
+                    self._compact()
+                else:
+                    self._append_log(entry_id, entry)
+            except Exception as e:
+                self.logger.warning(f"保存相似提交索引失败: {e}")
+
+    @staticmethod
+    def _band_keys(signature: List[int]) -> List[str]:
+        return [f"{band}:" + ','.join(map(str, signature[band * ROWS:(band + 1) * ROWS]))
+                for band in range(BANDS)]
+
+    def _add_to_buckets(self, entry_id: str, signature: List[int]):
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _append_log(self, entry_id: str, entry: Dict[str, Any]):
+        """把新增条目追加到 index.log（调用方持有锁）"""
+        with open(self.index_dir / 'index.log', 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(entry, id=entry_id)) + '\n')
+        self._log_lines += 1
+
+    def _compact(self):
+        """把全部条目写入 index.json 并清空 index.log（调用方持有锁）"""
+        self._write_json(self.index_dir / 'index.json', self._entries)
+        open(self.index_dir / 'index.log', 'w').close()
+        self._log_lines = 0
+
+    def _load(self):
+        """首次使用时加载索引并重放追加日志，重建LSH分桶（调用方持有锁）"""
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(self.index_dir / 'index.json', 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"加载相似提交索引失败，将重新建立: {e}")
+        try:
+            with open(self.index_dir / 'index.log', 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 写入中断留下的不完整行
+                    self._entries[entry.pop('id')] = entry
+                    self._log_lines += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"读取相似提交索引日志失败: {e}")
+        for entry_id, entry in self._entries.items():
+            self._add_to_buckets(entry_id, entry['signature'])
+        # 日志中的条目可能超出上限，按加入时间淘汰的结果与运行时一致
+        self._evict()
+
+    def _evict(self):
+        """超出条目上限时淘汰最早加入的提交（调用方持有锁）"""
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        oldest = sorted(self._entries, key=lambda entry_id: self._entries[entry_id]['added_at'])[:excess]
+        for entry_id in oldest:
+            for key in self._band_keys(self._entries.pop(entry_id)['signature']):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+            try:
+                os.remove(self.index_dir / f"{entry_id}.json")
+            except OSError:
+                pass
+
+    def _read_detail(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.index_dir / f"{entry_id}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"读取相似提交 {entry_id} 失败: {e}")
+            return None
+
+    @staticmethod
+    def _write_json(path: Path, data):
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
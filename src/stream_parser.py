@@ -0,0 +1,148 @@
+"""
+流式响应解析模块
+逐行解析chat completions的SSE（text/event-stream）响应，边接收边拼接内容，并增量扫描审查结果JSON：
+顶层对象闭合后即可结束读取，同时记录首个token耗时（TTFT）、结束原因和用量
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+class JsonObjectScanner:
+    """增量扫描文本中的第一个顶层JSON对象
+
+    记录对象的起始位置、未闭合的 {/[ 栈和是否处于字符串中，对象闭合时记录结束位置。
+    只识别结构字符，不校验JSON语法。
+    """
+
+    def __init__(self):
+        self.length = 0          # 已扫描的字符数
+        self.start = -1          # 第一个 '{' 的位置
+        self.end = -1            # 顶层对象闭合后的位置
+        self.stack: List[str] = []
+        self.in_string = False
+        self._escape = False
+
+    @property
+    def started(self) -> bool:
+        return self.start != -1
+
+    @property
+    def complete(self) -> bool:
+        return self.end != -1
+
+    def feed(self, text: str):
+        base = self.length
+        self.length += len(text)
+        if self.complete:
+            return
+
+        for i, ch in enumerate(text):
+            if not self.started:
+                if ch == '{':
+                    self.start = base + i
+                    self.stack.append(ch)
+                continue
+            if self.in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.stack.append(ch)
+            elif ch in '}]':
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.end = base + i + 1
+                    return
+
+
+def parse_sse_data(line: str) -> Optional[str]:
+    """取出SSE行的 data 字段，注释、空行和其他字段返回None"""
+    if not line or not line.startswith('data:'):
+        return None
+    return line[5:].strip()
+
+
+class StreamCollector:
+    """汇总一次流式响应：拼接增量内容，记录TTFT、结束原因、用量和错误
+
+    stop_on_json_close 为False时不在JSON对象闭合后提前结束。续写请求的输出从中断处接着写，
+    其中第一个闭合的对象通常只是 detailed_comments 中的一项，不能据此判断审查结果已写完。
+    wait_for_usage 为True时（请求了 stream_options.include_usage）JSON闭合后继续读到最后的用量事件。
+    """
+
+    def __init__(self, start_time: float = None, stop_on_json_close: bool = True,
+                 wait_for_usage: bool = False):
+        self.start_time = start_time or time.time()
+        self.stop_on_json_close = stop_on_json_close
+        self.wait_for_usage = wait_for_usage
+        self.parts: List[str] = []
+        self.scanner = JsonObjectScanner()
+        self.first_token_time: Optional[float] = None
+        self.finish_reason: Optional[str] = None
+        self.usage: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.events = 0
+        self.done = False
+
+    @property
+    def content(self) -> str:
+        return ''.join(self.parts)
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """首个token耗时（秒）"""
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def json_complete(self) -> bool:
+        return self.scanner.complete
+
+    def feed_line(self, line: str) -> bool:
+        """处理一行SSE，返回True表示响应已结束（[DONE]、结束原因、错误或审查JSON已闭合）"""
+        data = parse_sse_data(line)
+        if data is None or self.done:
+            return self.done
+        if data == '[DONE]':
+            self.done = True
+            return True
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            return False
+        self.events += 1
+
+        if event.get('error'):
+            error = event['error']
+            self.error = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+            self.done = True
+            return True
+        if event.get('usage'):
+            self.usage = event['usage']
+
+        for choice in event.get('choices') or []:
+            delta = choice.get('delta') or choice.get('message') or {}
+            text = delta.get('content')
+            if text:
+                if self.first_token_time is None:
+                    self.first_token_time = time.time()
+                self.parts.append(text)
+                self.scanner.feed(text)
+            if choice.get('finish_reason'):
+                self.finish_reason = choice['finish_reason']
+
+        # 审查结果是单个JSON对象，闭合后剩下的只是代码块结束标记，不必等待（用量在最后一个事件中，需要时等到用量）
+        if (self.stop_on_json_close and self.scanner.complete
+                and (self.usage or not self.wait_for_usage)):
+            self.done = True
+        return self.done
@@ -3,6 +3,7 @@ SVN监控模块
 负责监控SVN提交记录，获取代码变更信息
 """
 
+import asyncio
 import subprocess
 import json
 import xml.etree.ElementTree as ET
@@ -13,6 +14,10 @@ from dataclasses import dataclass
 from pathlib import Path
 
 from config_manager import config
+from diff_cache import DiffCache, diff_cache_options, get_repository_root, get_repository_uuid
+from diff_reader import StreamingDiffReader, build_diff_commands, build_file_diff_commands, scope_diff_targets
+from file_filter import FileFilter
+from commit_planner import CommitPlan, CommitPlanner
 
 
 @dataclass
@@ -24,6 +29,100 @@ class SVNCommit:
     message: str
     changed_files: List[Dict[str, str]]
     diff_content: str = ""
+    review_plan: Optional[Any] = None  # 下载diff前的预检计划（CommitPlan）
+
+
+@dataclass
+class DiffRequest:
+    """一次diff获取的命令和缓存键"""
+    revision: str
+    options: List[str]
+    repo_uuid: Optional[str]
+    commands: List[List[str]]
+    can_fallback: bool = False
+    fallback_commands: Optional[List[List[str]]] = None
+    fallback_options: Optional[List[str]] = None
+    cached: Optional[str] = None
+    
+    @property
+    def fallback(self) -> Optional[List[List[str]]]:
+        """获取失败时改用的命令，不能回退时为None"""
+        return self.fallback_commands if self.can_fallback else None
+    
+    def use_fallback(self):
+        """切换为回退命令（不带额外参数的完整diff或逐个文件diff）"""
+        self.commands = self.fallback_commands
+        self.options = self.fallback_options
+        self.can_fallback = False
+
+
+COPY_TYPE_NAMES = {
+    'normal': '普通',
+    'branch_creation': '分支创建',
+    'tag_creation': '标签创建',
+    'move': '移动/重命名',
+    'copy': '复制',
+    'copy_with_edits': '带修改的复制',
+}
+
+
+@dataclass
+class CopyClassification:
+    """基于copyfrom信息的提交分类结果"""
+    commit_type: str  # normal | branch_creation | tag_creation | move | copy | copy_with_edits
+    edit_files: List[Dict[str, str]]  # 需要diff和审查的真实修改
+    description: str = ""
+    
+    @property
+    def is_pure_copy(self) -> bool:
+        """是否为不含任何修改的纯复制/移动提交"""
+        return self.commit_type in ('branch_creation', 'tag_creation', 'move', 'copy')
+
+
+def _copy_has_text_mods(file_info: Dict[str, str]) -> bool:
+    """带copyfrom的变更路径是否包含内容修改，text-mods未知时按有修改处理"""
+    if file_info.get('kind') == 'dir':
+        return False
+    text_mods = file_info.get('text_mods')
+    if text_mods is None:
+        return file_info.get('action') in ('A', 'R')
+    return text_mods == 'true'
+
+
+def classify_copy_commit(changed_files: List[Dict[str, str]]) -> CopyClassification:
+    """根据日志中的copyfrom-path/copyfrom-rev和text-mods识别分支/标签创建、移动和带修改的复制"""
+    copy_roots = [f for f in changed_files if f.get('copyfrom_path')]
+    if not copy_roots:
+        return CopyClassification('normal', changed_files)
+    
+    # 复制源在同一提交中被删除，视为移动/重命名
+    deleted_paths = {f['path'] for f in changed_files if f.get('action') == 'D'}
+    move_sources = {root['copyfrom_path'] for root in copy_roots
+                    if root['copyfrom_path'] in deleted_paths}
+    
+    # 复制的文件内容有修改（text-mods为true）或无法确定（旧版本服务端未返回text-mods，
+    # 如合并带入或替换的文件）时仍需审查；目录复制和内容未修改的文件复制才是纯复制
+    edit_files = [f for f in changed_files
+                  if f['path'] not in move_sources
+                  and (not f.get('copyfrom_path') or _copy_has_text_mods(f))]
+    
+    root = copy_roots[0]
+    description = f"{root['path']} (来自 {root['copyfrom_path']}:{root.get('copyfrom_rev', '')})"
+    if len(copy_roots) > 1:
+        description += f" 等 {len(copy_roots)} 处复制"
+    
+    if edit_files:
+        commit_type = 'copy_with_edits'
+    elif all(f.get('kind') == 'dir' and '/tags/' in f['path'] + '/' for f in copy_roots):
+        commit_type = 'tag_creation'
+    elif all(f.get('kind') == 'dir' and '/branches/' in f['path'] + '/' for f in copy_roots):
+        commit_type = 'branch_creation'
+    elif move_sources:
+        commit_type = 'move'
+    else:
+        commit_type = 'copy'
+    
+    return CopyClassification(commit_type, edit_files, description)
 
 
 class SVNMonitor:
@@ -33,59 +132,91 @@ class SVNMonitor:
         self.password = config.get('svn.password')
         self.monitored_paths = config.get('svn.monitored_paths', [])
         self.processed_commits_file = config.get('data.processed_commits_file')
+        # 分页拉取日志的每页大小，以及单次轮询最多返回的提交数量
+        self.log_page_size = config.get('svn.log_page_size', 50)
+        self.max_commits_per_poll = config.get('svn.max_commits_per_poll', 100)
+        self.diff_cache = DiffCache.from_config(config)
+        self.diff_reader = StreamingDiffReader.from_config(config)
+        # 只下载监控路径内、通过扩展名过滤的文件diff
+        self.scope_diff_to_paths = config.get('svn.scope_diff_to_paths', True)
+        self.file_filter = FileFilter.from_config(config)
+        # 下载diff前先做大小预检，提前决定审查策略
+        self.enable_preflight = config.get('ai.preflight.enabled', True)
+        self._commit_planner: Optional[CommitPlanner] = None
         self.logger = logging.getLogger(__name__)
         
-        # 加载已处理的提交记录
-        self.processed_commits = self._load_processed_commits()
+        # 加载版本高水位和待处理版本集合
+        # last_revision 之前（含）的版本都已拉取过，其中仍待处理或失败的版本记录在 pending_revisions 中
+        self.last_revision: Optional[int] = None
+        self.pending_revisions: set = set()
+        self._load_revision_state()
     
-    def _load_processed_commits(self) -> set:
-        """加载已处理的提交记录"""
+    def _load_revision_state(self):
+        """加载版本高水位和待处理版本集合"""
         try:
             if Path(self.processed_commits_file).exists():
                 with open(self.processed_commits_file, 'r') as f:
                     data = json.load(f)
-                    
-                    # 兼容多种格式
-                    if isinstance(data, dict):
-                        # 新格式 {"processed_commits": [...]}
-                        if 'processed_commits' in data:
-                            return set(str(item) for item in data['processed_commits'])
-                        # 旧格式 {"123": {...}, "124": {...}}
-                        else:
-                            return set(data.keys())
-                    elif isinstance(data, list):
-                        # 数组格式 [123, 124, ...]
-                        return set(str(item) for item in data)
+                
+                # 兼容多种格式
+                if isinstance(data, dict) and 'last_revision' in data:
+                    # 高水位格式 {"last_revision": 123, "pending_revisions": [...]}
+                    if data['last_revision'] is not None:
+                        self.last_revision = int(data['last_revision'])
+                    self.pending_revisions = set(
+                        str(item) for item in data.get('pending_revisions', []))
+                    return
+                
+                if isinstance(data, dict):
+                    # 新格式 {"processed_commits": [...]}
+                    if 'processed_commits' in data:
+                        processed = data['processed_commits']
+                    # 旧格式 {"123": {...}, "124": {...}}
                     else:
-                        self.logger.warning(f"未知的提交记录格式: {type(data)}")
-                        return set()
+                        processed = list(data.keys())
+                elif isinstance(data, list):
+                    # 数组格式 [123, 124, ...]
+                    processed = data
+                else:
+                    self.logger.warning(f"未知的提交记录格式: {type(data)}")
+                    return
+                
+                # 旧格式只记录了已处理版本，以其中最大的版本作为高水位
+                revisions = [int(item) for item in processed if str(item).isdigit()]
+                if revisions:
+                    self.last_revision = max(revisions)
+                    self.logger.info(f"已从旧的提交记录迁移高水位: r{self.last_revision}")
         except Exception as e:
             self.logger.warning(f"加载已处理提交记录失败: {e}")
-        return set()
     
-    def _save_processed_commits(self):
-        """保存已处理的提交记录"""
+    def _save_revision_state(self):
+        """保存版本高水位和待处理版本集合"""
         try:
             Path(self.processed_commits_file).parent.mkdir(parents=True, 
                                                            exist_ok=True)
             with open(self.processed_commits_file, 'w') as f:
-                # 统一使用数组格式，便于维护
-                commit_list = [int(rev) if rev.isdigit() else rev 
-                              for rev in self.processed_commits]
-                json.dump(sorted(commit_list), f, indent=2)
+                json.dump({
+                    'last_revision': self.last_revision,
+                    'pending_revisions': sorted(self.pending_revisions, key=int)
+                }, f, indent=2)
         except Exception as e:
             self.logger.error(f"保存已处理提交记录失败: {e}")
     
+    def _build_svn_command(self, command: List[str]) -> List[str]:
+        """构建带认证参数的完整SVN命令"""
+        full_command = ['svn'] + command
+        if self.username:
+            full_command.extend(['--username', self.username])
+        if self.password:
+            full_command.extend(['--password', self.password])
+        full_command.append('--non-interactive')
+        return full_command
+    
     def _run_svn_command(self, command: List[str]) -> str:
         """执行SVN命令"""
         try:
             # 添加认证参数
-            full_command = ['svn'] + command
-            if self.username:
-                full_command.extend(['--username', self.username])
-            if self.password:
-                full_command.extend(['--password', self.password])
-            full_command.append('--non-interactive')
+            full_command = self._build_svn_command(command)
             
             result = subprocess.run(
                 full_command,
@@ -107,111 +238,405 @@ class SVNMonitor:
             self.logger.error(f"执行SVN命令时发生异常: {e}")
             return ""
     
+    async def _run_svn_command_async(self, command: List[str]) -> str:
+        """_run_svn_command 的asyncio版本"""
+        full_command = self._build_svn_command(command)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *full_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except Exception as e:
+            self.logger.error(f"执行SVN命令时发生异常: {e}")
+            return ""
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=30)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            self.logger.error("SVN命令执行超时")
+            return ""
+        
+        if process.returncode != 0:
+            self.logger.error(f"SVN命令执行失败: {stderr.decode('utf-8', errors='replace')}")
+            return ""
+        return stdout.decode('utf-8', errors='replace')
+    
     def get_latest_commits(self, limit: int = 10) -> List[SVNCommit]:
-        """获取最新的SVN提交记录"""
-        commits = []
+        """获取高水位之后的新提交，以及仍待处理的提交
         
-        # 获取最新的提交日志
-        command = ['log', self.repo_url, '--xml', f'--limit={limit}']
-        output = self._run_svn_command(command)
+        Args:
+            limit: 首次运行（尚无高水位）时回溯的提交数量
+        """
+        return [self._build_commit(entry, changed_files)
+                for entry, changed_files in self.fetch_new_entries(limit)]
+    
+    def fetch_new_entries(self, limit: int = 10) -> List[tuple]:
+        """获取需要处理的新提交日志条目（不下载diff），返回 [(日志条目, 监控路径内的变更文件)]
         
-        if not output:
-            return commits
+        Args:
+            limit: 首次运行（尚无高水位）时回溯的提交数量
+        """
+        if self.last_revision is not None and not self.has_new_revisions():
+            # 监控路径没有新提交且没有待处理版本，跳过整个日志/diff拉取流程
+            if not self.pending_revisions:
+                return []
+            entries = []
+        elif self.last_revision is None:
+            # 首次运行：只取最近的limit个版本，避免审查全部历史
+            command = ['log', self.repo_url, '--xml', '--verbose', f'--limit={limit}']
+            output = self._run_svn_command(command)
+            if not output:
+                return []
+            entries = sorted(self._parse_log_entries(output), key=lambda e: int(e['revision']))
+        else:
+            entries = self._fetch_new_log_entries()
+        
+        # 重新获取上次未处理完成的版本
+        fetched = {entry['revision'] for entry in entries}
+        retry_revisions = sorted(self.pending_revisions - fetched, key=int)
+        retry_entries = self._fetch_log_entries_by_revisions(retry_revisions)
+        
+        relevant = []
+        for entry in retry_entries + entries:
+            # 过滤监控路径，没有相关文件变更的版本直接跳过
+            changed_files = self._filter_monitored_files(entry['changed_files'])
+            if not changed_files:
+                self.pending_revisions.discard(entry['revision'])
+                continue
+            
+            self.pending_revisions.add(entry['revision'])
+            relevant.append((entry, changed_files))
         
+        if entries:
+            self.last_revision = max(self.last_revision or 0, int(entries[-1]['revision']))
+        if entries or retry_entries:
+            self._save_revision_state()
+        
+        return relevant
+    
+    def get_last_changed_revision(self) -> Optional[int]:
+        """轻量探测监控URL的最后修改版本号，失败时返回None
+        
+        repository_url 为共享仓库的子路径时，仓库HEAD会随其他路径的提交一直前进，
+        最后修改版本只在该URL下有新提交时才变化。
+        """
+        output = self._run_svn_command(['info', self.repo_url, '--show-item', 'last-changed-revision'])
         try:
-            root = ET.fromstring(output)
-            for logentry in root.findall('logentry'):
-                revision = logentry.get('revision')
-                
-                # 跳过已处理的提交（支持字符串和数字比较）
-                if (revision in self.processed_commits or 
-                    int(revision) in self.processed_commits):
-                    continue
-                
-                author = logentry.find('author').text if logentry.find('author') is not None else "unknown"
-                date_str = logentry.find('date').text if logentry.find('date') is not None else ""
-                message = logentry.find('msg').text if logentry.find('msg') is not None else ""
-                
-                # 解析日期
-                try:
-                    date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                except:
-                    date = datetime.now()
-                
-                # 获取变更的文件列表
-                changed_files = self._get_changed_files(revision)
-                
-                # 过滤监控路径
-                if self.monitored_paths:
-                    filtered_files = []
-                    for file_info in changed_files:
-                        file_path = file_info['path']
-                        if any(file_path.startswith(path) for path in self.monitored_paths):
-                            filtered_files.append(file_info)
-                    changed_files = filtered_files
-                
-                # 如果没有相关文件变更，跳过
-                if not changed_files:
-                    continue
-                
-                # 获取diff内容
-                diff_content = self._get_commit_diff(revision)
-                
-                commit = SVNCommit(
-                    revision=revision,
-                    author=author,
-                    date=date,
-                    message=message,
-                    changed_files=changed_files,
-                    diff_content=diff_content
-                )
-                
-                commits.append(commit)
-                
-        except ET.ParseError as e:
-            self.logger.error(f"解析SVN日志XML失败: {e}")
+            return int(output.strip())
+        except ValueError:
+            return None
+    
+    def has_new_revisions(self) -> bool:
+        """监控URL的最后修改版本是否已超过高水位；无法探测时按有新版本处理"""
+        last_changed = self.get_last_changed_revision()
+        if last_changed is None or self.last_revision is None:
+            return True
         
-        return commits
+        if last_changed <= self.last_revision:
+            self.logger.debug(f"监控路径没有新提交 (最后修改于 r{last_changed})，跳过日志拉取")
+            return False
+        return True
     
-    def _get_changed_files(self, revision: str) -> List[Dict[str, str]]:
-        """获取指定版本的变更文件列表"""
-        command = ['log', self.repo_url, f'-r{revision}', '--xml', '--verbose']
+    def get_commits_in_range(self, start_revision: str, end_revision: str) -> List[SVNCommit]:
+        """获取指定版本范围内（含两端）涉及监控路径的提交，不影响高水位状态"""
+        command = ['log', self.repo_url, '--xml', '--verbose',
+                   f'-r{start_revision}:{end_revision}']
         output = self._run_svn_command(command)
+        if not output:
+            return []
         
-        changed_files = []
+        commits = []
+        for entry in self._parse_log_entries(output):
+            changed_files = self._filter_monitored_files(entry['changed_files'])
+            if changed_files:
+                commits.append(self._build_commit(entry, changed_files))
+        return commits
+    
+    def _fetch_new_log_entries(self) -> List[Dict[str, Any]]:
+        """从高水位之后分页拉取日志，直到追平HEAD或达到单次轮询上限"""
+        entries = []
+        relevant_count = 0
+        start = self.last_revision + 1
+        
+        while True:
+            command = ['log', self.repo_url, '--xml', '--verbose',
+                       f'-r{start}:HEAD', f'--limit={self.log_page_size}']
+            output = self._run_svn_command(command)
+            if not output:
+                break
+            
+            page = self._parse_log_entries(output)
+            entries.extend(page)
+            relevant_count += sum(1 for entry in page
+                                  if self._filter_monitored_files(entry['changed_files']))
+            
+            if len(page) < self.log_page_size:
+                break
+            if relevant_count >= self.max_commits_per_poll:
+                self.logger.info(f"本次轮询已获取 {relevant_count} 个提交，剩余提交将在下次轮询处理")
+                break
+            start = int(page[-1]['revision']) + 1
+        
+        return entries
+    
+    def _fetch_log_entries_by_revisions(self, revisions: List[str]) -> List[Dict[str, Any]]:
+        """一次日志调用获取多个指定版本"""
+        if not revisions:
+            return []
+        
+        command = ['log', self.repo_url, '--xml', '--verbose']
+        for revision in revisions:
+            command.append(f'-r{revision}')
+        output = self._run_svn_command(command)
         if not output:
-            return changed_files
+            return []
+        return self._parse_log_entries(output)
+    
+    def _build_commit(self, entry: Dict[str, Any],
+                      changed_files: List[Dict[str, str]]) -> SVNCommit:
+        """根据日志条目构建提交对象，预检后按计划获取diff内容"""
+        revision = entry['revision']
+        review_plan, diff_files = self._plan_commit(revision, changed_files)
+        
+        if review_plan is not None and review_plan.strategy == 'skip':
+            diff_content = ""
+        else:
+            copy_commit = classify_copy_commit(changed_files).commit_type == 'copy_with_edits'
+            diff_content = self._get_commit_diff(revision, diff_files, copy_commit)
+        
+        return self._make_commit(entry, changed_files, diff_content, review_plan)
+    
+    async def build_commit_async(self, entry: Dict[str, Any],
+                                 changed_files: List[Dict[str, str]]) -> SVNCommit:
+        """_build_commit 的asyncio版本，svn命令通过 asyncio.create_subprocess_exec 执行"""
+        revision = entry['revision']
+        summary_output = None
+        copy_info = classify_copy_commit(changed_files)
+        if self.enable_preflight and not copy_info.is_pure_copy:
+            planner = self._get_commit_planner()
+            command = planner.summary_command(revision)
+            if command:
+                summary_output = await self._run_svn_command_async(command)
+        review_plan, diff_files = self._plan_commit(revision, changed_files, summary_output)
+        
+        if review_plan is not None and review_plan.strategy == 'skip':
+            diff_content = ""
+        else:
+            diff_content = await self._get_commit_diff_async(
+                revision, diff_files, copy_info.commit_type == 'copy_with_edits')
+        
+        return self._make_commit(entry, changed_files, diff_content, review_plan)
+    
+    def _plan_commit(self, revision: str, changed_files: List[Dict[str, str]],
+                     summary_output: Optional[str] = None) -> tuple:
+        """识别复制提交并执行预检，返回 (预检计划, 需要diff的文件)
+        
+        summary_output为预先获取的 svn diff --summarize 输出，为None时由预检规划器自行获取。
+        """
+        review_plan = None
+        
+        # 分支/标签创建和纯移动不需要diff，带修改的复制只diff真实修改的部分
+        copy_info = classify_copy_commit(changed_files)
+        diff_files = copy_info.edit_files
+        
+        if copy_info.is_pure_copy:
+            self.logger.info(f"提交 {revision} 为{COPY_TYPE_NAMES[copy_info.commit_type]}，跳过diff: "
+                             f"{copy_info.description}")
+            review_plan = CommitPlan(
+                revision=revision,
+                strategy='skip',
+                file_count=len(changed_files),
+                reason=f"{COPY_TYPE_NAMES[copy_info.commit_type]}提交（{copy_info.description}），"
+                       f"不包含代码修改，已跳过AI审查"
+            )
+        elif self.enable_preflight:
+            review_plan = self._get_commit_planner().plan(revision, diff_files, summary_output)
+            diff_files = review_plan.review_files
+        
+        return review_plan, diff_files
+    
+    @staticmethod
+    def _make_commit(entry: Dict[str, Any], changed_files: List[Dict[str, str]],
+                     diff_content: str, review_plan) -> SVNCommit:
+        return SVNCommit(
+            revision=entry['revision'],
+            author=entry['author'],
+            date=entry['date'],
+            message=entry['message'],
+            changed_files=changed_files,
+            diff_content=diff_content,
+            review_plan=review_plan
+        )
+    
+    def warm_up(self):
+        """预先查询仓库UUID/根URL并创建预检规划器（结果在进程内缓存），
+        之后异步构建提交时不再执行阻塞的 svn info 调用"""
+        get_repository_uuid(self.repo_url, self.username, self.password)
+        get_repository_root(self.repo_url, self.username, self.password)
+        if self.enable_preflight:
+            self._get_commit_planner()
+    
+    def _get_commit_planner(self) -> CommitPlanner:
+        """延迟创建预检规划器（需要查询仓库根URL）"""
+        if self._commit_planner is None:
+            self._commit_planner = CommitPlanner.from_config(
+                config,
+                run_svn=self._run_svn_command,
+                repository_url=self.repo_url,
+                repository_root=get_repository_root(self.repo_url, self.username, self.password),
+                file_filter=self.file_filter
+            )
+        return self._commit_planner
+    
+    def _parse_log_entries(self, output: str) -> List[Dict[str, Any]]:
+        """解析 svn log --xml [--verbose] 输出，返回提交元数据及变更路径"""
+        entries = []
         
         try:
             root = ET.fromstring(output)
-            logentry = root.find('logentry')
-            if logentry is not None:
-                paths = logentry.find('paths')
-                if paths is not None:
-                    for path in paths.findall('path'):
-                        file_info = {
-                            'path': path.text,
-                            'action': path.get('action', ''),
-                            'kind': path.get('kind', 'file')
-                        }
-                        changed_files.append(file_info)
         except ET.ParseError as e:
-            self.logger.error(f"解析变更文件列表失败: {e}")
+            self.logger.error(f"解析SVN日志XML失败: {e}")
+            return entries
+        
+        for logentry in root.findall('logentry'):
+            author = logentry.find('author').text if logentry.find('author') is not None else "unknown"
+            date_str = logentry.find('date').text if logentry.find('date') is not None else ""
+            message = logentry.find('msg').text if logentry.find('msg') is not None else ""
+            
+            # 解析日期
+            try:
+                date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+            except:
+                date = datetime.now()
+            
+            entries.append({
+                'revision': logentry.get('revision'),
+                'author': author,
+                'date': date,
+                'message': message,
+                'changed_files': self._parse_changed_paths(logentry)
+            })
         
+        return entries
+    
+    def _parse_changed_paths(self, logentry: ET.Element) -> List[Dict[str, str]]:
+        """从单个logentry节点中提取变更文件列表"""
+        changed_files = []
+        paths = logentry.find('paths')
+        if paths is not None:
+            for path in paths.findall('path'):
+                file_info = {
+                    'path': path.text,
+                    'action': path.get('action', ''),
+                    'kind': path.get('kind', 'file')
+                }
+                # svn 1.7+ 的日志会标明路径内容是否被修改，用于区分纯复制和复制后修改
+                if path.get('text-mods'):
+                    file_info['text_mods'] = path.get('text-mods')
+                # 复制/分支/标签操作会带有复制源信息
+                if path.get('copyfrom-path'):
+                    file_info['copyfrom_path'] = path.get('copyfrom-path')
+                    file_info['copyfrom_rev'] = path.get('copyfrom-rev', '')
+                changed_files.append(file_info)
         return changed_files
     
-    def _get_commit_diff(self, revision: str) -> str:
-        """获取指定版本的diff内容"""
-        prev_revision = str(int(revision) - 1)
-        command = ['diff', self.repo_url, f'-r{prev_revision}:{revision}']
+    def _filter_monitored_files(self, changed_files: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """按监控路径过滤变更文件"""
+        if not self.monitored_paths:
+            return changed_files
+        
+        return [file_info for file_info in changed_files
+                if any(file_info['path'].startswith(path) for path in self.monitored_paths)]
+    
+    def _get_commit_diff(self, revision: str,
+                         changed_files: Optional[List[Dict[str, str]]] = None,
+                         copy_commit: bool = False) -> str:
+        """获取指定版本的diff内容（优先读取diff缓存，超大diff按预算流式截断）
+        
+        提供changed_files时只在服务端diff其中需要审查的文件，图片、二进制等被过滤的文件不会被下载。
+        copy_commit 表示带修改的复制提交，按路径diff失败时逐个文件diff，不回退为完整diff。
+        """
+        request = self._prepare_diff_request(revision, changed_files, copy_commit)
+        if request is None:
+            return ""
+        if request.cached is not None:
+            return request.cached
+        
+        result = self.diff_reader.read_with_fallback(request.commands, request.fallback)
+        if result.fallback:
+            request.use_fallback()
+        
+        return self._finish_diff_request(request, result)
+    
+    async def _get_commit_diff_async(self, revision: str,
+                                     changed_files: Optional[List[Dict[str, str]]] = None,
+                                     copy_commit: bool = False) -> str:
+        """_get_commit_diff 的asyncio版本，diff缓存读写和 svn info 查询在线程中执行"""
+        request = await asyncio.to_thread(self._prepare_diff_request, revision, changed_files, copy_commit)
+        if request is None:
+            return ""
+        if request.cached is not None:
+            return request.cached
+        
+        result = await self.diff_reader.read_with_fallback_async(request.commands, request.fallback)
+        if result.fallback:
+            request.use_fallback()
+        
+        return await asyncio.to_thread(self._finish_diff_request, request, result)
+    
+    def _prepare_diff_request(self, revision: str,
+                              changed_files: Optional[List[Dict[str, str]]],
+                              copy_commit: bool = False) -> Optional['DiffRequest']:
+        """计算diff目标、缓存键和命令，没有需要diff的文件时返回None"""
+        targets = None
+        if self.scope_diff_to_paths and changed_files is not None:
+            repo_root = get_repository_root(self.repo_url, self.username, self.password)
+            targets = scope_diff_targets(changed_files, self.repo_url, repo_root, self.file_filter)
+            if targets is not None and not targets:
+                self.logger.debug(f"版本 {revision} 没有需要diff的文件")
+                return None
+        
+        request = DiffRequest(
+            revision=revision,
+            options=diff_cache_options(self.repo_url, self.diff_reader.cache_options(), targets),
+            repo_uuid=get_repository_uuid(self.repo_url, self.username, self.password),
+            commands=[self._build_svn_command(args)
+                      for args in build_diff_commands(self.repo_url, revision, targets,
+                                                      diff_options=self.diff_reader.diff_options)],
+            # 按路径或带diff参数获取失败时（如svn版本过旧）回退为不带额外参数的完整diff
+            can_fallback=targets is not None or bool(self.diff_reader.diff_options),
+            fallback_commands=[self._build_svn_command(build_diff_commands(self.repo_url, revision)[0])],
+            fallback_options=diff_cache_options(
+                self.repo_url, self.diff_reader.cache_options(include_diff_options=False))
+        )
+        if copy_commit and targets is not None:
+            # 复制提交的完整diff会下载整个复制的目录树，改为逐个文件diff
+            request.fallback_commands = [self._build_svn_command(args)
+                                         for args in build_file_diff_commands(self.repo_url, revision, targets)]
+            request.fallback_options = diff_cache_options(
+                self.repo_url, self.diff_reader.cache_options(include_diff_options=False) + ['per_file'],
+                targets)
+        request.cached = self.diff_cache.get(request.repo_uuid, revision, request.options)
+        return request
+    
+    def _finish_diff_request(self, request: 'DiffRequest', result) -> str:
+        """记录diff读取结果并写入缓存"""
+        revision = request.revision
+        if not result.success:
+            self.logger.error(f"获取版本 {revision} diff失败: {result.error}")
+            return ""
         
-        diff_output = self._run_svn_command(command)
-        return diff_output
+        if result.truncated:
+            self.logger.info(f"版本 {revision} 的diff超出预算，已截断 "
+                             f"(读取 {result.bytes_read:,} 字节)")
+        if result.content:
+            self.diff_cache.put(request.repo_uuid, revision, request.options, result.content)
+        return result.content
     
     def mark_commit_processed(self, revision: str):
-        """标记提交为已处理"""
-        self.processed_commits.add(revision)
-        self._save_processed_commits()
+        """标记提交为已处理，将其从待处理集合中移除"""
+        self.pending_revisions.discard(str(revision))
+        self._save_revision_state()
     
     def check_new_commits(self) -> List[SVNCommit]:
         """检查是否有新的提交"""
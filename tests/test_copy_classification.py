@@ -0,0 +1,101 @@
+"""
+复制提交分类测试
+重命名或复制后又修改了内容的文件、合并带入的文件都需要审查，只有目录复制和内容未修改的文件复制才跳过；
+带修改的复制提交按路径diff失败时逐个文件diff，不回退为下载整个目录树的完整diff
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from diff_reader import StreamingDiffReader, build_file_diff_commands
+from svn_monitor import classify_copy_commit
+
+
+def entry(path, action, kind='file', copyfrom=None, text_mods=None):
+    file_info = {'path': path, 'action': action, 'kind': kind}
+    if text_mods is not None:
+        file_info['text_mods'] = text_mods
+    if copyfrom:
+        file_info['copyfrom_path'] = copyfrom
+        file_info['copyfrom_rev'] = '10'
+    return file_info
+
+
+def paths(classification):
+    return [f['path'] for f in classification.edit_files]
+
+
+class CopyClassificationTest(unittest.TestCase):
+
+    def test_pure_move_is_skipped(self):
+        result = classify_copy_commit([
+            entry('/trunk/a.py', 'D', text_mods='false'),
+            entry('/trunk/b.py', 'A', copyfrom='/trunk/a.py', text_mods='false'),
+        ])
+        self.assertEqual(result.commit_type, 'move')
+        self.assertTrue(result.is_pure_copy)
+
+    def test_move_with_edit_is_reviewed(self):
+        result = classify_copy_commit([
+            entry('/trunk/a.py', 'D', text_mods='false'),
+            entry('/trunk/b.py', 'A', copyfrom='/trunk/a.py', text_mods='true'),
+        ])
+        self.assertEqual(result.commit_type, 'copy_with_edits')
+        self.assertEqual(paths(result), ['/trunk/b.py'])
+
+    def test_copy_with_edit_is_reviewed(self):
+        result = classify_copy_commit([
+            entry('/trunk/b.py', 'A', copyfrom='/trunk/a.py', text_mods='true'),
+        ])
+        self.assertEqual(result.commit_type, 'copy_with_edits')
+        self.assertEqual(paths(result), ['/trunk/b.py'])
+
+    def test_file_copy_without_text_mods_info_is_reviewed(self):
+        result = classify_copy_commit([entry('/trunk/b.py', 'A', copyfrom='/trunk/a.py')])
+        self.assertFalse(result.is_pure_copy)
+        self.assertEqual(paths(result), ['/trunk/b.py'])
+
+    def test_branch_creation_is_skipped(self):
+        result = classify_copy_commit([
+            entry('/branches/feature', 'A', kind='dir', copyfrom='/trunk', text_mods='false'),
+        ])
+        self.assertEqual(result.commit_type, 'branch_creation')
+        self.assertEqual(result.edit_files, [])
+
+    def test_merge_commit_reviews_added_and_replaced_files(self):
+        result = classify_copy_commit([
+            entry('/trunk', 'M', kind='dir', text_mods='false'),
+            entry('/trunk/main.c', 'M', text_mods='true'),
+            entry('/trunk/new.c', 'A', copyfrom='/branches/feature/new.c'),
+            entry('/trunk/util.c', 'R', copyfrom='/branches/feature/util.c'),
+            entry('/trunk/docs', 'A', kind='dir', copyfrom='/branches/feature/docs', text_mods='false'),
+        ])
+        self.assertEqual(result.commit_type, 'copy_with_edits')
+        self.assertEqual(paths(result), ['/trunk', '/trunk/main.c', '/trunk/new.c', '/trunk/util.c'])
+
+
+class FileDiffFallbackTest(unittest.TestCase):
+
+    def test_file_diff_commands(self):
+        commands = build_file_diff_commands('svn://host/repo/branches/b1/', '12',
+                                            ['src/a b.py', 'docs/x@2x.png@'])
+        self.assertEqual(commands, [
+            ['diff', 'svn://host/repo/branches/b1/src/a%20b.py', '-c12'],
+            ['diff', 'svn://host/repo/branches/b1/docs/x%402x.png', '-c12'],
+        ])
+
+    def test_fallback_commands_run_after_failure(self):
+        echo = [sys.executable, '-c', 'import sys; print("Index: " + sys.argv[1])']
+        result = StreamingDiffReader().read_with_fallback(
+            [[sys.executable, '-c', 'import sys; sys.exit(1)']],
+            [echo + ['a.py'], echo + ['b.py']])
+        self.assertTrue(result.success)
+        self.assertTrue(result.fallback)
+        self.assertEqual(result.content.split(), ['Index:', 'a.py', 'Index:', 'b.py'])
+
+
+if __name__ == '__main__':
+    unittest.main()
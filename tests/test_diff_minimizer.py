@@ -0,0 +1,103 @@
+"""
+diff精简测试
+只调整导入语句顺序的差异块替换为说明；普通语句调整顺序可能改变行为，必须原样保留
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from diff_minimizer import NOTE_PREFIX, minimize_diff
+
+
+def make_diff(path, removed, added, context=('int main() {',)):
+    lines = [f"Index: {path}", "=" * 67, f"--- {path}\t(revision 1)", f"+++ {path}\t(working copy)",
+             f"@@ -1,{len(context) + len(removed)} +1,{len(context) + len(added)} @@"]
+    lines += [' ' + line for line in context]
+    lines += ['-' + line for line in removed]
+    lines += ['+' + line for line in added]
+    return '\n'.join(lines) + '\n'
+
+
+class ReorderTest(unittest.TestCase):
+
+    def test_reordered_statements_are_kept(self):
+        diff = make_diff('buf.c', ['    free(buf);', '    use(buf);'], ['    use(buf);', '    free(buf);'])
+        minimized, stats = minimize_diff(diff)
+        self.assertEqual(minimized, diff)
+        self.assertEqual(stats.reordered_hunks, 0)
+
+    def test_reordered_lock_and_return_are_kept(self):
+        removed = ['    lock(m);', '    count++;', '    unlock(m);', '    return count;']
+        added = ['    lock(m);', '    return count;', '    count++;', '    unlock(m);']
+        diff = make_diff('lock.c', removed, added)
+        minimized, stats = minimize_diff(diff, min_moved_lines=3)
+        self.assertEqual(minimized, diff)
+        self.assertNotIn(NOTE_PREFIX, minimized)
+
+    def test_mixed_imports_and_statements_are_kept(self):
+        removed = ['import os', 'import sys', 'init()']
+        added = ['init()', 'import sys', 'import os']
+        minimized, stats = minimize_diff(make_diff('a.py', removed, added, context=()))
+        self.assertEqual(stats.reordered_hunks, 0)
+
+    def test_reordered_imports_are_collapsed(self):
+        cases = [
+            ('a.py', ['import sys', 'from os import path', 'import json'],
+             ['import json', 'import sys', 'from os import path']),
+            ('a.c', ['#include <stdio.h>', '#include "util.h"'], ['#include "util.h"', '#include <stdio.h>']),
+            ('a.cs', ['using System;', 'using System.IO;'], ['using System.IO;', 'using System;']),
+            ('a.js', ["const fs = require('fs');", "const path = require('path');"],
+             ["const path = require('path');", "const fs = require('fs');"]),
+            ('a.lua', ['local json = require("json")', 'local util = require("util")'],
+             ['local util = require("util")', 'local json = require("json")']),
+        ]
+        for path, removed, added in cases:
+            with self.subTest(path=path):
+                minimized, stats = minimize_diff(make_diff(path, removed, added, context=()))
+                self.assertEqual(stats.reordered_hunks, 1)
+                self.assertIn(NOTE_PREFIX + "仅调整导入语句顺序", minimized)
+
+    def test_whitespace_only_is_collapsed(self):
+        diff = make_diff('a.c', ['    use(buf,  len);'], ['\tuse(buf, len);   '])
+        minimized, stats = minimize_diff(diff)
+        self.assertEqual(stats.whitespace_hunks, 1)
+        self.assertIn(NOTE_PREFIX + "仅空白变化", minimized)
+
+    def test_removed_space_inside_string_is_kept(self):
+        diff = make_diff('a.c', ['    puts("a b");'], ['    puts("ab");'])
+        minimized, stats = minimize_diff(diff)
+        self.assertEqual(minimized, diff)
+        self.assertEqual(stats.whitespace_hunks, 0)
+
+
+class MovedBlockTest(unittest.TestCase):
+
+    def test_replaced_nested_if_block_is_kept(self):
+        removed = ['    if (a) {', '        if (b) {', '            return 0;', '        }', '    }']
+        added = ['    if (c) {', '        if (d) {', '            return 0;', '        }', '    }']
+        diff = make_diff('a.c', removed, added)
+        minimized, stats = minimize_diff(diff, min_moved_lines=3)
+        self.assertEqual(minimized, diff)
+        self.assertEqual(stats.moved_blocks, 0)
+
+    def test_trivial_lines_are_not_moved_across_files(self):
+        tail = ['            return 0;', '        }', '    }', '}']
+        diff = (make_diff('a.c', ['    check(a);'] + tail, ['    check(b);'])
+                + make_diff('b.c', ['    init(b);'], ['    init(c);'] + tail))
+        minimized, stats = minimize_diff(diff, min_moved_lines=3)
+        self.assertEqual(minimized, diff)
+        self.assertEqual(stats.moved_blocks, 0)
+
+    def test_block_moved_across_files_is_collapsed(self):
+        block = ['    lock(m);', '    count++;', '    unlock(m);', '    return count;']
+        diff = make_diff('a.c', block, []) + make_diff('b.c', [], block)
+        minimized, stats = minimize_diff(diff, min_moved_lines=3)
+        self.assertEqual(stats.moved_blocks, 1)
+        self.assertIn(NOTE_PREFIX + "4 行移动到 b.c", minimized)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+流式续写测试
+续写请求的输出从中断处接着写，第一个闭合的对象只是 detailed_comments 中的一项，
+读取流式响应时不能在此处提前结束
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import config_manager
+from review_json import extract_json_object, join_continuation, needs_continuation
+from stream_parser import StreamCollector
+
+
+REVIEW = json.dumps({
+    "overall_score": 7,
+    "summary": "整体良好",
+    "detailed_comments": [
+        {"file": "a.c", "line": "10", "type": "建议", "severity": "低", "comment": "foo"},
+        {"file": "b.c", "line": "20", "type": "警告", "severity": "中", "comment": "bar"},
+        {"file": "c.c", "line": "30", "type": "错误", "severity": "高", "comment": "baz"}
+    ],
+    "suggestions": ["补充测试"],
+    "risks": []
+}, ensure_ascii=False)
+
+# 第一次响应在第一条评论之后被截断
+CUT = REVIEW.index('{"file": "b.c"')
+
+
+def sse_lines(text, chunk_size, finish_reason):
+    """把文本拆成多个增量事件"""
+    for i in range(0, len(text), chunk_size):
+        event = {"choices": [{"delta": {"content": text[i:i + chunk_size]}}]}
+        yield 'data: ' + json.dumps(event, ensure_ascii=False)
+        yield ''
+    yield 'data: ' + json.dumps({"choices": [{"delta": {}, "finish_reason": finish_reason}]})
+    yield ''
+    yield 'data: [DONE]'
+
+
+class FakeStreamResponse:
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.encoding = None
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+def make_reviewer():
+    """以最小配置创建AIReviewer，缓存写入临时目录"""
+    workdir = tempfile.mkdtemp()
+    config_path = os.path.join(workdir, 'config.yaml')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        file.write(
+            "ai:\n"
+            "  api_base: 'http://127.0.0.1:9/v1'\n"
+            "  api_key: 'test'\n"
+            "  model: 'test'\n"
+            "  stream: true\n"
+            "data:\n"
+            f"  cache_dir: '{workdir}'\n"
+        )
+    with open(os.path.join(workdir, 'user_mapping.yaml'), 'w', encoding='utf-8') as file:
+        file.write("user_mapping: {}\n")
+    config_manager.config = config_manager.ConfigManager(config_path)
+    from ai_reviewer import AIReviewer
+    return AIReviewer()
+
+
+class StreamCollectorTest(unittest.TestCase):
+
+    def feed(self, collector, lines):
+        for line in lines:
+            if collector.feed_line(line):
+                break
+        return collector
+
+    def test_first_response_stops_when_object_closes(self):
+        lines = list(sse_lines('```json\n' + REVIEW + '\n```', 16, 'stop'))
+        collector = self.feed(StreamCollector(), lines)
+        self.assertTrue(collector.json_complete)
+        self.assertEqual(json.loads(extract_json_object(collector.content)[0]), json.loads(REVIEW))
+
+    def test_continuation_reads_until_stream_ends(self):
+        continuation = REVIEW[CUT:]
+        collector = self.feed(StreamCollector(stop_on_json_close=False),
+                              sse_lines(continuation, 7, 'stop'))
+        self.assertEqual(collector.content, continuation)
+        self.assertEqual(collector.finish_reason, 'stop')
+
+        output = join_continuation('```json\n' + REVIEW[:CUT], collector.content)
+        self.assertFalse(needs_continuation(output))
+        self.assertEqual(json.loads(output[len('```json\n'):]), json.loads(REVIEW))
+
+    def test_continuation_would_stop_at_first_comment_by_default(self):
+        """默认在第一个闭合对象处停止，对续写而言只读到一条评论"""
+        collector = self.feed(StreamCollector(), sse_lines(REVIEW[CUT:], 7, 'stop'))
+        self.assertIsNone(collector.finish_reason)
+        self.assertTrue(needs_continuation('```json\n' + REVIEW[:CUT] + collector.content))
+
+
+class ReadStreamContinuationTest(unittest.TestCase):
+
+    def test_read_stream_continuation_in_chunks(self):
+        reviewer = make_reviewer()
+        first = reviewer._read_stream(
+            FakeStreamResponse(sse_lines('```json\n' + REVIEW[:CUT], 11, 'length')), 0.0)
+        self.assertEqual(first.finish_reason, 'length')
+        self.assertTrue(needs_continuation(first.content))
+
+        response = FakeStreamResponse(sse_lines(REVIEW[CUT:] + '\n```', 9, 'stop'))
+        second = reviewer._read_stream(response, 0.0, continuing=True)
+        self.assertTrue(response.closed)
+        self.assertEqual(second.finish_reason, 'stop')
+
+        output = join_continuation(first.content, second.content)
+        self.assertFalse(needs_continuation(output))
+        result = reviewer._parse_review_response('1', output)
+        self.assertEqual(len(result.detailed_comments), 3)
+        self.assertEqual(result.overall_score, 7)
+
+
+class FakeErrorResponse:
+    status_code = 400
+    headers = {}
+    text = '{"error": {"message": "Unrecognized request argument supplied: stream_options"}}'
+
+
+class StreamUsageTest(unittest.TestCase):
+
+    def feed(self, collector, lines):
+        for line in lines:
+            if collector.feed_line(line):
+                break
+        return collector
+
+    def test_usage_event_after_json_close_is_read(self):
+        usage = {"prompt_tokens": 100, "completion_tokens": 20,
+                 "prompt_tokens_details": {"cached_tokens": 64}}
+        lines = list(sse_lines(REVIEW, 16, 'stop'))
+        lines.insert(-1, 'data: ' + json.dumps({"choices": [], "usage": usage}))
+        collector = self.feed(StreamCollector(wait_for_usage=True), lines)
+        self.assertTrue(collector.json_complete)
+        self.assertEqual(collector.usage, usage)
+
+    def test_stream_options_dropped_when_rejected(self):
+        reviewer = make_reviewer()
+        _, _, data = reviewer._build_api_request([])
+        self.assertEqual(data['stream_options'], {'include_usage': True})
+
+        self.assertIsNone(reviewer._handle_api_response(FakeErrorResponse(), 0.0))
+        self.assertFalse(reviewer.stream_usage)
+        _, _, data = reviewer._build_api_request([])
+        self.assertTrue(data['stream'])
+        self.assertNotIn('stream_options', data)
+
+
+if __name__ == '__main__':
+    unittest.main()